@@ -0,0 +1,209 @@
+import numpy as np
+from itertools import combinations
+
+class MacroCrossCorrelator(object):
+    '''
+    Rolling and lagged cross-correlations between all pairs of monthly macro series
+
+    Convention: for a pair (a, b) and lag l, a[t - l] is correlated with b[t], hence a positive lag
+    with a high correlation means that series a leads series b by l months.
+    '''
+    # name: (path to data file, column of the value), the first column of every file is YYYYMM
+    DefaultSeries = {"China_PMI":      ("economy_data/China_Composite_PMI.txt", 1),
+                     "China_PPI":      ("economy_data/China_PPI.txt", 2),
+                     "China_CPI":      ("economy_data/China_CPI.txt", 2),
+                     "China_Manu_PMI": ("economy_data/China_Sector_PMI.txt", 1),
+                     "China_NM_PMI":   ("economy_data/China_Sector_PMI.txt", 3),
+                     "EMU_PPI":        ("economy_data/EMU_PPI.txt", 1),
+                     "EMU_CPI":        ("economy_data/EMU_CPI.txt", 1)}
+
+    def __init__(self, series: dict = None):
+        '''
+        parameters:
+            series: {name: (path, column)} of monthly data files, DefaultSeries if None
+        all series are put on one common monthly grid, months missing in a series are NaN
+        '''
+        if series is None:
+            series = self.DefaultSeries
+        self.names = list(series.keys())
+        months, values = [], []
+        for path, column in series.values():
+            dat = np.loadtxt(path)
+            months.append((dat[:, 0] // 100 * 12 + dat[:, 0] % 100 - 1).astype(int))
+            values.append(dat[:, column])
+        first = min(m.min() for m in months)
+        size  = max(m.max() for m in months) - first + 1
+        self.data = np.full((len(self.names), size), np.nan)
+        for i in range(len(self.names)):
+            self.data[i, months[i] - first] = values[i]
+        month = np.arange(first, first + size)
+        self.t = month // 12 + (month % 12) / 12
+        self.pairs = np.array(list(combinations(range(len(self.names)), 2)))
+
+    def get_pair_names(self) -> list:
+        '''
+        return:
+            names of the pairs, in the order of the first axis of the correlation arrays
+        '''
+        return [(self.names[i], self.names[j]) for i, j in self.pairs]
+
+    def cross_correlate_fft(self, lags) -> np.ndarray:
+        '''
+        full-sample lagged Pearson correlations of all pairs, computed with one FFT per series
+        parameters:
+            lags: iterable of integer lags (months)
+        return:
+            (pairs x lags) array
+        '''
+        lags = np.asarray(lags, dtype = int)
+        size = self.data.shape[1]
+        valid = ~np.isnan(self.data)
+        x = np.where(valid, self.data - np.nanmean(self.data, axis = 1, keepdims = True), 0.0)
+        nfft = 2 ** int(np.ceil(np.log2(2 * size)))
+        fx  = np.fft.rfft(x, nfft, axis = 1)
+        fxx = np.fft.rfft(x * x, nfft, axis = 1)
+        fv  = np.fft.rfft(valid.astype(np.float64), nfft, axis = 1)
+        a, b = self.pairs[:, 0], self.pairs[:, 1]
+
+        def correlate(fa, fb):
+            # circular correlation: c[l] = sum_t a[t - l] * b[t], negative lags wrap to the end
+            return np.fft.irfft(fa * fb.conj(), nfft, axis = 1)[:, -lags % nfft]
+
+        # sums over the overlap of every pair at every lag
+        n   = correlate(fv[a], fv[b]).round()
+        sab = correlate(fx[a], fx[b])
+        sa,  sb  = correlate(fx[a], fv[b]),  correlate(fv[a], fx[b])
+        saa, sbb = correlate(fxx[a], fv[b]), correlate(fv[a], fxx[b])
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            corr = (n * sab - sa * sb) / np.sqrt((n * saa - sa * sa) * (n * sbb - sb * sb))
+        return np.where(n > 2, np.clip(corr, -1.0, 1.0), np.nan)
+
+    def rolling_pearson(self, window: int, lags) -> np.ndarray:
+        '''
+        rolling lagged Pearson correlations of all pairs from prefix sums
+        parameters:
+            window: number of months in the rolling window
+            lags: iterable of integer lags (months)
+        return:
+            (pairs x lags x time) array, time is the last month of the window, NaN if the window is incomplete
+        '''
+        lags = np.asarray(lags, dtype = int)
+        shifted = self._shift(lags)
+        a = shifted[self.pairs[:, 0]]
+        b = np.broadcast_to(self.data[self.pairs[:, 1]][:, None, :], a.shape)
+        valid = ~(np.isnan(a) | np.isnan(b))
+        a = np.where(valid, a, 0.0)
+        b = np.where(valid, b, 0.0)
+        # demean by pair to keep the prefix sums well conditioned
+        a -= a.sum(axis = -1, keepdims = True) / np.maximum(valid.sum(axis = -1, keepdims = True), 1)
+        b -= b.sum(axis = -1, keepdims = True) / np.maximum(valid.sum(axis = -1, keepdims = True), 1)
+        a, b = a * valid, b * valid
+        count = self._rolling_sum(valid.astype(np.float64), window)
+        sa, sb = self._rolling_sum(a, window), self._rolling_sum(b, window)
+        saa, sbb = self._rolling_sum(a * a, window), self._rolling_sum(b * b, window)
+        sab = self._rolling_sum(a * b, window)
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            corr = (window * sab - sa * sb) / np.sqrt((window * saa - sa * sa) * (window * sbb - sb * sb))
+        corr[count < window] = np.nan
+        return np.clip(corr, -1.0, 1.0)
+
+    def rolling_kendall(self, window: int, lags) -> np.ndarray:
+        '''
+        rolling lagged Kendall tau-b of all pairs
+        parameters:
+            window: number of months in the rolling window
+            lags: iterable of integer lags (months)
+        return:
+            (pairs x lags x time) array, time is the last month of the window, NaN if the window is incomplete
+        '''
+        lags = np.asarray(lags, dtype = int)
+        nseries, size = self.data.shape
+        windows = np.lib.stride_tricks.sliding_window_view(self.data, window, axis = 1)
+        complete = ~np.isnan(windows).any(axis = -1)
+        iu, ju = np.triu_indices(window, k = 1)
+        # sign of every ordered pair of observations in every window: (series x windows x pairs of obs.)
+        sign = np.sign(np.nan_to_num(windows[..., ju] - windows[..., iu])).astype(np.float32)
+        untied = np.abs(sign).sum(axis = -1)
+        nwin = sign.shape[1]
+        a, b = self.pairs[:, 0], self.pairs[:, 1]
+        tau = np.full((len(self.pairs), len(lags), size), np.nan)
+        for k in range(len(lags)):
+            lag = lags[k]
+            kb = np.arange(max(lag, 0), min(nwin, nwin + lag)) # window of b, the window of a ends lag months earlier
+            if kb.size == 0:
+                continue
+            ka = kb - lag
+            # all series against all series in one batched product: (windows x series x series)
+            concordance = np.matmul(sign[:, ka].transpose(1, 0, 2), sign[:, kb].transpose(1, 2, 0))[:, a, b].T
+            with np.errstate(invalid = "ignore", divide = "ignore"):
+                t = concordance / np.sqrt(untied[a][:, ka] * untied[b][:, kb])
+            t[~(complete[a][:, ka] & complete[b][:, kb])] = np.nan
+            tau[:, k, kb + window - 1] = t
+        return tau
+
+    def rolling_cross_correlation(self, windows, lags, method: str = "pearson") -> dict:
+        '''
+        parameters:
+            windows: iterable of window lengths (months)
+            lags: iterable of integer lags (months)
+            method: "pearson" or "kendall"
+        return:
+            {window: (pairs x lags x time) array}
+        '''
+        if method == "pearson":
+            correlate = self.rolling_pearson
+        elif method == "kendall":
+            correlate = self.rolling_kendall
+        else:
+            raise ValueError(f"unsupported method: {method}")
+        return {window: correlate(window, lags) for window in windows}
+
+    def lead_lag(self, correlation: np.ndarray, lags) -> tuple[np.ndarray, np.ndarray]:
+        '''
+        parameters:
+            correlation: (pairs x lags x time) array from rolling_pearson or rolling_kendall
+            lags: the lags used to compute correlation
+        return:
+            (pairs x time) arrays of the lag with the largest absolute correlation and that correlation
+        '''
+        lags = np.asarray(lags, dtype = int)
+        filled = np.nan_to_num(np.abs(correlation), nan = -1.0)
+        best = filled.argmax(axis = 1)
+        corr = np.take_along_axis(correlation, best[:, None, :], axis = 1)[:, 0, :]
+        lag = np.where(np.isnan(corr), 0, lags[best])
+        return lag, corr
+
+    def _shift(self, lags: np.ndarray) -> np.ndarray:
+        '''
+        return:
+            (series x lags x time) array of x[t - lag], NaN outside of the data
+        '''
+        nseries, size = self.data.shape
+        src = np.arange(size)[None, :] - lags[:, None]
+        inside = (src >= 0) & (src < size)
+        shifted = self.data[:, np.clip(src, 0, size - 1)]
+        shifted[:, ~inside] = np.nan
+        return shifted
+
+    @staticmethod
+    def _rolling_sum(x: np.ndarray, window: int) -> np.ndarray:
+        csum = np.cumsum(x, axis = -1)
+        csum[..., window:] = csum[..., window:] - csum[..., :-window]
+        return csum
+
+if __name__ == "__main__":
+    lags = np.arange(-12, 13)
+    mcc = MacroCrossCorrelator()
+    print("full-sample lag of max |corr|:")
+    full = mcc.cross_correlate_fft(lags)
+    for (a, b), c in zip(mcc.get_pair_names(), full):
+        if np.isnan(c).all():
+            continue
+        k = np.nanargmax(np.abs(c))
+        print(f"{a:>15s} -> {b:<15s} lag = {lags[k]:3d}, corr = {c[k]: .2f}")
+    for method in ["pearson", "kendall"]:
+        corr = mcc.rolling_cross_correlation([24, 36], lags, method = method)
+        lag, c = mcc.lead_lag(corr[36], lags)
+        print(f"latest 36-month {method} lead/lag:")
+        for (a, b), l, r in zip(mcc.get_pair_names(), lag[:, -1], c[:, -1]):
+            print(f"{a:>15s} -> {b:<15s} lag = {l:3d}, corr = {r: .2f}")
@@ -1,12 +1,21 @@
 import pandas as pd
 from security_tools.bond import BondETFDataAcquisitor
 from security_tools.bond import BondETFDataAnalyzer
+from security_tools.bond import BondETFDurationEstimator
 
 
+def estimate_bondETF_durations(codes: list[str], startDate: str, endDate: str, inDir: str,
+		                       tenors: list[str] = ["1Y", "5Y", "10Y", "30Y"], window: int = 120) -> BondETFDurationEstimator:
+	# 以收益率曲线各关键期限的收益率变化滚动回归各ETF的日涨跌幅，得到关键期限久期及有效久期
+	dataAcquired = [BondETFDataAcquisitor(code, startDate, endDate, 1, inDir) for code in codes]
+	return BondETFDurationEstimator(dataAcquired, BondETFDataAnalyzer.get_yield_curves(), tenors, window)
+
 def analyze_bondETF_data(code: str, startDate: str, endDate: str, inDir: str,
-		                 duration: str, benchDuration: list[str], yieldCurves: str = None):
+		                 duration: str, benchDuration: list[str], yieldCurves: str = None,
+		                 durationEstimator: BondETFDurationEstimator = None):
 	dataAcquisitor = BondETFDataAcquisitor(code, startDate, endDate, 1, inDir)
-	dataAnalyzer = BondETFDataAnalyzer(dataAcquisitor, duration, benchDuration, yieldCurves = yieldCurves)
+	dataAnalyzer = BondETFDataAnalyzer(dataAcquisitor, duration, benchDuration, yieldCurves = yieldCurves,
+	                                   durationEstimator = durationEstimator)
 	dataAnalyzer.correlate_price_with_yield()
 	url   = dataAnalyzer.get_data_acquired().get_quotation_url()
 	return url
@@ -27,11 +36,18 @@ if __name__ == "__main__":
 	# ETF代码
 	codes = ["511090", "511260", "511010"]
 	names = ["30年国债ETF", "10年国债ETF", "5年国债ETF"]
-	# 久期（暂时为单一偿还期限）
-	durations = ["30Y", "10Y", "5Y"]
+	# 基准期限
 	benchDurations = [["7Y", "10Y"], ["30Y"], ["30Y"]]
+	# 滚动估计久期的关键期限及窗口（交易日）
+	tenors = ["1Y", "5Y", "10Y", "30Y"]
+	window = 120
 
 	BondETFDataAnalyzer.set_yield_curves(yieldCurves)
-	for code, name, duration, benchDuration  in zip(codes, names, durations, benchDurations):
+	# 久期由经验回归估计，利差以按关键期限久期加权的有效收益率计算
+	durationEstimator = estimate_bondETF_durations(codes, startDate, endDate, inDir, tenors, window)
+	print("有效久期：")
+	print(durationEstimator.get_durations().dropna(how = "all").tail())
+	for code, name, benchDuration  in zip(codes, names, benchDurations):
 		print(f"正在分析{code}-{name}......")
-		analyze_bondETF_data(code, startDate, endDate, inDir, duration, benchDuration)
+		print(durationEstimator.get_key_rate_durations(code).dropna().tail(1))
+		analyze_bondETF_data(code, startDate, endDate, inDir, "有效", benchDuration, durationEstimator = durationEstimator)
@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+import time
+
+# heavy dependencies that should only be loaded by the code paths that use them
+Heavy = ["matplotlib", "mplfinance", "scipy.signal", "scipy.stats", "requests", "pandas_market_calendars"]
+Statements = {
+	"acquisition worker": "from security_tools.stock_trend import DataAcquisitor; DataAcquisitor",
+	"analysis worker":    "from security_tools.stock_trend import DataAcquisitor, DataAnalyzer; DataAnalyzer",
+	"bond analysis":      "from security_tools.bond import BondETFDataAcquisitor, BondETFDataAnalyzer; BondETFDataAnalyzer",
+	"numpy + pandas":     "import numpy, pandas",
+	"all heavy (eager)":  "import numpy, pandas, matplotlib.pyplot, mplfinance, scipy.signal, scipy.stats, requests, pandas_market_calendars",
+}
+
+def measure(statement: str, repeat: int) -> tuple[float, str]:
+	'''
+	return:
+		best wall time of a cold interpreter running statement, heavy modules it loaded
+	'''
+	report = "; import sys; print(','.join(m for m in %r if m in sys.modules))" % Heavy
+	times = []
+	for i in range(repeat):
+		start = time.perf_counter()
+		loaded = subprocess.run([sys.executable, "-c", statement + report], capture_output = True, text = True, check = True,
+		                        cwd = os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+		times.append(time.perf_counter() - start)
+	return min(times), loaded
+
+if __name__ == "__main__":
+	repeat = int(sys.argv[1]) if len(sys.argv) >= 2 and sys.argv[1].isdigit() else 5
+	print(f"{'import':<20s} {'best [s]':>8s}  heavy modules loaded")
+	for name, statement in Statements.items():
+		t, loaded = measure(statement, repeat)
+		print(f"{name:<20s} {t:8.3f}  {loaded or '-'}")
@@ -0,0 +1,32 @@
+import pandas as pd
+from security_tools.portfolio import PortfolioValuator
+
+
+def valuate_portfolio(holdingsPath: str, startDate: str, endDate: str, stockDir: str, etfDir: str, yieldCurves: str,
+		              navPath: str = None) -> pd.Series:
+	# 读取持仓表及本地行情、收益率曲线，按日重估全部持仓
+	valuator = PortfolioValuator.from_csv(holdingsPath, startDate, endDate, stockDir, etfDir, yieldCurves)
+	nav = valuator.get_nav(byType = True)
+	nav["NAV"] = nav.sum(axis = 1)
+	print(valuator.value_on(endDate))
+	print(nav.tail())
+	# 保存历史净值
+	if navPath is not None:
+		nav.to_csv(navPath, encoding = "utf-8-sig")
+	return nav["NAV"]
+
+if __name__ == "__main__":
+	# 开始日期
+	startDate = "20230616"
+	# 结束日期
+	endDate   = pd.to_datetime("today").strftime("%Y%m%d")
+	# 持仓表：type, code, quantity, entry, exit, par, coupon, maturity, spread, underlying, barrier, ratio
+	holdingsPath = "portfolio/holdings.csv"
+	# 输入
+	stockDir    = "stock_price_data"
+	etfDir      = "bondETF_price_data"
+	yieldCurves = "yield_curves/CGBYieldCurve.csv"
+	# 输出
+	navPath     = "portfolio/nav.csv"
+
+	valuate_portfolio(holdingsPath, startDate, endDate, stockDir, etfDir, yieldCurves, navPath)
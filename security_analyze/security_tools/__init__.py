@@ -1 +1 @@
-__all__ = ["stock_trend", "bond"]
+__all__ = ["stock_trend", "bond", "universe", "portfolio"]
@@ -0,0 +1,31 @@
+import importlib
+import sys
+import types
+
+
+class LazyPackage(types.ModuleType):
+    '''
+    Package of classes, each defined in a module of the same name, imported on first access
+
+    Heavy dependencies of a module are then only loaded by the processes that use its class.
+    '''
+
+    def __getattr__(self, name):
+        if name in self.__all__:
+            importlib.import_module(f"{self.__name__}.{name}")
+            return self.__dict__[name]
+        raise AttributeError(f"module {self.__name__!r} has no attribute {name!r}")
+
+    def __setattr__(self, name, value):
+        # the import system binds a loaded submodule on its package, bind the class of the same name instead
+        if isinstance(value, types.ModuleType) and name in self.__all__ and value.__name__ == f"{self.__name__}.{name}":
+            value = getattr(value, name)
+        super().__setattr__(name, value)
+
+
+def make_lazy(name: str):
+    '''
+    param:
+        name: __name__ of the package, its __all__ lists the classes
+    '''
+    sys.modules[name].__class__ = LazyPackage
@@ -1,8 +1,7 @@
 import numpy as np
-from scipy.stats import kendalltau
-import matplotlib.pyplot as plt
 import pandas as pd
 from .BondETFDataAcquisitor import BondETFDataAcquisitor
+from .BondETFDurationEstimator import BondETFDurationEstimator
 
 
 class BondETFDataAnalyzer(object):
@@ -11,13 +10,15 @@ class BondETFDataAnalyzer(object):
 	'''
 	_yieldCurves = pd.DataFrame()
 
-	def __init__(self, dataAcquired: BondETFDataAcquisitor, duration: str, benchDuration: list[str], yieldCurves: str = None):
+	def __init__(self, dataAcquired: BondETFDataAcquisitor, duration: str, benchDuration: list[str], yieldCurves: str = None,
+	             durationEstimator: BondETFDurationEstimator = None):
 		'''
 		param:
 			dataAcquired: BondETFDataAcquisitor containing the stock data
-			duration: duration of bond ETF
+			duration: duration of bond ETF, only the name of the estimated yield with durationEstimator
 			benchDuration: a list of benchmark duration(s)
 			yieldCurves: path to yield curve data
+			durationEstimator: BondETFDurationEstimator fitted on the ETF, its effective yield replaces the yield of duration
 		'''
 		self._dataAcquired  = dataAcquired
 		self._duration      = duration
@@ -26,7 +27,12 @@ class BondETFDataAnalyzer(object):
 		if self._yieldCurves.empty:
 			self.set_yield_curves(yieldCurves)
 		self._closingPrices = self.get_closing_price_history()
-		self._df = self._closingPrices.join(self._yieldCurves[[duration] + benchDuration])
+		if durationEstimator is None:
+			curves = self._yieldCurves[[duration] + benchDuration]
+		else:
+			effectiveYield = durationEstimator.get_effective_yield(dataAcquired.get_code()).rename(duration)
+			curves = self._yieldCurves[benchDuration].join(effectiveYield, how = "inner")
+		self._df = self._closingPrices.join(curves)
 		for d in benchDuration:
 			sd = "Spread_" + d
 			self._df[sd] = self._df[duration] - self._df[d]
@@ -64,9 +70,12 @@ class BondETFDataAnalyzer(object):
 		return:
 			day-K data with closing price and change as pandas DataFrame
 		"""
-		return self._dataAcquired.get_day_k().loc[:, ["Close", "涨跌幅"]]
+		# column selection works on both DataFrame and KLineBars
+		return self._dataAcquired.get_day_k()[["Close", "涨跌幅"]]
 
 	def correlate_price_with_yield(self):
+		from scipy.stats import kendalltau
+		import matplotlib.pyplot as plt
 		fig, ax = plt.subplots()
 		pArr = self._df["Close"].to_numpy(copy = True)
 		pArr = pArr.astype(np.float64)
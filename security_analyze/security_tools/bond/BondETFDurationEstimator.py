@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+from .BondETFDataAcquisitor import BondETFDataAcquisitor
+
+
+class BondETFDurationEstimator(object):
+	'''
+	Empirical key-rate durations of bond ETFs, estimated over rolling windows
+
+	The daily return of each ETF, compounded from 涨跌幅 between the dates of the yield curves, is
+	regressed on the changes of the yields of the key tenors:
+		r = a - sum_k KRD_k * dy_k
+	The normal equations of every window are differences of cumulative sums of the cross products,
+	so all ETFs and dates are fitted in one pass and one batched solve. A small ridge relative to the
+	scale of the yield changes keeps the collinear tenors stable. The effective duration is the sum
+	of the key-rate durations.
+	'''
+
+	def __init__(self, dataAcquired: list[BondETFDataAcquisitor], yieldCurves: pd.DataFrame, tenors: list[str] = ["1Y", "5Y", "10Y", "30Y"],
+	             window: int = 120, minPeriods: int = None, ridge: float = 0.05):
+		'''
+		param:
+			dataAcquired: BondETFDataAcquisitor of each ETF
+			yieldCurves: yields in percent indexed by date, one column per tenor
+			tenors: key tenors of the regression
+			window: number of days of the rolling window
+			minPeriods: minimum number of returns of an ETF in the window, 2/3 of the window if None
+			ridge: ridge penalty relative to the mean variance of the yield changes in the window
+		'''
+		self._codes   = pd.Index([acquired.get_code() for acquired in dataAcquired])
+		self._tenors  = list(tenors)
+		self._window  = window
+		self._minPeriods = 2 * window // 3 if minPeriods is None else minPeriods
+		self._ridge   = ridge
+		yields = yieldCurves[self._tenors].dropna()
+		self._yields = yields
+		# growth of 1 since the first day of each ETF, so returns over days without yields compound
+		growth = pd.DataFrame({acquired.get_code(): (1 + acquired.get_day_k()["涨跌幅"].astype(np.float64) / 100).cumprod()
+		                       for acquired in dataAcquired}).reindex(yields.index)
+		# returns between consecutive dates of the yield curves, where the ETF traded on both
+		returns = (growth / growth.shift(1) - 1).to_numpy()[1:]
+		self._dates   = yields.index[1:]
+		self._changes = np.diff(yields.to_numpy(dtype = np.float64), axis = 0) / 100
+		self._valid   = np.isfinite(returns)
+		self._returns = np.where(self._valid, returns, 0.0)
+		self._fit()
+
+	def _fit(self):
+		T, E, K = len(self._dates), len(self._codes), len(self._tenors)
+		X = np.concatenate([np.ones((T, 1)), self._changes], axis = 1)
+		w = self._valid.astype(np.float64)
+		rolling = lambda a: a - np.concatenate([np.zeros((min(self._window, len(a)),) + a.shape[1:]), a[:-self._window]]) if len(a) else a
+		# (T x E x K+1 x K+1) and (T x E x K+1) windowed sums of the cross products, ETFs weighted by their trading days
+		XtX = rolling(np.cumsum(np.einsum("te,ti,tj->teij", w, X, X), axis = 0))
+		Xty = rolling(np.cumsum(np.einsum("te,ti,te->tei", w, X, self._returns), axis = 0))
+		count = rolling(np.cumsum(w, axis = 0))
+		penalty = self._ridge * np.trace(XtX[..., 1:, 1:], axis1 = 2, axis2 = 3) / K
+		XtX[..., 1:, 1:] += penalty[..., None, None] * np.eye(K)
+		enough = (count >= self._minPeriods) & (np.arange(T) >= self._window - 1)[:, None]
+		beta = np.full((T, E, K + 1), np.nan)
+		beta[enough] = np.linalg.solve(XtX[enough], Xty[enough][..., None])[..., 0]
+		self._KRD = -beta[..., 1:]
+
+	def get_dates(self) -> pd.DatetimeIndex:
+		return self._dates
+
+	def get_key_rate_durations(self, code: str) -> pd.DataFrame:
+		'''
+		return:
+			key-rate durations of the ETF indexed by date, one column per tenor, NaN without enough data
+		'''
+		return pd.DataFrame(self._KRD[:, self._codes.get_loc(code)], index = self._dates, columns = self._tenors)
+
+	def get_durations(self) -> pd.DataFrame:
+		'''
+		return:
+			(dates x codes) effective durations
+		'''
+		return pd.DataFrame(self._KRD.sum(axis = 2), index = self._dates, columns = self._codes)
+
+	def get_effective_yield(self, code: str) -> pd.Series:
+		'''
+		yield of the ETF's exposure: the yields of the tenors weighted by its key-rate durations,
+		used instead of the yield of a single tenor
+		return:
+			yield in percent indexed by date
+		'''
+		KRD = self._KRD[:, self._codes.get_loc(code)]
+		with np.errstate(invalid = "ignore", divide = "ignore"):
+			weights = KRD / KRD.sum(axis = 1, keepdims = True)
+		# NaN propagates from the windows without enough data
+		return pd.Series((weights * self._yields.to_numpy(dtype = np.float64)[1:]).sum(axis = 1), index = self._dates, name = code)
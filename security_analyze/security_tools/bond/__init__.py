@@ -1,4 +1,5 @@
-__all__ = ["BondETFDataAcquisitor", "BondETFDataAnalyzer"]
+__all__ = ["BondETFDataAcquisitor", "BondETFDataAnalyzer", "BondETFDurationEstimator"]
 
-from .BondETFDataAcquisitor import BondETFDataAcquisitor
-from .BondETFDataAnalyzer import BondETFDataAnalyzer
+# classes are imported on first access
+from .._lazy import make_lazy
+make_lazy(__name__)
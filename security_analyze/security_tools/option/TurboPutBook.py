@@ -0,0 +1,148 @@
+import numpy as np
+import pandas as pd
+from scipy.special import ndtr
+from .TurboPutOption import TurboPutOption
+
+class TurboPutBook(object):
+    '''
+    Ein Buch von Turbo-Put-Optionsscheinen, alle Positionen werden als Arrays gehalten und
+    bei jeder Kursaenderung der Basiswerte gemeinsam neu bewertet
+    '''
+
+    def __init__(self, codes: list, barrier, basiswert, bezugsverhaeltnis = 10):
+        '''
+        Input:
+            codes: Namen oder Codes der Aktien (Basiswerte), eins pro Optionsschein
+            barrier: die Knock-out-Barrieren, fuer Turbo sind sie gleich dem Strike
+            basiswert: die aktuellen Kurse der Aktien, eins pro Optionsschein
+            bezugsverhaeltnis: die Bezugsverhaeltnisse, normalerweise gleich 10
+        '''
+        self._codes = np.asarray(codes, dtype = str)
+        # Basiswerte werden nur einmal gespeichert, jeder Optionsschein verweist per Index darauf
+        self._basiswertCodes, self._basiswertIndex = np.unique(self._codes, return_inverse = True)
+        self._barrier = np.asarray(barrier, dtype = np.float64)
+        self._bezugsverhaeltnis = np.broadcast_to(np.asarray(bezugsverhaeltnis, dtype = np.float64), self._barrier.shape)
+        self._kurse = np.full(self._basiswertCodes.shape, np.nan)
+        self._kurse[self._basiswertIndex] = basiswert
+        self._ausgeknockt = np.zeros(self._barrier.shape, dtype = bool)
+        self._bewerten()
+
+    @classmethod
+    def from_options(cls, options: list[TurboPutOption]):
+        '''
+        Input:
+            options: eine Liste von TurboPutOption
+        '''
+        return cls([o._code for o in options], [o._barrier for o in options],
+                   [o._basiswert for o in options], [o._bezugsverhaeltnis for o in options])
+
+    def aktualisieren(self, kurse: dict):
+        '''
+        Neubewertung aller Optionsscheine nach neuen Kursen der Basiswerte
+            input:
+                kurse: {Code des Basiswerts: aktueller Kurs}, andere Basiswerte bleiben unveraendert
+        '''
+        index = np.searchsorted(self._basiswertCodes, list(kurse.keys()))
+        known = index < len(self._basiswertCodes)
+        known[known] = self._basiswertCodes[index[known]] == np.asarray(list(kurse.keys()), dtype = str)[known]
+        self._kurse[index[known]] = np.asarray(list(kurse.values()), dtype = np.float64)[known]
+        self._bewerten()
+
+    def _bewerten(self):
+        self._basiswert = self._kurse[self._basiswertIndex]
+        # ein Turbo-Put verfaellt, sobald der Basiswert die Barriere erreicht
+        self._ausgeknockt |= self._basiswert >= self._barrier
+        abstand = np.where(self._ausgeknockt, np.nan, self._barrier - self._basiswert)
+        self._optionskurs = np.nan_to_num(abstand) / self._bezugsverhaeltnis
+        self._hebel = self._basiswert / abstand # Hebel ist dynamisch nach dem Aktienkurs
+
+    def info(self) -> pd.DataFrame:
+        '''
+        output:
+            Optionskurs, Hebel und Abstand zur Barriere (in Prozent des Basiswerts) aller Optionsscheine
+        '''
+        return pd.DataFrame({"Optionskurs": self._optionskurs.round(2),
+                             "Hebel": self._hebel.round(2),
+                             "Abstand": (100 * (self._barrier / self._basiswert - 1)).round(2),
+                             "Ausgeknockt": self._ausgeknockt},
+                            index = pd.Index(np.char.add(np.char.add(self._codes, '_'), self._barrier.astype(str)), name = "Code"))
+
+    def warnen_vorm_rueckgang(self, schwelle: list = [5., 10.]) -> np.ndarray:
+        '''
+        Warnung vorm deutlichen Rueckgang des Optionkurs
+            input:
+                schwelle: eine Liste der Prozente, um die sich der Basiswert steigert
+            output:
+                warnung: (Optionsscheine x Schwellen) Array der Prozente, um die sich der Optionkurs senkt
+        '''
+        return np.round(self._hebel[:, None] * np.asarray(schwelle, dtype = np.float64), 2)
+
+    def nahe_barrier(self, schwelle: np.float64 = 5.) -> np.ndarray:
+        '''
+            input:
+                schwelle: Abstand zur Barriere in Prozent des Basiswerts
+            output:
+                Maske der Optionsscheine, die naeher als schwelle an der Barriere oder schon ausgeknockt sind
+        '''
+        return self._ausgeknockt | (100 * (self._barrier / self._basiswert - 1) < schwelle)
+
+    def _volatilitaet(self, sigma) -> np.ndarray:
+        if isinstance(sigma, dict):
+            sigma = np.array([sigma[c] for c in self._basiswertCodes], dtype = np.float64)[self._basiswertIndex]
+        return np.broadcast_to(np.asarray(sigma, dtype = np.float64), self._barrier.shape)
+
+    def knockout_wahrscheinlichkeit(self, sigma, horizont: np.float64, drift = 0.0) -> np.ndarray:
+        '''
+        Wahrscheinlichkeit, dass der Basiswert die Barriere innerhalb des Horizonts erreicht,
+        geschlossene Formel der ersten Passage einer geometrischen Brownschen Bewegung
+            input:
+                sigma: annualisierte Volatilitaet, Skalar, Array pro Optionsschein oder {Code: Volatilitaet}
+                horizont: Horizont in Jahren
+                drift: annualisierte Drift des Basiswerts
+            output:
+                Wahrscheinlichkeiten pro Optionsschein
+        '''
+        sigma = self._volatilitaet(sigma)
+        b = np.log(self._barrier / self._basiswert)
+        nu = drift - 0.5 * sigma**2
+        st = sigma * np.sqrt(horizont)
+        with np.errstate(over = "ignore", invalid = "ignore"):
+            p = ndtr((-b + nu * horizont) / st) + np.exp(2 * nu * b / sigma**2) * ndtr((-b - nu * horizont) / st)
+        return np.where(self._ausgeknockt, 1.0, np.clip(p, 0.0, 1.0))
+
+    def knockout_wahrscheinlichkeit_simuliert(self, sigma, horizont: np.float64, drift = 0.0,
+                                              pfade: int = 10000, schritte: int = 50, seed = None) -> np.ndarray:
+        '''
+        Monte-Carlo-Schaetzung der Knock-out-Wahrscheinlichkeit mit Brownscher-Bruecke-Korrektur
+        zwischen den Zeitschritten, Pfade werden pro Basiswert einmal simuliert
+            input:
+                sigma, horizont, drift: wie bei knockout_wahrscheinlichkeit
+                pfade: Anzahl der Pfade pro Basiswert
+                schritte: Anzahl der Zeitschritte
+                seed: Seed des Zufallsgenerators
+            output:
+                Wahrscheinlichkeiten pro Optionsschein
+        '''
+        sigma = self._volatilitaet(sigma)
+        # eine Volatilitaet pro Basiswert
+        sigmaBasiswert = np.zeros(self._basiswertCodes.shape)
+        sigmaBasiswert[self._basiswertIndex] = sigma
+        dt = horizont / schritte
+        rng = np.random.default_rng(seed)
+        z = rng.standard_normal((len(self._basiswertCodes), pfade, schritte))
+        x = np.cumsum((drift - 0.5 * sigmaBasiswert[:, None, None]**2) * dt
+                      + sigmaBasiswert[:, None, None] * np.sqrt(dt) * z, axis = -1)
+        x = np.concatenate([np.zeros(x.shape[:-1] + (1,)), x], axis = -1)
+        p = np.empty(self._barrier.shape)
+        for u in range(len(self._basiswertCodes)):
+            member = np.flatnonzero(self._basiswertIndex == u)
+            if member.size == 0:
+                continue
+            # Abstand zur Barriere im Log-Raum: (Optionsscheine x Pfade x Zeitpunkte)
+            d = np.log(self._barrier[member] / self._basiswert[member])[:, None, None] - x[u][None]
+            crossed = (d <= 0).any(axis = -1)
+            bridge = np.exp(-2 * np.maximum(d[..., :-1], 0) * np.maximum(d[..., 1:], 0) / (sigma[member, None, None]**2 * dt))
+            survival = np.where(crossed, 0.0, np.prod(1.0 - bridge, axis = -1))
+            p[member] = 1.0 - survival.mean(axis = -1)
+        return np.where(self._ausgeknockt, 1.0, p)
+
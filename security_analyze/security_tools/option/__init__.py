@@ -1,3 +1,4 @@
-__all__ = ["TurboPutOption"]
+__all__ = ["TurboPutOption", "TurboPutBook"]
 
 from .TurboPutOption import TurboPutOption
+from .TurboPutBook import TurboPutBook
@@ -0,0 +1,212 @@
+import numpy as np
+import pandas as pd
+from ..stock_trend.DataAcquisitor import DataAcquisitor
+from ..stock_trend.PricePanel import PricePanel
+from ..bond.BondETFDataAcquisitor import BondETFDataAcquisitor
+
+
+class PortfolioValuator(object):
+    '''
+    Daily valuation of a portfolio of stocks, ETFs, fixed-rate bonds, turbo puts and cash
+
+    The holdings table has one row per position with the columns
+        type:       stock, etf, bond, turbo or cash
+        code:       code of the security, free name of bonds, turbos and cash
+        quantity:   number of shares, bonds or warrants, amount of cash
+        entry/exit: position held on the dates in [entry, exit), always if empty
+        par, coupon, maturity, spread:  bonds, annual coupon rate and spread over the curve in percent
+        underlying, barrier, ratio:     turbo puts, code of the underlying in the prices
+    Positions of a type are valued together as (dates x positions) arrays: stocks and ETFs at the
+    last close, bonds by discounting their remaining annual coupons at the yield curve interpolated
+    at their term, the formula of BondFixedRatePresentValueCalculator extended to fractional terms,
+    turbo puts at (barrier - close) / ratio until the high of the underlying reaches the barrier
+    while held. The NAV replays the positions over the dates of the prices.
+    '''
+
+    Types = ["stock", "etf", "bond", "turbo", "cash"]
+    Tenors = {"3M": 0.25, "6M": 0.5, "1Y": 1, "3Y": 3, "5Y": 5, "7Y": 7, "10Y": 10, "30Y": 30}
+
+    def __init__(self, holdings: pd.DataFrame, prices: PricePanel, yieldCurves: pd.DataFrame = None):
+        '''
+        param:
+            holdings: table of the positions, see the class
+            prices: day-K of the stocks, ETFs and underlyings of the turbo puts
+            yieldCurves: yields in percent indexed by date, one column per tenor of Tenors, needed for bonds
+        '''
+        holdings = holdings.reset_index(drop = True)
+        unknown = set(holdings["type"]) - set(self.Types)
+        if unknown:
+            raise ValueError(f"unknown position types {sorted(unknown)}")
+        self._holdings = holdings
+        self._prices   = prices
+        self._dates    = prices.get_dates()
+        self._yieldCurves = yieldCurves
+        self._values   = None
+
+    @classmethod
+    def from_csv(cls, holdingsPath: str, beg: str, end: str, stockDir: str, etfDir: str = None, yieldCurves: str = None):
+        '''
+        param:
+            holdingsPath: CSV file of the holdings table
+            beg, end: date range, e.g. 20200101
+            stockDir, etfDir: directories of the stored K-line data of stocks and ETFs
+            yieldCurves: CSV file of the yield curves
+        '''
+        holdings = pd.read_csv(holdingsPath, dtype = {"code": str, "underlying": str})
+        for column in holdings.columns.intersection(["entry", "exit", "maturity"]):
+            holdings[column] = pd.to_datetime(holdings[column])
+        types = holdings["type"]
+        codes = dict.fromkeys(holdings.loc[types == "stock", "code"].tolist() + holdings.loc[types == "turbo", "underlying"].tolist(), (DataAcquisitor, stockDir))
+        codes.update(dict.fromkeys(holdings.loc[types == "etf", "code"].tolist(), (BondETFDataAcquisitor, etfDir)))
+        days = {}
+        for code, (acquisitor, inDir) in codes.items():
+            dayK = acquisitor(code, beg, end, 1, inDir = inDir, columns = PricePanel.Fields, compact = True).get_day_k()
+            if len(dayK) and not dayK.index[0] == pd.Timestamp.min:
+                days[code] = dayK
+        if yieldCurves is not None:
+            yieldCurves = pd.read_csv(yieldCurves, parse_dates = [0], index_col = 0, dtype = np.float64)
+        return cls(holdings, PricePanel.from_frames(days), yieldCurves)
+
+    def get_dates(self) -> pd.DatetimeIndex:
+        return self._dates
+
+    def get_holdings(self) -> pd.DataFrame:
+        return self._holdings
+
+    def _get_column(self, name: str, rows: np.ndarray, default = np.nan) -> np.ndarray:
+        if name not in self._holdings:
+            return np.full(len(rows), default)
+        return self._holdings[name].to_numpy()[rows]
+
+    def _get_held(self) -> np.ndarray:
+        '''
+        return:
+            (dates x positions) boolean array of the dates each position is held
+        '''
+        dates = self._dates.to_numpy()
+        rows = np.arange(len(self._holdings))
+        entry = pd.to_datetime(self._get_column("entry", rows, pd.NaT)).to_numpy()
+        exit  = pd.to_datetime(self._get_column("exit", rows, pd.NaT)).to_numpy()
+        held = np.ones((len(dates), len(rows)), dtype = bool)
+        held &= np.isnat(entry) | (dates[:, None] >= entry)
+        held &= np.isnat(exit) | (dates[:, None] < exit)
+        return held
+
+    def _get_prices(self, codes: np.ndarray, field: str = "Close", carry: bool = True) -> np.ndarray:
+        '''
+        return:
+            (dates x codes) prices, the last close over suspensions if carry, NaN for codes without data
+        '''
+        columns = self._prices.get_codes().get_indexer(codes)
+        prices = self._prices.get_prices(field)
+        if carry:
+            prices = pd.DataFrame(prices).ffill().to_numpy()
+        return np.where(columns >= 0, prices[:, columns], np.nan)
+
+    def _get_yields(self, terms: np.ndarray) -> np.ndarray:
+        '''
+        param:
+            terms: (dates x bonds) years to maturity
+        return:
+            (dates x bonds) yields in percent interpolated linearly in the term, flat beyond the tenors
+        '''
+        if self._yieldCurves is None:
+            raise ValueError("bonds need yield curves")
+        tenors = [tenor for tenor in self.Tenors if tenor in self._yieldCurves]
+        grid = np.array([self.Tenors[tenor] for tenor in tenors], dtype = np.float64)
+        # curves of the last publication day up to each date
+        curves = self._yieldCurves[tenors].reindex(self._dates.union(self._yieldCurves.index)).ffill().reindex(self._dates).to_numpy(dtype = np.float64)
+        terms = np.clip(terms, grid[0], grid[-1])
+        upper = np.clip(np.searchsorted(grid, terms, side = "left"), 1, len(grid) - 1)
+        weight = (terms - grid[upper - 1]) / (grid[upper] - grid[upper - 1])
+        rows = np.arange(len(self._dates))[:, None]
+        return curves[rows, upper - 1] * (1 - weight) + curves[rows, upper] * weight
+
+    def _value_bonds(self, rows: np.ndarray) -> np.ndarray:
+        '''
+        return:
+            (dates x bonds) present values of one bond, par once matured
+        '''
+        par = np.nan_to_num(self._get_column("par", rows, 100.0).astype(np.float64), nan = 100.0)
+        coupon = np.nan_to_num(self._get_column("coupon", rows, 0.0).astype(np.float64)) / 100
+        spread = np.nan_to_num(self._get_column("spread", rows, 0.0).astype(np.float64)) / 100
+        maturity = pd.to_datetime(self._get_column("maturity", rows, pd.NaT)).to_numpy()
+        terms = (maturity[None, :] - self._dates.to_numpy()[:, None]) / np.timedelta64(1, "D") / 365.25
+        y = self._get_yields(terms) / 100 + spread
+        # remaining annual coupons, the first one in f years
+        n = np.ceil(terms)
+        f = terms - (n - 1)
+        v = 1 / (1 + y)
+        with np.errstate(invalid = "ignore", divide = "ignore", over = "ignore"):
+            annuity = np.where(np.abs(y) > 1e-12, v ** f * (1 - v ** n) / (1 - v), n)
+            pv = par * coupon * annuity + par * v ** terms
+        return np.where(terms > 0, pv, np.where(np.isnan(terms), np.nan, par))
+
+    def _value_turbos(self, rows: np.ndarray, held: np.ndarray) -> np.ndarray:
+        '''
+        return:
+            (dates x turbos) prices of one warrant, 0 once knocked out while held
+        '''
+        underlying = self._get_column("underlying", rows).astype(str)
+        barrier = self._get_column("barrier", rows).astype(np.float64)
+        ratio = np.nan_to_num(self._get_column("ratio", rows, 10.0).astype(np.float64), nan = 10.0)
+        close = self._get_prices(underlying)
+        high = self._get_prices(underlying, "High", carry = False)
+        knockedOut = np.logical_or.accumulate(held & (high >= barrier), axis = 0)
+        return np.where(knockedOut, 0.0, np.maximum(barrier - close, 0) / ratio)
+
+    def revalue(self) -> np.ndarray:
+        '''
+        return:
+            (dates x positions) values of the positions, 0 where not held, NaN where held without price
+        '''
+        held = self._get_held()
+        unit = np.full(held.shape, np.nan)
+        types = self._holdings["type"].to_numpy()
+        for kind in self.Types:
+            rows = np.flatnonzero(types == kind)
+            if not len(rows):
+                continue
+            if kind in ("stock", "etf"):
+                unit[:, rows] = self._get_prices(self._holdings["code"].to_numpy()[rows].astype(str))
+            elif kind == "bond":
+                unit[:, rows] = self._value_bonds(rows)
+            elif kind == "turbo":
+                unit[:, rows] = self._value_turbos(rows, held[:, rows])
+            else:
+                unit[:, rows] = 1.0
+        quantity = self._holdings["quantity"].to_numpy(dtype = np.float64)
+        self._values = np.where(held, unit * quantity, 0.0)
+        return self._values
+
+    def get_values(self) -> pd.DataFrame:
+        '''
+        return:
+            (dates x positions) values, the columns are the rows of the holdings table
+        '''
+        values = self.revalue() if self._values is None else self._values
+        return pd.DataFrame(values, index = self._dates, columns = self._holdings.index)
+
+    def get_nav(self, byType: bool = False):
+        '''
+        param:
+            byType: one column per position type
+        return:
+            NAV series over the dates, or (dates x types) DataFrame; NaN where a held position has no value
+        '''
+        values = self.get_values().to_numpy()
+        if byType:
+            types = self._holdings["type"].to_numpy()
+            return pd.DataFrame({kind: values[:, types == kind].sum(axis = 1) for kind in self.Types}, index = self._dates)
+        return pd.Series(values.sum(axis = 1), index = self._dates, name = "NAV")
+
+    def value_on(self, date: str) -> pd.DataFrame:
+        '''
+        return:
+            holdings table with the value of each position on the last date up to date
+        '''
+        position = self._dates.searchsorted(pd.Timestamp(date), side = "right") - 1
+        if position < 0:
+            raise ValueError(f"no prices up to {date}")
+        values = self.get_values().iloc[position]
+        return self._holdings.assign(value = values.to_numpy())
@@ -0,0 +1,5 @@
+__all__ = ["PortfolioValuator"]
+
+# classes are imported on first access
+from .._lazy import make_lazy
+make_lazy(__name__)
@@ -0,0 +1,151 @@
+import numpy as np
+
+class DCFBatchEvaluator(object):
+	'''
+	Vectorized DCF valuation of many companies under many scenarios
+	Inputs are the same as those of DCFEvaluator, but each of them can be an array over companies.
+	Every evaluate_* method returns present values as a (companies x scenarios) array.
+	'''
+	def __init__(self, market_cap0, market_cap, period, equity, debt,
+			tax_rate, margin_tax_rate,
+			r0, default_interest_rate_spread,
+			EBIT, interest, depreciation, capital_expenditure, working_capital0, working_capital,
+			beta = 1.0, term = 10, growth_rate = None, growth_rate_perpetual = 0.01):
+		'''
+		param:
+			market_cap0 ... working_capital, beta: scalars or arrays of size n_companies
+			term: number of years of explicit forecast
+			growth_rate: base growth-rate path of FCFF, size term, zeros if None
+			growth_rate_perpetual: base perpetual growth rate
+		'''
+		self.E, self.D = np.broadcast_arrays(np.asarray(equity, dtype = np.float64), np.asarray(debt, dtype = np.float64))
+		self.V = self.E + self.D
+		self.r0 = np.asarray(r0, dtype = np.float64)
+		self.beta = np.asarray(beta, dtype = np.float64)
+		anualized_capital_return = (np.asarray(market_cap, dtype = np.float64) / market_cap0)**(1.0 / np.asarray(period)) - 1.0
+		self.ERP = anualized_capital_return - self.r0
+		self.default_interest_rate_spread = np.asarray(default_interest_rate_spread, dtype = np.float64)
+		self.margin_tax_rate = np.asarray(margin_tax_rate, dtype = np.float64)
+		self.Tc = np.asarray(tax_rate, dtype = np.float64)
+		self.WACC = self.compute_WACC()[:, 0]
+		delta_working_capital = np.asarray(working_capital, dtype = np.float64) - working_capital0
+		self.FCFF = np.asarray(EBIT * (1 - self.Tc) + interest + depreciation - capital_expenditure - delta_working_capital, dtype = np.float64)
+		self.n_companies = np.broadcast(self.E, self.WACC, self.FCFF).shape[0]
+		self.WACC = np.broadcast_to(self.WACC, self.n_companies)
+		self.FCFF = np.broadcast_to(self.FCFF, self.n_companies)
+		self.term = term
+		self.growth_rate = np.zeros(term) if growth_rate is None else np.asarray(growth_rate, dtype = np.float64)
+		self.growth_rate_perpetual = growth_rate_perpetual
+
+	def compute_WACC(self, r0 = None, beta = None, ERP = None, default_interest_rate_spread = None, tax_rate = None) -> np.ndarray:
+		'''
+		WACC of every company under scenarios of its components
+		param:
+			r0, beta, ERP, default_interest_rate_spread, tax_rate: arrays of size n_scenarios, or (n_companies x n_scenarios),
+			                                                       the inputs of the constructor if None
+		return:
+			(companies x scenarios) array
+		'''
+		def scenario(x, default):
+			x = np.asarray(default if x is None else x, dtype = np.float64)
+			return x.reshape(-1, 1) if x is default or x.ndim == 0 else np.atleast_2d(x)
+
+		r0     = scenario(r0, self.r0)
+		Re     = r0 + scenario(beta, self.beta) * scenario(ERP, self.ERP)
+		Rd     = (r0 + scenario(default_interest_rate_spread, self.default_interest_rate_spread)) * (1.0 - self.margin_tax_rate.reshape(-1, 1))
+		Tc     = scenario(tax_rate, self.Tc)
+		weight = (self.E / self.V).reshape(-1, 1)
+		return np.atleast_2d(weight * Re + (1.0 - weight) * Rd * (1 - Tc))
+
+	def evaluate_PV(self, WACC = None, growth_rate = None, growth_rate_perpetual = None, FCFF = None) -> np.ndarray:
+		'''
+		param:
+			WACC: (scenarios) or (companies x scenarios), the WACC of each company if None
+			growth_rate: (term), (scenarios x term) or (companies x scenarios x term), the base path if None
+			growth_rate_perpetual: scalar, (scenarios) or (companies x scenarios), the base rate if None
+			FCFF: (companies) or (companies x scenarios), the FCFF of each company if None
+		return:
+			(companies x scenarios) array of present values, NaN if WACC <= growth_rate_perpetual
+		'''
+		WACC = self.WACC[:, None] if WACC is None else np.atleast_2d(WACC)
+		growth_rate = self.growth_rate if growth_rate is None else np.asarray(growth_rate, dtype = np.float64)
+		g = self.growth_rate_perpetual if growth_rate_perpetual is None else growth_rate_perpetual
+		g = np.atleast_2d(g)
+		FCFF = self.FCFF if FCFF is None else np.asarray(FCFF, dtype = np.float64)
+		FCFF = FCFF[:, None] if FCFF.ndim == 1 else FCFF
+
+		growth = np.cumprod(1.0 + growth_rate, axis = -1)
+		years = np.arange(1, growth.shape[-1] + 1)
+		discount = (1.0 + WACC[..., None]) ** -years
+		PV = (growth * discount).sum(axis = -1)
+		with np.errstate(divide = "ignore", invalid = "ignore"):
+			terminal = growth[..., -1] * (1 + g) / (WACC - g) * discount[..., -1]
+		PV = np.where(WACC > g, PV + terminal, np.nan)
+		return FCFF * PV
+
+	def evaluate_PV_grid(self, WACC, growth_rate_perpetual, growth_rate = None) -> np.ndarray:
+		'''
+		sensitivity of PV to WACC and perpetual growth rate
+		param:
+			WACC: array of WACC values on the grid
+			growth_rate_perpetual: array of perpetual growth rates on the grid
+			growth_rate: growth-rate path shared by all grid points, the base path if None
+		return:
+			(companies x WACC x growth_rate_perpetual) array
+		'''
+		WACCGrid, gGrid = np.meshgrid(WACC, growth_rate_perpetual, indexing = "ij")
+		PV = self.evaluate_PV(WACCGrid.ravel(), growth_rate, gGrid.ravel())
+		return PV.reshape(self.n_companies, *WACCGrid.shape)
+
+	def simulate_PV(self, n_draws: int, WACC_std = 0.005, growth_rate_std = 0.005,
+			growth_rate_perpetual_std = 0.0025, FCFF_std = 0.1, seed = None) -> np.ndarray:
+		'''
+		Monte Carlo valuation: normal draws around the inputs of every company
+		param:
+			n_draws: number of draws per company
+			WACC_std: standard deviation of WACC
+			growth_rate_std: standard deviation of a parallel shift of the growth-rate path
+			growth_rate_perpetual_std: standard deviation of perpetual growth rate
+			FCFF_std: relative standard deviation of FCFF
+			seed: seed of the random generator
+		return:
+			(companies x draws) array of present values, NaN for draws with WACC <= growth_rate_perpetual
+		'''
+		rng = np.random.default_rng(seed)
+		shape = (self.n_companies, n_draws)
+		WACC = self.WACC[:, None] + WACC_std * rng.standard_normal(shape)
+		growth_rate = self.growth_rate + growth_rate_std * rng.standard_normal(shape)[..., None]
+		g = self.growth_rate_perpetual + growth_rate_perpetual_std * rng.standard_normal(shape)
+		FCFF = self.FCFF[:, None] * (1.0 + FCFF_std * rng.standard_normal(shape))
+		return self.evaluate_PV(WACC, growth_rate, g, FCFF)
+
+	@staticmethod
+	def summarize(PV: np.ndarray, quantiles = (0.05, 0.5, 0.95)) -> np.ndarray:
+		'''
+		param:
+			PV: (companies x draws) array from simulate_PV
+			quantiles: quantiles of the valuation distribution
+		return:
+			(companies x quantiles) array, NaN draws are ignored
+		'''
+		return np.nanquantile(PV, quantiles, axis = 1).T
+
+
+if __name__ == "__main__":
+	import time
+	rng = np.random.default_rng(0)
+	n = 300
+	scale = rng.uniform(0.5, 2.0, n)
+	evaluator = DCFBatchEvaluator(100, 3050.12, 30, 1253.0 * scale, 317.0 * scale,
+			25 / 100.0, 35 / 100.0,
+			3.27 / 100.0, 0.75 / 100.0,
+			355.85 / (1 - 25 / 100.0) * scale, 1.36, 1.68, 16.07 * scale, -49.74, -57.42,
+			beta = rng.uniform(0.6, 1.4, n),
+			growth_rate = np.array([1.5, 1.5, 1.5, 1.5, 1.5, 1.5, 1.4, 1.3, 1.2, 1.1]) / 100.0)
+	start = time.perf_counter()
+	grid = evaluator.evaluate_PV_grid(np.linspace(0.04, 0.09, 50), np.linspace(0.0, 0.03, 50))
+	print("grid", grid.shape, f"{time.perf_counter() - start:.3f} s")
+	start = time.perf_counter()
+	PV = evaluator.simulate_PV(10000, seed = 0)
+	print("Monte Carlo", PV.shape, f"{time.perf_counter() - start:.3f} s")
+	print(DCFBatchEvaluator.summarize(PV)[:5])
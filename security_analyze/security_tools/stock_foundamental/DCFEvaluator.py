@@ -35,6 +35,7 @@ class DCFEvaluator(object):
 		FCFF *= (1 + self.growth_rate_perpetual) / (self.WACC - self.growth_rate_perpetual)
 		self.PV += FCFF / (1.0 + self.WACC)**self.term
 		print(self.PV/8015e8 - 1)
+		return self.PV
 
 
 if __name__ == "__main__":
@@ -1,3 +1,4 @@
-__all__ = ["DCFEvaluator"]
+__all__ = ["DCFEvaluator", "DCFBatchEvaluator"]
 
 from .DCFEvaluator import DCFEvaluator
+from .DCFBatchEvaluator import DCFBatchEvaluator
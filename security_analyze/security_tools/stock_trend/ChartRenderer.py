@@ -0,0 +1,180 @@
+import os
+import re
+import numpy as np
+import pandas as pd
+import mplfinance as mpf
+from .DataAnalyzer import DataAnalyzer
+from .IndicatorSet import IndicatorSet
+
+
+class ChartRenderer(object):
+    '''
+    Headless renderer of candlestick + MA charts to image files
+
+    The mplfinance style and the figure are created once per process and reused for every chart,
+    long histories are downsampled before plotting. Select a non-interactive backend, e.g.
+    matplotlib.use("Agg"), before rendering in worker processes.
+    '''
+
+    PeriodNames = {"day": " Day", "week": " Week", "month": " Month", "hour": " Hour"}
+    # indicators drawn over the candles, the others get panels below the volume, one per scale:
+    # the oscillators of 0-100 share one, MACD and every other indicator have their own
+    Overlays = ("MA", "EMA", "BOLL")
+    Panels   = {"RSI": "RSI/KDJ", "KDJ": "RSI/KDJ"}
+    _style  = None
+    # number of indicator panels -> (figure, candles, volume, [indicator axes])
+    _figures = {}
+
+    def __init__(self, outDir: str, maxBars: dict = {"day": 250, "week": 156, "month": 120, "hour": 240},
+                 downsample: str = "tail", figsize: tuple = (12, 8), dpi: int = 100, indicators: list[str] = None):
+        '''
+        param:
+            outDir: output directory of the images
+            maxBars: {period: maximum number of bars plotted}
+            downsample: "tail" - plot the last bars, "lttb" - largest-triangle-three-buckets over the whole history
+            figsize, dpi: size and resolution of the images
+            indicators: indicators of IndicatorSet plotted with the moving averages, e.g. ["BOLL20", "MACD"]
+        '''
+        self._outDir     = outDir
+        self._maxBars    = maxBars
+        self._downsample = downsample
+        self._indicators = list(indicators) if indicators else []
+        self._figsize    = figsize
+        self._dpi        = dpi
+        if not os.path.exists(outDir):
+            os.makedirs(outDir, exist_ok = True)
+
+    @classmethod
+    def get_style(cls):
+        '''
+        return:
+            the mplfinance style of all candlestick charts, created once per process
+        '''
+        if cls._style is None:
+            mycolor = mpf.make_marketcolors(up="red", down="green", edge="i", wick="i", volume="in")
+            cls._style = mpf.make_mpf_style(marketcolors=mycolor, gridaxis="both", gridstyle="-.")
+        return cls._style
+
+    @classmethod
+    def is_overlay(cls, column: str) -> bool:
+        '''
+        return:
+            whether the column of IndicatorSet is drawn over the candles
+        '''
+        return cls.get_panel(column) is None
+
+    @classmethod
+    def get_panel(cls, column: str) -> str:
+        '''
+        return:
+            name of the panel of the column of IndicatorSet, None if it is drawn over the candles
+        '''
+        kind = re.match(r"[A-Z]+", IndicatorSet.get_indicator(column) or column).group()
+        return None if kind in cls.Overlays else cls.Panels.get(kind, kind)
+
+    @classmethod
+    def get_panels(cls, columns: list[str]) -> list[str]:
+        '''
+        return:
+            names of the indicator panels of the columns, in the order of the columns
+        '''
+        return list(dict.fromkeys(panel for panel in map(cls.get_panel, columns) if panel is not None))
+
+    def _get_figure(self, panels: int = 0):
+        if panels not in ChartRenderer._figures:
+            fig = mpf.figure(style = self.get_style(), figsize = self._figsize)
+            if panels:
+                # heights of the candles, the volume and each indicator panel, scaled to the figure
+                heights = np.array([0.48, 0.15] + [0.21] * panels)
+                heights *= (0.86 - 0.01 * (panels + 1)) / heights.sum()
+                tops = 0.92 - np.concatenate([[0], np.cumsum(heights[:-1] + 0.01)])
+                ax  = fig.add_axes([0.08, tops[0] - heights[0], 0.88, heights[0]])
+                axv = fig.add_axes([0.08, tops[1] - heights[1], 0.88, heights[1]], sharex = ax)
+                axi = [fig.add_axes([0.08, top - height, 0.88, height], sharex = ax) for top, height in zip(tops[2:], heights[2:])]
+            else:
+                ax  = fig.add_axes([0.08, 0.30, 0.88, 0.62])
+                axv = fig.add_axes([0.08, 0.08, 0.88, 0.20], sharex = ax)
+                axi = []
+            ChartRenderer._figures[panels] = (fig, ax, axv, axi)
+        return ChartRenderer._figures[panels]
+
+    @staticmethod
+    def lttb(y: np.ndarray, n: int) -> np.ndarray:
+        '''
+        largest-triangle-three-buckets downsampling
+        param:
+            y: series to downsample
+            n: number of points to keep
+        return:
+            sorted positions of the points kept, always including the first and the last point
+        '''
+        size = len(y)
+        if n >= size or n < 3:
+            return np.arange(size)
+        edges = np.linspace(1, size - 1, n - 1).astype(int)
+        selected = np.empty(n, dtype = int)
+        selected[0], selected[-1] = 0, size - 1
+        x = np.arange(size, dtype = np.float64)
+        for i in range(n - 2):
+            lo, hi = edges[i], edges[i + 1]
+            nextLo, nextHi = hi, edges[i + 2] if i + 2 < len(edges) else size
+            xc, yc = x[nextLo:nextHi].mean(), y[nextLo:nextHi].mean()
+            xa, ya = x[selected[i]], y[selected[i]]
+            area = np.abs((xa - xc) * (y[lo:hi] - ya) - (xa - x[lo:hi]) * (yc - ya))
+            selected[i + 1] = lo + np.argmax(area)
+        return selected
+
+    def _select(self, kHistory: pd.DataFrame, period: str) -> np.ndarray:
+        maxBars = self._maxBars.get(period, len(kHistory))
+        if len(kHistory) <= maxBars:
+            return np.arange(len(kHistory))
+        if self._downsample == "lttb":
+            return self.lttb(kHistory["Close"].to_numpy(dtype = np.float64), maxBars)
+        return np.arange(len(kHistory) - maxBars, len(kHistory))
+
+    def render(self, dataAnalyzer: DataAnalyzer, periods: list = ["day", "week", "month", "hour"]) -> list[str]:
+        '''
+        param:
+            dataAnalyzer: DataAnalyzer of the stock, its moving averages are plotted
+            periods: periods to render
+        return:
+            paths of the images, {code}_{period}.png in outDir
+        '''
+        panels = self.get_panels(IndicatorSet(self._indicators).get_columns())
+        fig, ax, axv, axi = self._get_figure(len(panels))
+        code = dataAnalyzer.get_data_acquired().get_code()
+        paths = []
+        for period in periods:
+            kHistory = dataAnalyzer.get_k_history(period)
+            if kHistory.empty or kHistory["Close"].isna().all():
+                continue
+            positions = self._select(kHistory, period)
+            # moving averages are computed on the full history, then sampled at the plotted bars
+            addplot = []
+            for i, (window, MA) in enumerate(dataAnalyzer.get_moving_average(period).items()):
+                full = np.full(len(kHistory), np.nan)
+                if len(MA) <= len(kHistory):
+                    full[len(kHistory) - len(MA):] = MA
+                if not np.isnan(full[positions]).all():
+                    addplot.append(mpf.make_addplot(full[positions], ax = ax, width = 1, color = f"C{i}"))
+            if self._indicators:
+                # indicators of the full history, computed in one pass
+                for j, (column, values) in enumerate(dataAnalyzer.get_indicators(period, self._indicators).items()):
+                    values = values.to_numpy()[positions]
+                    if np.isnan(values).all():
+                        continue
+                    panel = self.get_panel(column)
+                    addplot.append(mpf.make_addplot(values, ax = ax if panel is None else axi[panels.index(panel)], width = 1, color = f"C{i + j + 1}",
+                                                    type = "bar" if column.startswith("MACD") else "line"))
+            for axes in [ax, axv, *axi]:
+                axes.clear()
+            mpf.plot(kHistory.iloc[positions], type = 'candle', ax = ax, volume = axv, addplot = addplot,
+                     show_nontrading = False, warn_too_much_data = len(positions) + 1)
+            # dates only under the lowest panel
+            for axes in [ax, axv, *axi][:-1]:
+                axes.tick_params(labelbottom = False)
+            ax.set_title(code + self.PeriodNames[period], fontsize=16, style='normal', loc='center')
+            path = os.path.join(self._outDir, f"{code}_{period}.png")
+            fig.savefig(path, dpi = self._dpi)
+            paths.append(path)
+        return paths
@@ -1,10 +1,12 @@
 import pandas as pd
-import pandas_market_calendars as pm_calendar
 import numpy as np
 from urllib.parse import urlencode
-import requests
 import os
+import io
 import copy
+from .KLineAlignment import KLineAlignment
+from .KLineBars import KLineBars
+from .KLineValidator import KLineValidator
 
 
 class DataAcquisitor(object):
@@ -37,12 +39,14 @@ class DataAcquisitor(object):
 	__fields2 = ",".join(__fields)
 	__dateFormat = "%Y%m%d"
 	__emptyDataFrame = pd.DataFrame(columns = __columns, index = [pd.Timestamp.min])
+	__periods = ["day", "week", "month", "hour"]
 	_QuotationURLHeader = "https://xueqiu.com/S/"
 
 	class UnsupportedDataFrameError(BaseException):
 		pass
 
-	def __init__(self, code: str, beg: str, end: str, mode: int = 0, inDir: str = None, outDir: str = "."):
+	def __init__(self, code: str, beg: str, end: str, mode: int = 0, inDir: str = None, outDir: str = ".",
+	             columns: list[str] = None, compact: bool = False, repair: bool = False, tail: int = None, unfillable: dict = None):
 		'''
 		参数
 			code :  6 位股票代码
@@ -51,19 +55,36 @@ class DataAcquisitor(object):
 			mode:   0 - 在线 1 - 离线
 			inDir:  输入数据文件夹路径
 			outDir: 输出数据文件夹路径
+			columns: 离线模式下只读取的列，例如 ["Close"]，None 为全部
+			compact: 离线模式下以 KLineBars 保存k线数据
+			repair: 在线模式下更新前先补齐已有数据中缺失的k线
+			tail:   离线模式下每个周期只读取截至 end 的最后 tail 根k线，None 为全部
+			unfillable: repair 时不再请求的范围 {period: [[beg, end], ...]}，即以前补齐后仍缺失的k线，例如停牌
 		'''
+		if mode == 0 and (columns is not None or compact or tail is not None):
+			raise ValueError("columns, compact and tail are only supported in the offline mode")
+		if mode == 1 and repair:
+			raise ValueError("repair is only supported in the online mode")
 		self._code  = code
 		self._secid = self._gen_secid()
 		self._beg   = beg
 		self._end   = end
 		self._mode  = mode
 		self._XD    = False
+		self._columns = columns
+		self._compact = compact
+		self._tail    = tail
+		self._alignment = None
+		self._repairReport = None
+		self._unfillable = {period: [list(r) for r in ranges] for period, ranges in (unfillable or {}).items()}
 
 		self._outDir = outDir
 		if inDir == None:
 			inDir = outDir
 		self._inDir = inDir
 		self.read_from_csv(mode)
+		if repair:
+			self._repairReport = self.repair()
 		if mode == 0:
 			self._dayK   = self._get_k_history(klt = 101, setXDFlag = True)
 			self._dayK   = self._get_k_history(klt = 101)
@@ -104,6 +125,14 @@ class DataAcquisitor(object):
 	def get_hour_k(self) -> pd.DataFrame:
 		return self._hourK 
 
+	def get_alignment(self) -> KLineAlignment:
+		'''
+		positions of the bars of each period in the other periods, built once and shared by the analyses of this data
+		'''
+		if self._alignment is None:
+			self._alignment = KLineAlignment.from_acquisitor(self)
+		return self._alignment
+
 	def read_from_csv(self, mode: int):
 		'''
 		参数
@@ -116,25 +145,139 @@ class DataAcquisitor(object):
 			else:
 				beg = self._beg
 				end = self._end
+			# column projection: the index and the requested columns only
+			usecols = None if self._columns is None else [0] + [self.__columns.index(c) + 1 for c in self._columns]
 
-			self._dayK   = pd.read_csv(f"{self._inDir}/{self._code}_day.csv", encoding="utf-8-sig",
-									   parse_dates = [0], index_col = 0, dtype = np.float64).loc[beg : end]
-			self._weekK  = pd.read_csv(f"{self._inDir}/{self._code}_week.csv", encoding="utf-8-sig",
-									   parse_dates = [0], index_col = 0, dtype = np.float64).loc[beg : end]
-			self._monthK = pd.read_csv(f"{self._inDir}/{self._code}_month.csv", encoding="utf-8-sig",
-									   parse_dates = [0], index_col = 0, dtype = np.float64).loc[beg : end]
-			self._hourK  = pd.read_csv(f"{self._inDir}/{self._code}_hour.csv", encoding="utf-8-sig",
-									   parse_dates = [0], index_col = 0, dtype = np.float64).loc[beg : end]
+			self._dayK   = self._read_k_csv("day", usecols).loc[beg : end]
+			self._weekK  = self._read_k_csv("week", usecols).loc[beg : end]
+			self._monthK = self._read_k_csv("month", usecols).loc[beg : end]
+			self._hourK  = self._read_k_csv("hour", usecols).loc[beg : end]
 
 			if self._dayK.empty or self._weekK.empty or self._monthK.empty or self._hourK.empty:
 				raise self.UnsupportedDataFrameError()
 
+			# codes without data keep the empty DataFrame
+			if self._compact:
+				self._dayK   = KLineBars.from_frame(self._dayK)
+				self._weekK  = KLineBars.from_frame(self._weekK)
+				self._monthK = KLineBars.from_frame(self._monthK)
+				self._hourK  = KLineBars.from_frame(self._hourK, unit = "minute")
+
 		except (FileNotFoundError, self.UnsupportedDataFrameError):
 			self._dayK   = copy.deepcopy(self.__emptyDataFrame)
 			self._weekK  = copy.deepcopy(self.__emptyDataFrame)
 			self._monthK = copy.deepcopy(self.__emptyDataFrame)
 			self._hourK  = copy.deepcopy(self.__emptyDataFrame)
 
+	def _read_k_csv(self, period: str, usecols: list[int] = None) -> pd.DataFrame:
+		path = f"{self._inDir}/{self._code}_{period}.csv"
+		source = path if self._tail is None else io.BytesIO(self._read_tail_lines(path, self._tail, self._end))
+		df = pd.read_csv(source, encoding="utf-8-sig", usecols = usecols,
+						 parse_dates = [0], index_col = 0, dtype = np.float64)
+		# files with unordered dates cannot be sliced, they are sorted here and reported by validate
+		if not df.index.is_monotonic_increasing:
+			df = df.sort_index(kind = "stable")
+		return df
+
+	@staticmethod
+	def _read_tail_lines(path: str, tail: int, end: str, blockSize: int = 1 << 14) -> bytes:
+		'''
+		header and the last tail rows dated up to end of a CSV file sorted by date, read backwards
+		from the end of the file in doubling blocks, so the cost does not grow with the history
+		'''
+		endKey = pd.Timestamp(end).strftime("%Y-%m-%d").encode()
+		with open(path, "rb") as f:
+			header = f.readline()
+			start = f.tell()
+			pos = f.seek(0, os.SEEK_END)
+			chunk = b""
+			while True:
+				size = min(blockSize, pos - start)
+				pos -= size
+				f.seek(pos)
+				chunk = f.read(size) + chunk
+				# the first line of the chunk is partial unless the chunk reaches the header
+				lines = [line for line in chunk.split(b"\n")[0 if pos == start else 1:] if line.strip()]
+				# rows are dated "YYYY-MM-DD" or "YYYY-MM-DD HH:MM:SS", ISO dates compare as bytes
+				last = sum(1 for line in lines if line[:10] <= endKey)
+				if last >= tail or pos == start:
+					break
+				blockSize *= 2
+		# rows after end are at the end of the chunk
+		return header + b"\n".join(lines[max(last - tail, 0) : last]) + b"\n"
+
+	def truncate(self, beg: str, end: str):
+		'''
+		copy of the data restricted to [beg, end] with float64 columns, as read in the offline mode,
+		so that freshly fetched data can be analyzed without a round trip through the CSV files
+		'''
+		truncated = copy.copy(self)
+		truncated._beg, truncated._end, truncated._mode = beg, end, 1
+		truncated._alignment = None
+		truncated._dayK   = self._dayK.loc[beg : end].astype(np.float64)
+		truncated._weekK  = self._weekK.loc[beg : end].astype(np.float64)
+		truncated._monthK = self._monthK.loc[beg : end].astype(np.float64)
+		truncated._hourK  = self._hourK.loc[beg : end].astype(np.float64)
+		if truncated._dayK.empty or truncated._weekK.empty or truncated._monthK.empty or truncated._hourK.empty:
+			truncated._dayK   = copy.deepcopy(self.__emptyDataFrame)
+			truncated._weekK  = copy.deepcopy(self.__emptyDataFrame)
+			truncated._monthK = copy.deepcopy(self.__emptyDataFrame)
+			truncated._hourK  = copy.deepcopy(self.__emptyDataFrame)
+		return truncated
+
+	def get_as_of(self, position: int, partial: bool = False):
+		'''
+		copy of the data seen at the close of the day bar at position, as truncate(beg, date of that bar),
+		sliced by the integer positions of the alignment instead of date lookups
+		param:
+			partial: add the bar of the unfinished week and month built from the day bars up to position,
+			         as a fetch on that day returns it, instead of ending at the last complete bar
+		'''
+		last = [self.get_alignment().get_positions("day", period)[position] for period in self.__periods]
+		truncated = copy.copy(self)
+		truncated._end, truncated._mode = self._dayK.index[position].strftime(self.__dateFormat), 1
+		truncated._alignment = None
+		kHistories = [self._dayK.iloc[: last[0] + 1], self._weekK.iloc[: last[1] + 1],
+		              self._monthK.iloc[: last[2] + 1], self._hourK.iloc[: last[3] + 1]]
+		if partial:
+			for i in [1, 2]:
+				kHistories[i] = self._append_partial_bar(kHistories[i], position)
+		if last[0] < 0 or last[3] < 0 or min(len(kHistory) for kHistory in kHistories) == 0:
+			truncated._dayK   = copy.deepcopy(self.__emptyDataFrame)
+			truncated._weekK  = copy.deepcopy(self.__emptyDataFrame)
+			truncated._monthK = copy.deepcopy(self.__emptyDataFrame)
+			truncated._hourK  = copy.deepcopy(self.__emptyDataFrame)
+			return truncated
+		truncated._dayK, truncated._weekK, truncated._monthK, truncated._hourK = [kHistory.astype(np.float64, copy = False) for kHistory in kHistories]
+		return truncated
+
+	def _append_partial_bar(self, kHistory: pd.DataFrame, position: int) -> pd.DataFrame:
+		'''
+		param:
+			kHistory: complete week or month bars up to the day bar at position
+		return:
+			kHistory with the bar of the day bars after its last bar up to position, dated on the day of position
+		'''
+		date = self._dayK.index[position]
+		if len(kHistory) and kHistory.index[-1].normalize() == date.normalize():
+			return kHistory
+		start = self._dayK.index.searchsorted(kHistory.index[-1].normalize(), side = "right") if len(kHistory) else 0
+		days = self._dayK.iloc[start : position + 1]
+		if days.empty:
+			return kHistory
+		bar = {"Open": days["Open"].iloc[0] if "Open" in days else np.nan, "Close": days["Close"].iloc[-1],
+		       "High": days["High"].max() if "High" in days else np.nan, "Low": days["Low"].min() if "Low" in days else np.nan}
+		for column in ["Volume", "成交额", "换手率"]:
+			if column in days:
+				bar[column] = days[column].sum()
+		# changes against the close of the previous bar, the close before the first day if there is none
+		previous = kHistory["Close"].iloc[-1] if len(kHistory) else days["Close"].iloc[0] - days["涨跌额"].iloc[0] if "涨跌额" in days else np.nan
+		bar["涨跌额"] = bar["Close"] - previous
+		bar["涨跌幅"] = bar["涨跌额"] / previous * 100
+		bar["振幅"]   = (bar["High"] - bar["Low"]) / previous * 100
+		bar = pd.DataFrame({column: [bar.get(column, np.nan)] for column in kHistory.columns}, index = [date]).round(2)
+		return pd.concat([kHistory, bar.astype(kHistory.dtypes.to_dict())]) if len(kHistory) else bar
+
 	def save_to_csv(self):
 		if self._mode == 1: # saving is not supported in the offline mode
 			return
@@ -176,6 +319,7 @@ class DataAcquisitor(object):
 	            前复权 : 1
 	            后复权 : 2 
 		'''
+		import pandas_market_calendars as pm_calendar
 
 		if klt == 101:
 			dfOld = self._dayK
@@ -203,7 +347,7 @@ class DataAcquisitor(object):
 				beg = max(beg, endOld)
 			# Check if the dates of new records are all holidays. If so, then there is no need to update.
 			marketCalendar = pm_calendar.get_calendar('XSHG').schedule(start_date = beg, end_date=end)
-			checkDate = beg + pd.Timedelta(days=1)
+			checkDate = beg.normalize() + pd.Timedelta(days=1) # hour K ends at 15:00, the calendar is indexed by days
 			while(checkDate <= end):
 				if checkDate in marketCalendar.index:
 					break
@@ -219,14 +363,44 @@ class DataAcquisitor(object):
 				closePriceOld = np.nan
 			else:
 				closePriceOld = dfOld.iloc[-1,1]
-		# drop the last row, because it could be updated in the case of week/month K
-		dfOld.drop(dfOld.index[-1], inplace = True)
+		# drop the last row, because it could be updated in the case of week/month K,
+		# and the hour K of the first fetched day, which are fetched again
+		dfOld.drop(dfOld.index[-1:].union(dfOld.index[dfOld.index >= pd.Timestamp(beg)]), inplace = True)
+
+		klines = self._request_klines(klt, beg, self._end, fqt)
+		if klines is None:
+			print("股票代码:", self._code, "可能有误")
+			return copy.deepcopy(self.__emptyDataFrame)
+
+		df = self._parse_klines(klines)
+
+		# XD must be decided by dayK in the current version
+		if klt == 101 and setXDFlag == True:
+			# ex-dividend day encountered, must update everything before, only set the XD flag here
+			# the first fetched bar is the last stored one, so days skipped since the last run are not taken for XD
+			if ~np.isnan(closePriceOld) and len(df) > 0 and df.index[0] == endOld and df["Close"].iloc[0] != closePriceOld:
+				self._XD = True
+				return copy.deepcopy(self.__emptyDataFrame)
+
+		dfOld = dfOld.loc[self._beg : self._end]
+		if not self._XD and not dfOld.empty:
+			df = pd.concat([dfOld.astype(np.float64), df])
+
+		return df
+
+	def _request_klines(self, klt: int, beg: str, end: str, fqt: int = 1) -> list[str]:
+		'''
+		request the k线 of [beg, end] from 东方财富网, the market of secid is switched if there is no data
+		return:
+			klines as "Date,Open,Close,..." strings, None if there is no data in either market
+		'''
+		import requests
 
 		params = (
 	        ("fields1", "f1,f2,f3,f4,f5,f6,f7,f8,f9,f10,f11,f12,f13"),
 	        ("fields2", self.__fields2),
 	        ("beg", beg),
-	        ("end", self._end),
+	        ("end", end),
 	        ("rtntype", '6'),
 	        ("secid", self._secid),
 	        ("klt", f"{klt}"),
@@ -250,30 +424,79 @@ class DataAcquisitor(object):
 				url, headers = self.__EastmoneyHeaders).json()
 			data = json_response.get("data")
 		if data is None:
-			print("股票代码:", self._code, "可能有误")
-			return copy.deepcopy(self.__emptyDataFrame)
-	
-		klines = data['klines']
+			return None
+		return data['klines']
 
-		index = []
-		rows  = dfOld.loc[self._beg : self._end].to_numpy().tolist() if not self._XD else []
-		for _kline in klines:
-			kline = _kline.split(',')
-			index.append(kline[0])
-			rows.append(kline[1:])
+	def _parse_klines(self, klines: list[str]) -> pd.DataFrame:
+		'''
+		k线 strings to a DataFrame with float64 columns, as read in the offline mode, parsed in one pass
+		of the C parser over the joined strings, "-" is taken as missing
+		'''
+		if len(klines) == 0:
+			return pd.DataFrame(columns = self.__columns, index = pd.DatetimeIndex([]), dtype = np.float64)
+		return pd.read_csv(io.StringIO("\n".join(klines)), header = None, names = ["Date"] + self.__columns, index_col = 0,
+		                   parse_dates = [0], dtype = {column: np.float64 for column in self.__columns}, na_values = ["-"]).rename_axis(None)
 
-		# XD must be decided by dayK in the current version
-		if klt == 101 and setXDFlag == True:
-			# ex-dividend day encountered, must update everything before, only set the XD flag here
-			# limitation: DataAcquisitor has to be run every day, otherwise it is guaranteed re-download the table!
-			if ~np.isnan(closePriceOld) and rows[-1][1] != closePriceOld:
-				self._XD = True
-				return copy.deepcopy(self.__emptyDataFrame)
+	def validate(self, validator: KLineValidator = None) -> pd.DataFrame:
+		'''
+		check the k线 of each period against the XSHG trading calendar
+		return:
+			number of missing, duplicated, unordered and unexpected bars of each period, see KLineValidator
+		'''
+		validator = KLineValidator() if validator is None else validator
+		return validator.summarize(dict(zip(self.__periods, [self._dayK, self._weekK, self._monthK, self._hourK])))
 
-		index = pd.DatetimeIndex(index)
-		if not self._XD:
-			index = pd.DatetimeIndex([*dfOld.index, *index])
-	
-		df = pd.DataFrame(rows, columns = self.__columns, index = index)
+	def repair(self, maxGap: int = 10, validator: KLineValidator = None) -> pd.DataFrame:
+		'''
+		drop duplicated dates, sort unordered ones and fetch only the missing bars of each period,
+		one request per range of KLineValidator.get_missing_ranges, in the online mode the repaired data is saved by save_to_csv;
+		bars in the unfillable ranges are not requested, bars still missing after the request are added to them
+		参数
+			maxGap: missing bars separated by at most this many stored bars are fetched in one request
+		return:
+			number of requests, fetched bars, bars still missing, e.g. suspensions, and skipped unfillable bars of each period
+		'''
+		if self._compact:
+			raise ValueError("repair is not supported for compact data")
+		validator = KLineValidator() if validator is None else validator
+		report = {}
+		for period, klt, attribute in zip(self.__periods, [101, 102, 103, 60], ["_dayK", "_weekK", "_monthK", "_hourK"]):
+			df = getattr(self, attribute)
+			if df.empty or df.index[0] == pd.Timestamp.min:
+				report[period] = {"requests": 0, "fetched": 0, "missing": 0, "skipped": 0}
+				continue
+			cleaned = df[~df.index.duplicated(keep = "last")].sort_index()
+			missing = validator.validate(cleaned, period)["missing"]
+			days = missing.normalize()
+			known = np.zeros(len(missing), dtype = bool)
+			for beg, end in self._unfillable.get(period, []):
+				known |= (days >= pd.Timestamp(beg)) & (days <= pd.Timestamp(end))
+			skipped, missing = int(known.sum()), missing[~known]
+			ranges = validator.get_missing_ranges(missing, period, maxGap)
+			fetched = [self._parse_klines(self._request_klines(klt, beg, end) or []) for beg, end in ranges]
+			# only the missing bars are taken, stored bars fetched along in a merged range are kept
+			fetched = [bars[bars.index.isin(missing)] for bars in fetched]
+			count = sum(len(bars) for bars in fetched)
+			if count > 0:
+				cleaned = pd.concat([cleaned, *fetched]).sort_index()
+			setattr(self, attribute, cleaned)
+			# bars the source did not return are not requested again
+			unfilled = missing.difference(cleaned.index)
+			if len(unfilled):
+				self._unfillable[period] = sorted(self._unfillable.get(period, []) + [list(r) for r in validator.get_missing_ranges(unfilled, period, 0)])
+			report[period] = {"requests": len(ranges), "fetched": count, "missing": len(unfilled), "skipped": skipped}
+		return pd.DataFrame(report).T
 
-		return df
+	def get_repair_report(self) -> pd.DataFrame:
+		'''
+		return:
+			report of the repair done by the constructor, None without repair
+		'''
+		return self._repairReport
+
+	def get_unfillable(self) -> dict:
+		'''
+		return:
+			{period: [[beg, end], ...]} ranges of bars the source did not return in a repair, including those given to the constructor
+		'''
+		return self._unfillable
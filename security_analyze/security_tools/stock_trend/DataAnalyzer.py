@@ -1,10 +1,9 @@
 import numpy as np
-from scipy.signal import savgol_filter
-import matplotlib.pyplot as plt
-import mplfinance as mpf
 import pandas as pd
 from .DataAcquisitor import DataAcquisitor
+from .IndicatorSet import IndicatorSet
 from .Network import Network
+from .NetworkInputDataPreparer import NetworkInputDataPreparer
 
 
 class DataAnalyzer(object):
@@ -25,13 +24,23 @@ class DataAnalyzer(object):
                    [1, "w", "W",  "Week", "week"],
                    [2, "m", "M", "Month", "month"],
                    [3, "h", "H", "Hour", "hour"]]
+    SGWindow = 11  # window of the Savitzky–Golay filter smoothing MA5
+    SGTail   = 120 # number of MA5 points smoothed first when searching the last maximum
+    # (code, period) -> (date, MA5, smoothed MA5) of the last settled maximum, shared by the analyzers of a process
+    _lastMaximumCache = {}
+    # (window, deriv) -> convolution coefficients and edge operator of the Savitzky–Golay filter
+    _savgolOperators = {}
 
     def __init__(self, dataAcquired: DataAcquisitor, network: Network = None):
         '''
         param:
-            dataAcquired: DataAcquisitor containing the stock data
+            dataAcquired: DataAcquisitor containing the stock data, as DataFrames or compact KLineBars
+            network: pre-trained Network for the network-assisted signal
         '''
         self._dataAcquired = dataAcquired
+        self._network = network
+        # (period, indicator) -> columns of IndicatorSet computed so far
+        self._indicators = {}
         self._MADay   = {5: self.compute_moving_average(0, 5),
                         10: self.compute_moving_average(0, 10),
                         20: self.compute_moving_average(0, 20),
@@ -47,19 +56,11 @@ class DataAnalyzer(object):
         self._MAHour =  {5: self.compute_moving_average(3, 5),
                         20: self.compute_moving_average(3, 20),
                         60: self.compute_moving_average(3, 60)}
-#       self._smoothedDayMA5   = self.compute_smoothed_MA5(0, 11, deriv = 0)
-#       self._smoothedWeekMA5  = self.compute_smoothed_MA5(1, 11, deriv = 0)
-#       self._smoothedMonthMA5 = self.compute_smoothed_MA5(2, 11, deriv = 0)
-#       self._smoothedHourMA5  = self.compute_smoothed_MA5(3, 11, deriv = 0)
-        # smoothed derivatives is used to find local extrema
-#       self._smoothedDerivativeDayMA5   = self.compute_smoothed_MA5(0, 11, deriv = 1)
-#       self._smoothedDerivativeWeekMA5  = self.compute_smoothed_MA5(1, 11, deriv = 1)
-#       self._smoothedDerivativeMonthMA5 = self.compute_smoothed_MA5(2, 11, deriv = 1)
-#       self._smoothedDerivativeHourMA5  = self.compute_smoothed_MA5(3, 11, deriv = 1)
-#       self._lastMaximumDayMA5   = self.compute_historical_maximum_closest_to_today(0)
-#       self._lastMaximumWeekMA5  = self.compute_historical_maximum_closest_to_today(1)
-#       self._lastMaximumMonthMA5 = self.compute_historical_maximum_closest_to_today(2)
-#       self._lastMaximumHourMA5  = self.compute_historical_maximum_closest_to_today(3)
+        # last local maxima of the smoothed MA5, only the tail of each series is smoothed
+        self._lastMaximumDayMA5   = self.compute_historical_maximum_closest_to_today(0)
+        self._lastMaximumWeekMA5  = self.compute_historical_maximum_closest_to_today(1)
+        self._lastMaximumMonthMA5 = self.compute_historical_maximum_closest_to_today(2)
+        self._lastMaximumHourMA5  = self.compute_historical_maximum_closest_to_today(3)
         # simply approximate derivatives f today's trends by finite difference of MAs
         self._derivativeTodayDay   = {5: self.compute_derivative_today(0, 5, stencil = 1),
                                      20: self.compute_derivative_today(0, 20, stencil = 1),
@@ -125,7 +126,23 @@ class DataAnalyzer(object):
         else:
             return self._MAHour
 
-    def compute_smoothed_MA5(self, period, window: int, deriv: int = 0, **kwargs) -> np.ndarray:
+    def get_indicators(self, period, names: list[str]) -> pd.DataFrame:
+        '''
+        param:
+            period: day - 0, week - 1, month - 2, hour - 3
+            names: indicators of IndicatorSet, e.g. ["MACD", "RSI6", "BOLL20"]
+        return:
+            columns of the indicators indexed as the K-line data, the missing ones computed in one pass
+        '''
+        period = next((i for i, alias in enumerate(self.PeriodAlias) if period in alias), 3)
+        missing = [name for name in dict.fromkeys(names) if (period, name) not in self._indicators]
+        if missing:
+            computed = IndicatorSet(missing).compute_frame(self.get_k_history(period))
+            for name in missing:
+                self._indicators[(period, name)] = computed[IndicatorSet([name]).get_columns()]
+        return pd.concat([self._indicators[(period, name)] for name in dict.fromkeys(names)], axis = 1)
+
+    def compute_smoothed_MA5(self, period, window: int, deriv: int = 0, tail: int = None, **kwargs) -> np.ndarray:
         '''
         smooth data using a cubic Savitzky–Golay filter
         
@@ -133,9 +150,40 @@ class DataAnalyzer(object):
             period: day - 0, week - 1, month - 2, hour - 3
             window: size of the window
             deriv: n-th derivative
+            tail: only smooth the last tail points, which are identical to those of the whole series
         '''
         data = self.get_moving_average(period)[5]
-        return savgol_filter(data, window, 3, deriv, **kwargs)
+        if tail is not None:
+            # window // 2 leading points absorb the edge effect of the filter
+            data = data[max(len(data) - max(tail + window // 2, window), 0):]
+        if kwargs or len(data) < window:
+            from scipy.signal import savgol_filter
+            smoothed = savgol_filter(data, window, 3, deriv, **kwargs)
+        else:
+            # same as savgol_filter in the default "interp" mode, with the operators computed once
+            coeffs, edge = self._get_savgol_operators(window, deriv)
+            half = window // 2
+            smoothed = np.concatenate([edge[:half] @ data[:window], np.convolve(data, coeffs, mode = "valid"),
+                                       edge[window - half:] @ data[-window:]])
+        return smoothed if tail is None else smoothed[-tail:]
+
+    @classmethod
+    def _get_savgol_operators(cls, window: int, deriv: int) -> tuple[np.ndarray, np.ndarray]:
+        '''
+        cubic least-squares fit over one window, computed without importing scipy.signal
+        return:
+            convolution coefficients of the interior points, (window x window) operator fitting the edges
+        '''
+        if (window, deriv) not in cls._savgolOperators:
+            x = np.arange(window, dtype = np.float64) - window // 2
+            basis = np.vander(x, 4, increasing = True)
+            # deriv-th derivative of the basis 1, x, x^2, x^3
+            derivative = np.zeros_like(basis)
+            for k in range(deriv, 4):
+                derivative[:, k] = np.prod(np.arange(k - deriv + 1, k + 1)) * x ** (k - deriv)
+            edge = derivative @ np.linalg.pinv(basis)
+            cls._savgolOperators[(window, deriv)] = (edge[window // 2][::-1].copy(), edge)
+        return cls._savgolOperators[(window, deriv)]
 
     def compute_derivative_today(self, period, window: int, stencil: int = 2) -> np.float64:
         '''
@@ -160,21 +208,45 @@ class DataAnalyzer(object):
 
     def compute_historical_maximum_closest_to_today(self, period) -> np.float64:
         '''
+        smoothed MA5 at its last local maximum, 10000 if there is none
+
+        The smoothed series is computed on a tail that doubles until a maximum is found. A maximum
+        whose smoothed values no longer change when bars are appended is cached per code and period,
+        later searches, e.g. on the next day or on the previous days, stop there.
         param:
-            period: day - 0, week - 1 or month - 2
+            period: day - 0, week - 1, month - 2, hour - 3
         '''
-        if period in self.PeriodAlias[0]:
-            MA5, dMA5 = self._smoothedDayMA5, self._smoothedDerivativeDayMA5
-        elif period in self.PeriodAlias[1]:
-            MA5, dMA5 = self._smoothedWeekMA5, self._smoothedDerivativeWeekMA5
-        elif period in self.PeriodAlias[2]:
-            MA5, dMA5 = self._smoothedMonthMA5, self._smoothedDerivativeMonthMA5
-        else:
-            MA5, dMA5 = self._smoothedHourMA5, self._smoothedDerivativeHourMA5
-        for i in range(len(MA5) - 2, -1, -1):
-            if dMA5[i] > 0 and dMA5[i + 1] < 0: # I don't think I need to bother with dMA5 == 0 but I will make it robuster later
-                return MA5[i]
-        return 10000
+        MA5 = self.get_moving_average(period)[5]
+        window, half = self.SGWindow, self.SGWindow // 2
+        if len(MA5) < window or np.isnan(MA5).any():
+            return 10000
+        index = self.get_k_history(period).index
+        dates = index[len(index) - len(MA5):]
+        key = (self._dataAcquired.get_code(), [i for i in range(len(self.PeriodAlias)) if period in self.PeriodAlias[i]][0])
+
+        # the cached maximum is reused if its bar is settled in this data and the prices were not re-adjusted
+        floor = 0
+        cached = self._lastMaximumCache.get(key)
+        if cached is not None:
+            pos = dates.searchsorted(cached[0])
+            if pos <= len(MA5) - half - 2 and dates[pos] == cached[0] and MA5[pos] == cached[1]:
+                floor = pos
+
+        tail = self.SGTail
+        while True:
+            lo = max(len(MA5) - tail, floor)
+            dMA5 = self.compute_smoothed_MA5(period, window, deriv = 1, tail = len(MA5) - lo)
+            found = np.flatnonzero((dMA5[:-1] > 0) & (dMA5[1:] < 0)) # I don't think I need to bother with dMA5 == 0
+            if found.size or lo == floor:
+                break
+            tail *= 2
+        if not found.size:
+            return 10000
+        i = lo + found[-1]
+        maximum = self.compute_smoothed_MA5(period, window, deriv = 0, tail = len(MA5) - lo)[found[-1]]
+        if i <= len(MA5) - half - 2:
+            self._lastMaximumCache[key] = (dates[i], MA5[i], maximum)
+        return maximum
 
     def get_historical_maximum_closest_to_today(self, period) -> np.float64:
         if period in self.PeriodAlias[0]:
@@ -222,10 +294,16 @@ class DataAnalyzer(object):
             return self.RISING_LONG_NEW
         return self.RISING_SHORT
     
-    def get_signal(self, priceLimit : np.float64 = 9999) -> int:
+    def get_signal(self, priceLimit : np.float64 = 9999, withNetwork : bool = False):
         '''
         get signals indicating the decision
+        param:
+            withNetwork: if True, return the network prediction alongside the hard-coded signal
+        return:
+            hard-coded signal, or (hard-coded signal, predicted price change) if withNetwork
         '''
+        if withNetwork:
+            return self._get_signal_hardcoded(priceLimit), self._get_signal_with_network()
         return self._get_signal_hardcoded(priceLimit)
 
     def _get_signal_hardcoded(self, priceLimit : np.float64 = 9999) -> int:
@@ -242,43 +320,80 @@ class DataAnalyzer(object):
         ### long term
         elif (self._derivativeTodayWeek[20] >= 0 and self._derivativeTodayMonth[20] >= 0):
             # potential "terminal lucidity"
-            # if(priceClosing < 0.98 * min(self._lastMaximumWeekMA5, self._lastMaximumMonthMA5)):
-                # if priceClosing >= 0.94 * self._lastMaximumDayMA5:
-                    # return self.RISING_SHORT
-                # return self.SPECULATE
-        	return self._check_MA_trend("long")
+            if(priceClosing < 0.98 * min(self._lastMaximumWeekMA5, self._lastMaximumMonthMA5)):
+                if priceClosing >= 0.94 * self._lastMaximumDayMA5:
+                    return self.RISING_SHORT
+                return self.SPECULATE
+            return self._check_MA_trend("long")
         elif (self._derivativeTodayDay[20] < 0 and self._derivativeTodayWeek[20] < 0):
             return self.IGNORE
         else:
             return self.SPECULATE
         
-    def _get_signal_with_network(self):
+    def get_network_input(self, network: Network = None) -> dict:
+        '''
+        input of the last usable day for the network, so that many stocks can be predicted in one batch
+        param:
+            network: Network defining the input windows, the network of this analyzer if None
+        '''
+        network = self._network if network is None else network
+        preparer = NetworkInputDataPreparer(self._dataAcquired, network.get_windows(), network.get_MA_windows())
+        return preparer.get_latest_input()
+
+    def _get_signal_with_network(self) -> np.float64:
         '''
         Predict price change utilizing for auxiliary decision making utilizing a pre-trained network
         '''
-        pass
+        if self._network is None:
+            return np.nan
+        return self._network.predict_many([self.get_network_input()])[0]
 
-    def plot_MA_and_K(self, period,ax = None):
+    def get_k_history(self, period) -> pd.DataFrame:
+        '''
+        param:
+            period: day - 0, week - 1, month - 2, hour - 3
+        '''
+        if period in self.PeriodAlias[0]:
+            return self._dataAcquired.get_day_k()
+        elif period in self.PeriodAlias[1]:
+            return self._dataAcquired.get_week_k()
+        elif period in self.PeriodAlias[2]:
+            return self._dataAcquired.get_month_k()
+        else:
+            return self._dataAcquired.get_hour_k()
+
+    def plot_MA_and_K(self, period,ax = None, indicators: list[str] = None):
+        '''
+        param:
+            indicators: indicators of IndicatorSet, moving averages and bands over the candles, the others in panels below the volume,
+                        one per scale as ChartRenderer.get_panel
+        '''
+        import matplotlib.pyplot as plt
+        import mplfinance as mpf
+        from .ChartRenderer import ChartRenderer
         MA = self.get_moving_average(period)
+        kHistory = self.get_k_history(period)
+        addplot = []
+        if indicators:
+            computed = self.get_indicators(period, indicators)
+            panels = ChartRenderer.get_panels(list(computed.columns))
+            for i, (column, values) in enumerate(computed.items()):
+                panel = ChartRenderer.get_panel(column)
+                addplot.append(mpf.make_addplot(values, panel = 0 if panel is None else 2 + panels.index(panel), width = 1, color = f"C{i}",
+                                                type = "bar" if column.startswith("MACD") else "line"))
         if period in self.PeriodAlias[0]:
-            kHistory = self._dataAcquired.get_day_k()
             period = " Day"
         elif period in self.PeriodAlias[1]:
-            kHistory = self._dataAcquired.get_week_k()
             period = " Week"
         elif period in self.PeriodAlias[2]:
-            kHistory = self._dataAcquired.get_month_k()
             period = " Month"
         else:
-            kHistory = self._dataAcquired.get_hour_k()
             period = " Hour"
 
         windows = list(MA.keys())
-        mycolor=mpf.make_marketcolors(up="red",down="green",edge="i",wick="i",volume="in")
-        mystyle=mpf.make_mpf_style(marketcolors=mycolor,gridaxis="both",gridstyle="-.")
         fig, axes = mpf.plot(kHistory, type = 'candle', mav = windows,
-                             volume = True, show_nontrading = False,
-                             style = mystyle,
+                             volume = True, show_nontrading = False, addplot = addplot,
+                             style = ChartRenderer.get_style(),
                              warn_too_much_data = 5215,
                              returnfig = True)
         axes[0].set_title(self._dataAcquired.get_code() + period,
@@ -0,0 +1,121 @@
+import json
+import os
+import pandas as pd
+
+
+class DownloadManifest(object):
+    '''
+    Persistent record of the bulk download: per code and period the last synchronized bar,
+    the status, the last error and the number of consecutive failed attempts, and the ranges a repair
+    requested without getting the bars, e.g. suspensions, so that later repairs skip them
+
+    {code: {"status": "ok" | "failed", "error": str, "attempts": int, "updated": str,
+            "last": {period: "YYYY-MM-DD HH:MM:SS" | None},
+            "unfillable": {period: [["YYYYMMDD", "YYYYMMDD"], ...]}}}
+    '''
+
+    Periods = ["day", "week", "month", "hour"]
+
+    def __init__(self, path: str):
+        '''
+        param:
+            path: path to the JSON file of the manifest, created on the first save
+        '''
+        self._path = path
+        if os.path.exists(path):
+            with open(path, encoding = "utf-8") as f:
+                self._entries = json.load(f)
+        else:
+            self._entries = {}
+
+    def save(self):
+        # write then rename, so that a crash never leaves a truncated manifest
+        directory = os.path.dirname(self._path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(self._path + ".tmp", "w", encoding = "utf-8") as f:
+            json.dump(self._entries, f, ensure_ascii = False, indent = 1)
+        os.replace(self._path + ".tmp", self._path)
+
+    def get_entry(self, code: str) -> dict:
+        return self._entries.get(code)
+
+    def get_unfillable(self, code: str) -> dict:
+        '''
+        return:
+            {period: [[beg, end], ...]} ranges of the code not to be requested again by a repair
+        '''
+        entry = self._entries.get(code)
+        return {} if entry is None else entry.get("unfillable", {})
+
+    def record(self, code: str, lastBars: dict = None, error: str = None, unfillable: dict = None):
+        '''
+        param:
+            code: 6-digit stock code
+            lastBars: {period: timestamp of the last bar or None if the period has no data}
+            error: error message if the download failed
+            unfillable: ranges of DataAcquisitor.get_unfillable after a repair, kept if None
+        '''
+        entry = self._entries.setdefault(code, {"attempts": 0, "last": {}})
+        if unfillable:
+            entry["unfillable"] = unfillable
+        if lastBars is not None:
+            entry["last"] = {period: None if pd.isnull(bar) else str(pd.Timestamp(bar)) for period, bar in lastBars.items()}
+            empty = [period for period in self.Periods if entry["last"].get(period) is None]
+            if error is None and empty:
+                error = "no data: " + ",".join(empty)
+        entry["status"]   = "failed" if error is not None else "ok"
+        entry["error"]    = error
+        entry["attempts"] = entry["attempts"] + 1 if error is not None else 0
+        entry["updated"]  = str(pd.Timestamp.now().floor("s"))
+
+    @staticmethod
+    def get_last_session(endDate: str) -> pd.Timestamp:
+        '''
+        return:
+            the last XSHG trading day not after endDate
+        '''
+        import pandas_market_calendars as pm_calendar
+        end = pd.Timestamp(endDate)
+        schedule = pm_calendar.get_calendar('XSHG').schedule(start_date = end - pd.Timedelta(days = 30), end_date = end)
+        return schedule.index[-1]
+
+    def is_stale(self, code: str, lastSession: pd.Timestamp) -> bool:
+        '''
+        return:
+            True if the code has never been synchronized, failed, or any period ends before lastSession
+        '''
+        entry = self._entries.get(code)
+        if entry is None or entry["status"] != "ok":
+            return True
+        return any(entry["last"].get(period) is None or pd.Timestamp(entry["last"][period]).normalize() < lastSession
+                   for period in self.Periods)
+
+    def get_pending(self, codes: list[str], endDate: str, maxAttempts: int = 3) -> list[str]:
+        '''
+        param:
+            codes: codes of the universe
+            endDate: end date of the download
+            maxAttempts: codes that failed this many times in a row are no longer retried
+        return:
+            codes that are stale and still have retry budget
+        '''
+        lastSession = self.get_last_session(endDate)
+        return [code for code in codes if self.is_stale(code, lastSession)
+                and (code not in self._entries or self._entries[code]["attempts"] < maxAttempts)]
+
+    def get_summary(self, codes: list[str], endDate: str) -> pd.DataFrame:
+        '''
+        return:
+            status, error, attempts and last bar of each period of the codes that are still stale
+        '''
+        lastSession = self.get_last_session(endDate)
+        rows = {}
+        for code in codes:
+            if not self.is_stale(code, lastSession):
+                continue
+            entry = self._entries.get(code, {"status": "missing", "error": None, "attempts": 0, "last": {}})
+            rows[code] = {"status": entry["status"], "error": entry["error"], "attempts": entry["attempts"],
+                          **{period: entry["last"].get(period) for period in self.Periods}}
+        return pd.DataFrame.from_dict(rows, orient = "index",
+                                      columns = ["status", "error", "attempts"] + self.Periods).rename_axis("股票代码")
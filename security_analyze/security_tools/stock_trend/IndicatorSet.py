@@ -0,0 +1,276 @@
+import re
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+class IndicatorSet(object):
+    '''
+    Technical indicators of one code or of a panel of codes, computed together in one pass
+
+    Indicators, with the conventions of the Chinese charting software:
+        MA<n>, EMA<n>, VMA<n>:          moving averages of the close, exponential of the close, of the volume
+        MACD[_<fast>_<slow>_<signal>]:  DIF, DEA and MACD = 2 * (DIF - DEA), default 12, 26, 9
+        RSI<n>:                         relative strength index, changes smoothed with weight 1/n
+        BOLL<n>[_<k>]:                  Bollinger bands BOLL (MA), UB and LB at k sample deviations, default k = 2
+        KDJ[_<n>_<m1>_<m2>]:            K, D and J of the stochastic oscillator, default 9, 3, 3
+        ATR<n>:                         moving average of the true range
+    e.g. BOLL20 gives the columns BOLL20, UB20 and LB20, MACD_5_34_5 gives DIF_5_34_5, DEA_5_34_5
+    and MACD_5_34_5. The requested set shares its intermediates: one cumulative sum per input
+    series serves every window, an EMA span is computed once, and the recursive smoothers (EMA,
+    DEA, RSI, K and D) run as first-order filters over all codes at once. The last bars of the
+    windows and the last values of the filters are kept, so appending bars only processes the new
+    bars. Panels are (bars x codes) arrays, NaN where a code does not trade; the bars of each code
+    are gathered before computing, so windows count the bars of the code and not the dates.
+    '''
+
+    Patterns = {"MA":   r"MA(\d+)",
+                "EMA":  r"EMA(\d+)",
+                "VMA":  r"VMA(\d+)",
+                "MACD": r"MACD(?:_(\d+)_(\d+)_(\d+))?",
+                "RSI":  r"RSI(\d+)",
+                "BOLL": r"BOLL(\d+)(?:_(\d+(?:\.\d+)?))?",
+                "KDJ":  r"KDJ(?:_(\d+)_(\d+)_(\d+))?",
+                "ATR":  r"ATR(\d+)"}
+    Defaults = {"MACD": (12, 26, 9), "BOLL": (None, 2.0), "KDJ": (9, 3, 3)}
+    Fields = ["Open", "Close", "High", "Low", "Volume"]
+    # column -> indicator giving it
+    Columns = {r"(MA|EMA|VMA|RSI|ATR)(\d+)": "{}{}",
+               r"(?:DIF|DEA|MACD)((?:_\d+_\d+_\d+)?)": "MACD{}",
+               r"(?:BOLL|UB|LB)(\d+(?:_\d+(?:\.\d+)?)?)": "BOLL{}",
+               r"[KDJ]((?:_\d+_\d+_\d+)?)": "KDJ{}"}
+
+    def __init__(self, names: list[str]):
+        '''
+        param:
+            names: indicators, see the class
+        '''
+        self._specs = []
+        for name in dict.fromkeys(names):
+            for kind, pattern in self.Patterns.items():
+                match = re.fullmatch(pattern, name)
+                if match is not None:
+                    break
+            else:
+                raise ValueError(f"unknown indicator {name}")
+            params = tuple(default if value is None else float(value) for value, default
+                           in zip(match.groups(), self.Defaults.get(kind, (None,) * len(match.groups()))))
+            suffix = name[len(kind):]
+            self._specs.append((kind, tuple(int(p) if float(p).is_integer() else p for p in params), suffix))
+        windows = [params[0] for kind, params, _ in self._specs if kind in ("MA", "VMA", "BOLL", "KDJ", "ATR")]
+        self._window = int(max(windows, default = 1))
+        self._state = None
+
+    @classmethod
+    def get_pattern(cls) -> str:
+        '''
+        return:
+            regular expression of the column names of all indicators
+        '''
+        return "|".join(f"(?:{pattern})" for pattern in cls.Columns)
+
+    @classmethod
+    def get_indicator(cls, column: str) -> str:
+        '''
+        return:
+            name of the indicator giving the column, e.g. KDJ for J, BOLL20 for UB20, None if there is none
+        '''
+        for pattern, indicator in cls.Columns.items():
+            match = re.fullmatch(pattern, column)
+            if match is not None:
+                return indicator.format(*match.groups())
+        return None
+
+    def get_columns(self) -> list[str]:
+        columns = []
+        for kind, params, suffix in self._specs:
+            if kind == "MACD":
+                columns += ["DIF" + suffix, "DEA" + suffix, "MACD" + suffix]
+            elif kind == "BOLL":
+                columns += ["BOLL" + suffix, "UB" + suffix, "LB" + suffix]
+            elif kind == "KDJ":
+                columns += ["K" + suffix, "D" + suffix, "J" + suffix]
+            else:
+                columns.append(kind + suffix)
+        return columns
+
+    def get_fields(self) -> list[str]:
+        '''
+        return:
+            input fields needed by the indicators
+        '''
+        kinds = {kind for kind, _, _ in self._specs}
+        fields = ["Close"]
+        if kinds & {"KDJ", "ATR"}:
+            fields += ["High", "Low"]
+        if "VMA" in kinds:
+            fields.append("Volume")
+        return fields
+
+    def reset(self):
+        self._state = None
+
+    def compute(self, bars) -> dict:
+        '''
+        compute from the first bar, forgetting the bars of earlier calls
+        param:
+            bars: {field: (bars) or (bars x codes) array}, a DataFrame or KLineBars of one code
+        return:
+            {column: array of the shape of the input}, NaN where the windows are not filled yet
+        '''
+        self.reset()
+        return self.append(bars)
+
+    def append(self, bars) -> dict:
+        '''
+        param:
+            bars: new bars after those of the previous calls, as in compute
+        return:
+            {column: array} of the new bars only
+        '''
+        fields = self.get_fields()
+        available = list(bars.columns) if hasattr(bars, "columns") else list(bars.keys())
+        missing = [field for field in fields if field not in available]
+        if missing:
+            raise ValueError(f"the indicators need the fields {missing}")
+        arrays = {field: np.asarray(bars[field], dtype = np.float64) for field in fields}
+        single = arrays["Close"].ndim == 1
+        if single:
+            arrays = {field: values[:, None] for field, values in arrays.items()}
+        rows, codes = arrays["Close"].shape
+        # bars of each code first, in their order
+        valid = np.isfinite(arrays["Close"])
+        order = np.argsort(~valid, axis = 0, kind = "stable")
+        count = valid.sum(axis = 0)
+        filled = np.arange(rows)[:, None] < count
+        gathered = {field: np.where(filled, np.take_along_axis(values, order, axis = 0), np.nan) for field, values in arrays.items()}
+        if self._state is None:
+            tail = np.full((self._window - 1, codes), np.nan)
+            self._state = {"tail": {}, "close": np.full(codes, np.nan), "filters": {}}
+            for field in fields + ["TR"]:
+                self._state["tail"][field] = tail.copy()
+        elif len(self._state["close"]) != codes:
+            raise ValueError(f"{codes} codes appended to an indicator set of {len(self._state['close'])} codes")
+
+        if rows == 0:
+            return {column: arrays["Close"][:, 0] if single else arrays["Close"] for column in self.get_columns()}
+        computed = self._compute(gathered, count)
+        result = {}
+        for column, values in computed.items():
+            values = np.where(filled, values, np.nan)
+            scattered = np.full((rows, codes), np.nan)
+            np.put_along_axis(scattered, order, values, axis = 0)
+            result[column] = scattered[:, 0] if single else scattered
+        return result
+
+    def compute_frame(self, kHistory, append: bool = False) -> pd.DataFrame:
+        '''
+        param:
+            kHistory: K-line data of one code as DataFrame or KLineBars
+            append: append to the bars of the previous calls instead of computing from the first bar
+        return:
+            indicators indexed as kHistory
+        '''
+        values = self.append(kHistory) if append else self.compute(kHistory)
+        return pd.DataFrame(values, index = kHistory.index, columns = self.get_columns())
+
+    @staticmethod
+    def _smooth(x: np.ndarray, alpha: float, last: np.ndarray, seed: np.ndarray) -> np.ndarray:
+        '''
+        y[t] = alpha * x[t] + (1 - alpha) * y[t - 1], starting from last, or from seed where last is NaN
+        '''
+        from scipy.signal import lfilter
+
+        start = np.where(np.isnan(last), seed, last)
+        return lfilter([alpha], [1.0, alpha - 1.0], x, axis = 0, zi = ((1.0 - alpha) * start)[None, :])[0]
+
+    def _compute(self, bars: dict, count: np.ndarray) -> dict:
+        state = self._state
+        rows, codes = bars["Close"].shape
+        W = self._window
+        close = bars["Close"]
+        # previous close, the first bar of a code is its own previous close
+        previous = np.concatenate([state["close"][None, :], close[:-1]])
+        previous = np.where(np.isnan(previous), close, previous)
+        change = close - previous
+        series = {"Close": close}
+        if "High" in bars:
+            high, low = bars["High"], bars["Low"]
+            series.update({"High": high, "Low": low,
+                           "TR": np.fmax(high - low, np.fmax(np.abs(high - previous), np.abs(low - previous)))})
+        if "Volume" in bars:
+            series["Volume"] = bars["Volume"]
+        # windows over the kept last bars followed by the new bars
+        extended = {field: np.concatenate([state["tail"][field], values]) for field, values in series.items()}
+        # close relative to a reference price, so that the sums of squares keep their precision
+        reference = np.where(np.isnan(state["close"]), close[0], state["close"])
+        sums = {}
+        def rolling_sum(field: str, window: int, power: int = 1) -> np.ndarray:
+            if (field, power) not in sums:
+                values = extended[field] - (reference if field == "Close" else 0.0)
+                sums[(field, power)] = (np.concatenate([np.zeros((1, codes)), np.cumsum(np.nan_to_num(values ** power), axis = 0)]),
+                                        np.concatenate([np.zeros((1, codes)), np.cumsum(np.isfinite(values), axis = 0)]))
+            total, valid = sums[(field, power)]
+            windowSum = total[W : W + rows] - total[W - window : W - window + rows]
+            return np.where(valid[W : W + rows] - valid[W - window : W - window + rows] >= window, windowSum, np.nan)
+        def rolling_extreme(field: str, window: int, extreme) -> np.ndarray:
+            view = sliding_window_view(extended[field], window, axis = 0)[W - window : W - window + rows]
+            return extreme.reduce(view, axis = -1)
+
+        filters = {}
+        def smooth(key: tuple, x: np.ndarray, alpha: float, seed: np.ndarray) -> np.ndarray:
+            if key not in filters:
+                filters[key] = self._smooth(x, alpha, state["filters"].get(key, np.full(codes, np.nan)), seed)
+            return filters[key]
+        first = lambda x: x[0]
+
+        result = {}
+        for kind, params, suffix in self._specs:
+            if kind == "MA":
+                result["MA" + suffix] = rolling_sum("Close", params[0]) / params[0] + reference
+            elif kind == "VMA":
+                result["VMA" + suffix] = rolling_sum("Volume", params[0]) / params[0]
+            elif kind == "ATR":
+                result["ATR" + suffix] = rolling_sum("TR", params[0]) / params[0]
+            elif kind == "EMA":
+                result["EMA" + suffix] = smooth(("EMA", params[0]), close, 2 / (params[0] + 1), first(close))
+            elif kind == "MACD":
+                fast, slow, signal = params
+                DIF = smooth(("EMA", fast), close, 2 / (fast + 1), first(close)) - smooth(("EMA", slow), close, 2 / (slow + 1), first(close))
+                DEA = smooth(("DEA", fast, slow, signal), DIF, 2 / (signal + 1), first(DIF))
+                result.update({"DIF" + suffix: DIF, "DEA" + suffix: DEA, "MACD" + suffix: 2 * (DIF - DEA)})
+            elif kind == "RSI":
+                n = params[0]
+                up = smooth(("RSI+", n), np.maximum(change, 0), 1 / n, first(np.maximum(change, 0)))
+                move = smooth(("RSI", n), np.abs(change), 1 / n, first(np.abs(change)))
+                with np.errstate(invalid = "ignore", divide = "ignore"):
+                    result["RSI" + suffix] = np.where(move > 0, 100 * up / move, np.nan)
+            elif kind == "BOLL":
+                n, k = params
+                mean = rolling_sum("Close", n) / n
+                with np.errstate(invalid = "ignore"):
+                    deviation = np.sqrt(np.maximum(rolling_sum("Close", n, 2) - n * mean ** 2, 0) / (n - 1))
+                result.update({"BOLL" + suffix: mean + reference, "UB" + suffix: mean + reference + k * deviation,
+                               "LB" + suffix: mean + reference - k * deviation})
+            elif kind == "KDJ":
+                n, m1, m2 = params
+                # the first bars use the bars available
+                highest, lowest = rolling_extreme("High", n, np.fmax), rolling_extreme("Low", n, np.fmin)
+                with np.errstate(invalid = "ignore", divide = "ignore"):
+                    RSV = np.where(highest > lowest, 100 * (close - lowest) / (highest - lowest), 50.0)
+                RSV = np.where(np.isnan(close), np.nan, RSV)
+                K = smooth(("K", n, m1), RSV, 1 / m1, np.full(codes, 50.0))
+                D = smooth(("D", n, m1, m2), K, 1 / m2, np.full(codes, 50.0))
+                result.update({"K" + suffix: K, "D" + suffix: D, "J" + suffix: 3 * K - 2 * D})
+
+        # state after the last bar of each code
+        last = np.clip(count - 1, 0, None)
+        columns = np.arange(codes)
+        has = count > 0
+        for key, values in filters.items():
+            state["filters"][key] = np.where(has, values[last, columns], state["filters"].get(key, np.full(codes, np.nan)))
+        state["close"] = np.where(has, close[last, columns], state["close"])
+        positions = count[None, :] + np.arange(W - 1)[:, None]
+        for field, values in extended.items():
+            state["tail"][field] = np.take_along_axis(values, positions, axis = 0)
+        return result
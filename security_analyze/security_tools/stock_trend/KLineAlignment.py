@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+
+
+class KLineAlignment(object):
+    '''
+    Positions of the bars of each period in the other periods of one stock
+
+    For every pair of periods two int32 maps are kept, -1 where there is no such bar:
+        as-of:    last bar of the target period complete at the close of the bar, e.g. the week bar
+                  whose MA20 a rule may use at an hour bar, day/week/month bars close at MarketClose
+        contain:  bar of a coarser target period containing the bar, e.g. the day of an hour bar,
+                  or last bar of a finer target period contained in the bar
+    so cross-period lookups and as-of evaluations are integer indexing. The maps are built once per
+    DataAcquisitor, a few searchsorted over the indexes, and can be saved as npz with the data;
+    building them takes less time than loading them back.
+    '''
+
+    Periods = ["day", "week", "month", "hour"]
+    Modes = ["asof", "contain"]
+    Fineness = {"hour": 0, "day": 1, "week": 2, "month": 3}
+    MarketClose = pd.Timedelta(hours = 15)
+
+    def __init__(self, indexes: dict):
+        '''
+        param:
+            indexes: {period: DatetimeIndex of the bars}, an index [Timestamp.min] stands for no data
+        '''
+        self._ticks = {}
+        for period in self.Periods:
+            index = indexes.get(period, pd.DatetimeIndex([]))
+            ticks = pd.DatetimeIndex(index).to_numpy(dtype = "datetime64[ns]").astype(np.int64)
+            self._ticks[period] = ticks if not (len(ticks) and ticks[0] == pd.Timestamp.min.value) else ticks[:0]
+        self._positions = {}
+        for period in self.Periods:
+            for target in self.Periods:
+                self._positions[(period, target, "asof")], self._positions[(period, target, "contain")] = self._build(period, target)
+
+    @classmethod
+    def from_acquisitor(cls, dataAcquired):
+        '''
+        param:
+            dataAcquired: DataAcquisitor containing the stock data, as DataFrames or compact KLineBars
+        '''
+        return cls(dict(zip(cls.Periods, [dataAcquired.get_day_k().index, dataAcquired.get_week_k().index,
+                                          dataAcquired.get_month_k().index, dataAcquired.get_hour_k().index])))
+
+    def _get_close_ticks(self, period: str) -> np.ndarray:
+        return self._ticks[period] + (0 if period == "hour" else self.MarketClose.value)
+
+    def _get_day_ticks(self, period: str) -> np.ndarray:
+        day = pd.Timedelta(days = 1).value
+        return self._ticks[period] // day * day
+
+    def _build(self, period: str, target: str) -> tuple[np.ndarray, np.ndarray]:
+        if period == target:
+            identity = np.arange(len(self._ticks[period]), dtype = np.int32)
+            return identity, identity
+        asOf = np.searchsorted(self._get_close_ticks(target), self._get_close_ticks(period), side = "right") - 1
+        days, targetDays = self._get_day_ticks(period), self._get_day_ticks(target)
+        if self.Fineness[target] > self.Fineness[period]:
+            # coarser target: the first bar dated on or after the day of the bar
+            contain = np.searchsorted(targetDays, days, side = "left")
+            contain = np.where(contain < len(targetDays), contain, -1)
+        else:
+            # finer target: the last bar dated up to the day of the bar, if it is after the previous bar
+            start, stop = self.get_ranges(period, target)
+            contain = np.where(stop > start, stop - 1, -1)
+        return asOf.astype(np.int32), contain.astype(np.int32)
+
+    def get_index(self, period: str) -> pd.DatetimeIndex:
+        return pd.DatetimeIndex(self._ticks[period])
+
+    def get_positions(self, period: str, target: str, asOf: bool = True) -> np.ndarray:
+        '''
+        param:
+            period: period of the bars mapped
+            target: period of the positions
+            asOf: last complete bar of target if True, containing or last contained bar otherwise
+        return:
+            (bars of period) int32 positions in target, -1 where there is none
+        '''
+        return self._positions[(period, target, "asof" if asOf else "contain")]
+
+    def get_ranges(self, period: str, target: str) -> tuple[np.ndarray, np.ndarray]:
+        '''
+        return:
+            start, stop: bars [start, stop) of the finer period target contained in each bar of period
+        '''
+        stop = np.searchsorted(self._get_day_ticks(target), self._get_day_ticks(period), side = "right")
+        start = np.concatenate([[0], stop[:-1]])
+        return start.astype(np.int32), stop.astype(np.int32)
+
+    def save(self, path: str):
+        arrays = {f"index_{period}": ticks for period, ticks in self._ticks.items()}
+        arrays.update({"_".join(key): positions for key, positions in self._positions.items()})
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path: str):
+        alignment = cls.__new__(cls)
+        with np.load(path) as arrays:
+            alignment._ticks = {period: arrays[f"index_{period}"] for period in cls.Periods}
+            alignment._positions = {(period, target, mode): arrays[f"{period}_{target}_{mode}"]
+                                    for period in cls.Periods for target in cls.Periods for mode in cls.Modes}
+        return alignment
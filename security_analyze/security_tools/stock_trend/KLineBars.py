@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+
+
+class KLineBars(object):
+    '''
+    Compact typed K-line bars of one period
+
+    The index is stored as int32 days ("day" unit, day/week/month K) or minutes ("minute" unit, hour K)
+    since 1970-01-01, prices as int32 scaled by priceScale (exact for prices quoted with
+    up to log10(priceScale) decimals) or float32, volume as int64 and the other columns as float32.
+    Columns are accessed like in the DataFrame of DataAcquisitor: bars["Close"] is a Series,
+    bars[["Close", "涨跌幅"]] a DataFrame, both decoded to floats with a DatetimeIndex.
+    '''
+
+    PriceColumns  = ["Open", "Close", "High", "Low", "涨跌额"]
+    VolumeColumns = ["Volume"]
+    Units = {"day": "datetime64[D]", "minute": "datetime64[m]"}
+
+    def __init__(self, index: np.ndarray, columns: dict, unit: str = "day", priceScale: int = 1000):
+        '''
+        param:
+            index: int32 days or minutes since 1970-01-01
+            columns: {column: encoded values}
+            unit: "day" or "minute"
+            priceScale: scale of the int32 prices, None if prices are stored as float32
+        '''
+        if unit not in self.Units:
+            raise ValueError(f"unsupported unit {unit}, expected one of {list(self.Units)}")
+        self._index      = np.asarray(index, dtype = np.int32)
+        self._columns    = columns
+        self._unit       = unit
+        self._priceScale = priceScale
+
+    @classmethod
+    def from_frame(cls, kHistory: pd.DataFrame, columns: list = None, unit: str = "day", priceScale: int = 1000):
+        '''
+        param:
+            kHistory: K-line data of DataAcquisitor
+            columns: columns to keep, all if None
+            unit: "day" for day/week/month K, "minute" for hour K
+            priceScale: scale of the int32 prices, None to store prices as float32
+        '''
+        if unit not in cls.Units:
+            raise ValueError(f"unsupported unit {unit}, expected one of {list(cls.Units)}")
+        ticks = kHistory.index.to_numpy(dtype = "datetime64[ns]").astype(cls.Units[unit]).astype(np.int64)
+        if len(ticks) and (ticks.min() < np.iinfo(np.int32).min or ticks.max() > np.iinfo(np.int32).max):
+            raise ValueError(f"index out of the int32 range of the unit {unit}")
+        columns = list(kHistory.columns) if columns is None else columns
+        encoded = {}
+        for column in columns:
+            values = kHistory[column].to_numpy(dtype = np.float64)
+            if column in cls.VolumeColumns or (column in cls.PriceColumns and priceScale is not None):
+                if not np.isfinite(values).all():
+                    raise ValueError(f"{column} has missing values and cannot be stored as integers")
+                if column in cls.VolumeColumns:
+                    encoded[column] = np.rint(values).astype(np.int64)
+                else:
+                    encoded[column] = np.rint(values * priceScale).astype(np.int32)
+            else:
+                encoded[column] = values.astype(np.float32)
+        return cls(ticks.astype(np.int32), encoded, unit, priceScale)
+
+    @classmethod
+    def read_csv(cls, path: str, columns: list = None, beg = None, end = None, unit: str = "day", priceScale: int = 1000):
+        '''
+        param:
+            path: CSV file saved by DataAcquisitor
+            columns: columns to load, all if None
+            beg, end: date range of the bars, all bars if None
+        '''
+        usecols = None if columns is None else (lambda column: column in columns or column.startswith("Unnamed"))
+        kHistory = pd.read_csv(path, encoding = "utf-8-sig", parse_dates = [0], index_col = 0, usecols = usecols)
+        return cls.from_frame(kHistory.loc[beg : end], columns, unit, priceScale)
+
+    @property
+    def index(self) -> pd.DatetimeIndex:
+        return pd.DatetimeIndex(self._index.astype(self.Units[self._unit]))
+
+    @property
+    def columns(self) -> list[str]:
+        return list(self._columns)
+
+    @property
+    def empty(self) -> bool:
+        return len(self._index) == 0 or len(self._columns) == 0
+
+    @property
+    def nbytes(self) -> int:
+        return self._index.nbytes + sum(values.nbytes for values in self._columns.values())
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def get_ticks(self) -> np.ndarray:
+        '''
+        return:
+            int32 days or minutes since 1970-01-01, without decoding
+        '''
+        return self._index
+
+    def get_values(self, column: str) -> np.ndarray:
+        '''
+        return:
+            decoded values of the column, float64 for scaled prices
+        '''
+        values = self._columns[column]
+        if column in self.PriceColumns and self._priceScale is not None:
+            return values / self._priceScale
+        return values
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return pd.Series(self.get_values(key), index = self.index, name = key)
+        return pd.DataFrame({column: self.get_values(column) for column in key}, index = self.index)
+
+    def to_frame(self) -> pd.DataFrame:
+        return self[self.columns]
@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+
+
+class KLineValidator(object):
+    '''
+    Checks of K-line histories against the XSHG trading calendar
+
+    The expected bars of a period are derived from the trading days: day K on every trading day,
+    week and month K on the last trading day of each week and month, hour K at HourBars of every
+    trading day. A history is compared with the expected bars between its first and last bar, so
+    the days before listing are not reported. Day bars missing on trading days are holes of the
+    download or suspensions, the latter stay missing after a repair.
+    '''
+
+    HourBars = pd.to_timedelta(["10:30:00", "11:30:00", "14:00:00", "15:00:00"])
+    Frequencies = {"week": "W", "month": "M"}
+    # trading days of the calendar, loaded once per process
+    _calendar = None
+
+    def __init__(self, tradingDays: pd.DatetimeIndex = None):
+        '''
+        param:
+            tradingDays: trading days, the XSHG calendar if None
+        '''
+        if tradingDays is None:
+            tradingDays = self.get_trading_days()
+        self._tradingDays = pd.DatetimeIndex(tradingDays).normalize()
+
+    @classmethod
+    def get_trading_days(cls) -> pd.DatetimeIndex:
+        '''
+        return:
+            trading days of XSHG from 1990 to the end of next year
+        '''
+        if KLineValidator._calendar is None:
+            import pandas_market_calendars as pm_calendar
+            end = f"{pd.Timestamp.today().year + 1}1231"
+            KLineValidator._calendar = pm_calendar.get_calendar("XSHG").schedule(start_date = "19901219", end_date = end).index.normalize()
+        return KLineValidator._calendar
+
+    def get_expected_index(self, period: str, beg, end) -> pd.DatetimeIndex:
+        '''
+        param:
+            period: day, week, month or hour
+            beg, end: date range, a week or month ending after end has its bar on the last trading day up to end
+        return:
+            dates of the expected bars
+        '''
+        days = self._tradingDays[self._tradingDays.slice_indexer(pd.Timestamp(beg).normalize(), pd.Timestamp(end).normalize())]
+        if period == "day":
+            return days
+        if period == "hour":
+            return pd.DatetimeIndex((days.to_numpy()[:, None] + self.HourBars.to_numpy()[None, :]).ravel())
+        if period in self.Frequencies:
+            periods = days.to_period(self.Frequencies[period]).asi8
+            return days[np.append(periods[1:] != periods[:-1], True)] if len(days) else days
+        raise ValueError(f"unsupported period {period}")
+
+    def validate(self, kHistory, period: str) -> dict:
+        '''
+        param:
+            kHistory: K-line data of DataAcquisitor, DataFrame or KLineBars
+        return:
+            {"missing": expected bars absent from the history,
+             "duplicated": repeated dates,
+             "unordered": dates not after the previous bar,
+             "unexpected": dates that are not expected bars, e.g. on holidays}
+            as DatetimeIndex, all empty for an empty history
+        '''
+        index = pd.DatetimeIndex(kHistory.index)
+        empty = pd.DatetimeIndex([])
+        if len(index) == 0 or index[0] == pd.Timestamp.min:
+            return {"missing": empty, "duplicated": empty, "unordered": empty, "unexpected": empty}
+        expected = self.get_expected_index(period, index.min(), index.max())
+        # the last bar of an open week or month is dated on the last trading day seen, hours of the last day may be to come
+        expected = expected[expected <= index.max()]
+        ticks = index.asi8
+        return {"missing": expected.difference(index),
+                "duplicated": index[index.duplicated()].unique(),
+                "unordered": index[1:][np.diff(ticks) < 0],
+                "unexpected": index.difference(expected)}
+
+    def get_missing_ranges(self, missing: pd.DatetimeIndex, period: str, maxGap: int = 10) -> list[tuple[str, str]]:
+        '''
+        group missing bars into date ranges to fetch, one request per range
+        param:
+            missing: missing bars of validate
+            maxGap: runs of missing bars separated by at most this many present bars are fetched together
+        return:
+            list of (beg, end) as YYYYMMDD
+        '''
+        if len(missing) == 0:
+            return []
+        missing = missing.sort_values()
+        expected = self.get_expected_index(period, missing[0], missing[-1])
+        positions = expected.get_indexer(missing)
+        starts = np.flatnonzero(np.diff(positions, prepend = -maxGap - 2) > maxGap + 1)
+        ends = np.append(starts[1:], len(missing)) - 1
+        return [(missing[s].strftime("%Y%m%d"), missing[e].strftime("%Y%m%d")) for s, e in zip(starts, ends)]
+
+    def summarize(self, kHistories: dict) -> pd.DataFrame:
+        '''
+        param:
+            kHistories: {period: K-line data}
+        return:
+            number of missing, duplicated, unordered and unexpected bars of each period
+        '''
+        return pd.DataFrame({period: {key: len(value) for key, value in self.validate(kHistory, period).items()}
+                             for period, kHistory in kHistories.items()}).T
@@ -1,2 +1,94 @@
+import numpy as np
+
+
 class Network(object):
-    pass
+    '''
+    Multilayer perceptron over the flattened multi-period input windows, inference runs on CPU in NumPy
+
+    Weights are stored in a .npz file with the arrays
+        W0, b0, W1, b1, ...: dense layers, ReLU between them, the last layer is linear with one output
+        mean, std:           standardization of the flattened input
+        periods, windows:    periods of the input and the number of bars of each window
+        MAWindows:           moving-average windows of the input features
+    '''
+
+    # weights path -> Network, so that every process loads the weights only once
+    _loaded = {}
+
+    def __init__(self, layers: list, periods: list[str], windows: list[int], MAWindows: list[int],
+                 mean: np.ndarray = None, std: np.ndarray = None):
+        '''
+        param:
+            layers: list of (W, b) of the dense layers
+            periods: periods of the input in the order they are flattened, e.g. ["day", "week", "hour"]
+            windows: number of bars of the window of each period
+            MAWindows: moving-average windows of the input features
+            mean, std: standardization of the flattened input
+        '''
+        self._layers    = [(np.asarray(W, dtype = np.float32), np.asarray(b, dtype = np.float32)) for W, b in layers]
+        self._periods   = list(periods)
+        self._windows   = [int(w) for w in windows]
+        self._MAWindows = [int(w) for w in MAWindows]
+        size = self._layers[0][0].shape[0]
+        self._mean = np.zeros(size, dtype = np.float32) if mean is None else np.asarray(mean, dtype = np.float32)
+        self._std  = np.ones(size, dtype = np.float32) if std is None else np.asarray(std, dtype = np.float32)
+
+    @classmethod
+    def load(cls, path: str):
+        '''
+        return:
+            Network with the weights in path, cached for the lifetime of the process
+        '''
+        if path not in cls._loaded:
+            with np.load(path) as f:
+                nLayers = len([key for key in f.files if key.startswith("W")])
+                layers = [(f[f"W{i}"], f[f"b{i}"]) for i in range(nLayers)]
+                cls._loaded[path] = cls(layers, f["periods"].tolist(), f["windows"], f["MAWindows"], f["mean"], f["std"])
+        return cls._loaded[path]
+
+    def save(self, path: str):
+        arrays = {}
+        for i, (W, b) in enumerate(self._layers):
+            arrays[f"W{i}"], arrays[f"b{i}"] = W, b
+        np.savez(path, periods = np.array(self._periods), windows = np.array(self._windows),
+                 MAWindows = np.array(self._MAWindows), mean = self._mean, std = self._std, **arrays)
+
+    def get_windows(self) -> dict:
+        '''
+        return:
+            {period: number of bars}, as expected by NetworkInputDataPreparer
+        '''
+        return dict(zip(self._periods, self._windows))
+
+    def get_MA_windows(self) -> list[int]:
+        return self._MAWindows
+
+    def predict(self, inputs: dict) -> np.ndarray:
+        '''
+        batched forward pass
+        param:
+            inputs: {period: (samples x bars x features)} from NetworkInputDataPreparer
+        return:
+            (samples) predicted returns
+        '''
+        x = np.concatenate([inputs[period].reshape(len(inputs[period]), -1) for period in self._periods], axis = 1)
+        x = (np.nan_to_num(x) - self._mean) / self._std
+        for W, b in self._layers[:-1]:
+            x = np.maximum(x @ W + b, 0.0)
+        W, b = self._layers[-1]
+        return (x @ W + b)[:, 0]
+
+    def predict_many(self, inputs: list) -> np.ndarray:
+        '''
+        one forward pass over the inputs of many stocks
+        param:
+            inputs: list of inputs of single stocks, None or empty inputs are allowed
+        return:
+            (stocks) predicted returns of the last sample of each stock, NaN if it has no input
+        '''
+        result = np.full(len(inputs), np.nan, dtype = np.float32)
+        present = [i for i in range(len(inputs)) if inputs[i] is not None and len(inputs[i][self._periods[0]])]
+        if present:
+            batch = {period: np.concatenate([inputs[i][period][-1:] for i in present]) for period in self._periods}
+            result[present] = self.predict(batch)
+        return result
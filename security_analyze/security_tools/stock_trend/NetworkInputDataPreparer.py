@@ -1,2 +1,136 @@
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from .DataAcquisitor import DataAcquisitor
+
+
 class NetworkInputDataPreparer(object):
-    pass
+    '''
+    Multi-period feature windows of one stock as input of the network
+
+    Features of each period are kept in one (bars x features) float32 table, the windows over it are
+    stride-trick views, so only the windows actually requested are materialized.
+    Windows of all periods are aligned on day bars: the input at day t only sees week/hour bars
+    that are complete at the close of day t.
+    '''
+
+    Columns = ["Open", "Close", "High", "Low", "Volume"]
+    PriceColumns = ["Open", "Close", "High", "Low"]
+
+    def __init__(self, dataAcquired: DataAcquisitor, windows: dict = {"day": 60, "week": 20, "hour": 40},
+                 MAWindows: list = [5, 20, 60]):
+        '''
+        param:
+            dataAcquired: DataAcquisitor containing the stock data
+            windows: {period: number of bars in the window}, periods are day, week, month or hour
+            MAWindows: windows of the moving averages of closing price appended to OHLCV
+        '''
+        self._dataAcquired = dataAcquired
+        self._windows      = windows
+        self._MAWindows    = MAWindows
+        self._index    = {}
+        self._features = {}
+        for period in windows:
+            kHistory = self._get_k_history(period)
+            self._index[period]    = kHistory.index
+            self._features[period] = self.compute_features(kHistory, MAWindows)
+        self._positions = self._align()
+
+    def _get_k_history(self, period) -> pd.DataFrame:
+        if period == "day":
+            return self._dataAcquired.get_day_k()
+        elif period == "week":
+            return self._dataAcquired.get_week_k()
+        elif period == "month":
+            return self._dataAcquired.get_month_k()
+        else:
+            return self._dataAcquired.get_hour_k()
+
+    @classmethod
+    def compute_features(cls, kHistory: pd.DataFrame, MAWindows: list) -> np.ndarray:
+        '''
+        return:
+            (bars x features) float32 table of OHLCV and moving averages, NaN where a moving average is undefined
+        '''
+        ohlcv = kHistory[cls.Columns].to_numpy(dtype = np.float64)
+        close = ohlcv[:, 1]
+        csum  = np.concatenate([[0.0], np.cumsum(close)])
+        features = np.empty((len(close), len(cls.Columns) + len(MAWindows)), dtype = np.float32)
+        features[:, :len(cls.Columns)] = ohlcv
+        for i, window in enumerate(MAWindows):
+            MA = np.full(len(close), np.nan)
+            MA[window - 1:] = (csum[window:] - csum[:-window]) / window
+            features[:, len(cls.Columns) + i] = MA
+        return features
+
+    def get_feature_names(self) -> list[str]:
+        return self.Columns + [f"MA{window}" for window in self._MAWindows]
+
+    def get_windows(self, period) -> np.ndarray:
+        '''
+        return:
+            (windows x bars x features) view, window i covers bars [i, i + window)
+        '''
+        return sliding_window_view(self._features[period], self._windows[period], axis = 0).transpose(0, 2, 1)
+
+    def _align(self) -> dict:
+        '''
+        return:
+            {period: position of the last bar of the window of that period} for every usable day bar
+        '''
+        if "day" not in self._index:
+            raise ValueError("day windows are required to align periods")
+        # last bar of each period complete at the close of each day, no day bars without data
+        alignment = self._dataAcquired.get_alignment()
+        dates = alignment.get_index("day")
+        positions = {period: alignment.get_positions("day", period).astype(np.int64) for period in self._index}
+        # usable if every window lies inside the data and every moving average in it is defined
+        usable = np.ones(len(dates), dtype = bool)
+        for period, pos in positions.items():
+            usable &= pos - self._windows[period] + 1 >= max(self._MAWindows, default = 1) - 1
+        positions = {period: pos[usable] for period, pos in positions.items()}
+        positions["date"] = dates[usable]
+        return positions
+
+    def get_dates(self) -> pd.DatetimeIndex:
+        '''
+        return:
+            day bars for which an input can be prepared
+        '''
+        return self._positions["date"]
+
+    def get_day_positions(self) -> np.ndarray:
+        '''
+        return:
+            positions in day-K of the dates for which an input can be prepared
+        '''
+        return self._positions["day"]
+
+    def get_input(self, samples = None) -> dict:
+        '''
+        param:
+            samples: indices into get_dates(), all usable dates if None
+        return:
+            {period: (samples x bars x features) float32}, prices relative to the last close of the window
+            and volumes relative to the mean volume of the window
+        '''
+        inputs = {}
+        nPrice = len(self.PriceColumns)
+        for period in self._windows:
+            pos = self._positions[period] if samples is None else self._positions[period][samples]
+            x = self.get_windows(period)[pos - self._windows[period] + 1] # fancy indexing copies only the selected windows
+            close = x[:, -1:, 1:2].copy()
+            x[..., :nPrice] = x[..., :nPrice] / close - 1.0
+            x[..., len(self.Columns):] = x[..., len(self.Columns):] / close - 1.0
+            volume = x[..., nPrice : nPrice + 1]
+            x[..., nPrice : nPrice + 1] = volume / np.maximum(volume.mean(axis = 1, keepdims = True), 1.0) - 1.0
+            inputs[period] = x
+        return inputs
+
+    def get_latest_input(self) -> dict:
+        '''
+        return:
+            input of the last usable day, each array has a single sample, empty if there is no usable day
+        '''
+        n = len(self.get_dates())
+        return self.get_input(np.arange(n - 1, n) if n else np.arange(0))
@@ -1,2 +1,89 @@
+import numpy as np
+from .DataAcquisitor import DataAcquisitor
+from .NetworkInputDataPreparer import NetworkInputDataPreparer
+
+
 class NetworkTrainingDataPreparer(object):
-    pass
+    '''
+    Streaming builder of training batches over the stored K-line data of a universe
+
+    Stocks are loaded one at a time and their windows are copied into fixed-size batches,
+    so memory is bounded by one stock's K-line data plus one batch, whatever the universe size.
+    '''
+
+    def __init__(self, codes: list[str], beg: str, end: str, inDir: str, horizon: int = 5, batchSize: int = 256,
+                 windows: dict = {"day": 60, "week": 20, "hour": 40}, MAWindows: list = [5, 20, 60],
+                 shuffle: bool = False, seed = None):
+        '''
+        param:
+            codes: 6-digit stock codes
+            beg, end: date range of the data, e.g. 20200101
+            inDir: directory of the stored K-line data
+            horizon: label is the return of the closing price over the next horizon day bars
+            batchSize: number of samples per batch
+            windows, MAWindows: see NetworkInputDataPreparer
+            shuffle: shuffle samples within each stock
+            seed: seed of the random generator for shuffling
+        '''
+        self._codes     = codes
+        self._beg       = beg
+        self._end       = end
+        self._inDir     = inDir
+        self._horizon   = horizon
+        self._batchSize = batchSize
+        self._windows   = windows
+        self._MAWindows = MAWindows
+        self._shuffle   = shuffle
+        self._rng       = np.random.default_rng(seed)
+
+    def __iter__(self):
+        return self.generate_batches()
+
+    def _prepare(self, code: str):
+        '''
+        return:
+            input preparer of the stock, indices of the samples with a label, and the labels
+        '''
+        dataAcquisitor = DataAcquisitor(code, self._beg, self._end, 1, inDir = self._inDir)
+        preparer = NetworkInputDataPreparer(dataAcquisitor, self._windows, self._MAWindows)
+        close = dataAcquisitor.get_day_k()["Close"].to_numpy(dtype = np.float64)
+        pos = preparer.get_day_positions()
+        samples = np.flatnonzero(pos + self._horizon < len(close))
+        labels = close[pos[samples] + self._horizon] / close[pos[samples]] - 1.0
+        valid = np.isfinite(labels)
+        return preparer, samples[valid], labels[valid].astype(np.float32)
+
+    def generate_batches(self):
+        '''
+        generator of (inputs, labels, codes):
+            inputs: {period: (batch x bars x features) float32}
+            labels: (batch) float32 forward returns
+            codes:  (batch) codes of the samples
+        the last batch may be smaller than batchSize
+        '''
+        inputs, labels, codes, size = {}, [], [], 0
+        for code in self._codes:
+            preparer, samples, y = self._prepare(code)
+            if self._shuffle:
+                order = self._rng.permutation(len(samples))
+                samples, y = samples[order], y[order]
+            start = 0
+            while start < len(samples):
+                stop = start + self._batchSize - size
+                x = preparer.get_input(samples[start:stop])
+                for period in x:
+                    inputs.setdefault(period, []).append(x[period])
+                labels.append(y[start:stop])
+                codes.append(np.full(len(labels[-1]), code))
+                size += len(labels[-1])
+                start = stop
+                if size == self._batchSize:
+                    yield self._collate(inputs, labels, codes)
+                    inputs, labels, codes, size = {}, [], [], 0
+        if size:
+            yield self._collate(inputs, labels, codes)
+
+    @staticmethod
+    def _collate(inputs: dict, labels: list, codes: list):
+        return ({period: np.concatenate(x) for period, x in inputs.items()},
+                np.concatenate(labels), np.concatenate(codes))
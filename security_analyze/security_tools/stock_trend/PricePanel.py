@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+from .DataAcquisitor import DataAcquisitor
+
+
+class PricePanel(object):
+    '''
+    Day-K prices of a universe as (dates x codes) arrays, NaN where a code does not trade
+
+    The dates are the union of the trading days of all codes, so suspensions show up as NaN
+    and every code can be processed with the same array operations.
+    '''
+
+    Fields = ["Open", "Close", "High", "Low"]
+    # ChiNext switched from 10% to 20% daily limits on this day
+    ChiNextReform = pd.Timestamp("2020-08-24")
+
+    def __init__(self, dates: pd.DatetimeIndex, codes: list[str], prices: dict):
+        '''
+        param:
+            dates: trading days
+            codes: 6-digit stock codes
+            prices: {field: (dates x codes) float64 array} for Open, Close, High and Low
+        '''
+        self._dates  = pd.DatetimeIndex(dates)
+        self._codes  = pd.Index(codes)
+        self._prices = {field: np.asarray(prices[field], dtype = np.float64) for field in self.Fields}
+
+    @classmethod
+    def from_csv(cls, codes: list[str], beg: str, end: str, inDir: str):
+        '''
+        param:
+            codes: 6-digit stock codes
+            beg, end: date range, e.g. 20200101
+            inDir: directory of the stored K-line data
+        '''
+        days = {}
+        for code in codes:
+            dayK = DataAcquisitor(code, beg, end, 1, inDir = inDir, columns = cls.Fields, compact = True).get_day_k()
+            if len(dayK) and not dayK.index[0] == pd.Timestamp.min:
+                days[code] = dayK
+        return cls.from_frames(days)
+
+    @classmethod
+    def from_frames(cls, kHistories: dict):
+        '''
+        param:
+            kHistories: {code: day-K as DataFrame or KLineBars with Open, Close, High and Low}
+        '''
+        codes = list(kHistories)
+        dates = pd.DatetimeIndex([])
+        for kHistory in kHistories.values():
+            dates = dates.union(kHistory.index)
+        prices = {field: np.full((len(dates), len(codes)), np.nan) for field in cls.Fields}
+        for j, code in enumerate(codes):
+            kHistory = kHistories[code]
+            rows = dates.get_indexer(kHistory.index)
+            for field in cls.Fields:
+                prices[field][rows, j] = kHistory[field].to_numpy(dtype = np.float64)
+        return cls(dates, codes, prices)
+
+    def get_dates(self) -> pd.DatetimeIndex:
+        return self._dates
+
+    def get_codes(self) -> pd.Index:
+        return self._codes
+
+    def get_prices(self, field: str = "Close") -> np.ndarray:
+        '''
+        return:
+            (dates x codes) prices of the field
+        '''
+        return self._prices[field]
+
+    def get_previous_close(self) -> np.ndarray:
+        '''
+        return:
+            (dates x codes) last close before each date, carried over suspensions
+        '''
+        close = pd.DataFrame(self._prices["Close"]).ffill().to_numpy()
+        previous = np.full_like(close, np.nan)
+        previous[1:] = close[:-1]
+        return previous
+
+    def get_limit_ratios(self) -> np.ndarray:
+        '''
+        return:
+            (dates x codes) daily price limit: 20% for STAR and ChiNext (10% before the reform),
+            30% for Beijing, 10% otherwise; ST stocks are not distinguished
+        '''
+        codes = self._codes.astype(str)
+        ratios = np.full((len(self._dates), len(codes)), 0.1)
+        star    = codes.str.startswith(("688", "689"))
+        chiNext = codes.str.startswith(("300", "301"))
+        beijing = codes.str.startswith(("4", "8", "92"))
+        ratios[:, star] = 0.2
+        ratios[np.ix_(self._dates >= self.ChiNextReform, chiNext)] = 0.2
+        ratios[:, beijing] = 0.3
+        return ratios
+
+    def get_limit_flags(self, field: str = "Open", tolerance: float = 0.002) -> tuple[np.ndarray, np.ndarray]:
+        '''
+        param:
+            field: price at which a trade would be executed
+            tolerance: slack of the change against the limit, prices are adjusted and rounded
+        return:
+            (dates x codes) boolean arrays: price at limit-up, price at limit-down
+        '''
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            change = self._prices[field] / self.get_previous_close() - 1.0
+        ratios = self.get_limit_ratios()
+        return change >= ratios - tolerance, change <= -ratios + tolerance
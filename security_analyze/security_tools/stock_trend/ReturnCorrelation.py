@@ -0,0 +1,162 @@
+import numpy as np
+import pandas as pd
+from .PricePanel import PricePanel
+
+
+class ReturnCorrelation(object):
+    '''
+    Rolling correlation of the daily returns of a universe and hierarchical clusters of it
+
+    Returns are close over previous close, 0 on days a code does not trade. The codes are split
+    into blocks, the cross products of each pair of blocks are kept over a rolling window and
+    updated by the days entering and leaving it between evaluation dates, so each pair costs
+    about one pass over the returns whatever the number of dates. Pairs of blocks are independent
+    and distributed over the processes, the result is filled block by block into an array that can
+    be a memory map, so a 5000 x 5000 universe does not need all matrices in memory.
+    '''
+
+    def __init__(self, returns: pd.DataFrame, window: int = 60, minPeriods: int = 40, blockSize: int = 512):
+        '''
+        param:
+            returns: (dates x codes) daily returns, NaN where a code does not trade
+            window: number of days of the rolling window
+            minPeriods: minimum number of trading days of a code in the window, NaN correlations otherwise
+            blockSize: number of codes of a block
+        '''
+        self._dates  = pd.DatetimeIndex(returns.index)
+        self._codes  = pd.Index(returns.columns)
+        values       = returns.to_numpy(dtype = np.float64)
+        self._traded = np.isfinite(values)
+        self._returns = np.where(self._traded, values, 0.0)
+        self._window = window
+        self._minPeriods = minPeriods
+        self._blockSize  = blockSize
+
+    @classmethod
+    def from_panel(cls, panel: PricePanel, **kwargs):
+        '''
+        param:
+            kwargs: options of the constructor
+        '''
+        close = panel.get_prices("Close")
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            returns = close / panel.get_previous_close() - 1
+        return cls(pd.DataFrame(returns, index = panel.get_dates(), columns = panel.get_codes()), **kwargs)
+
+    def get_dates(self) -> pd.DatetimeIndex:
+        return self._dates
+
+    def get_codes(self) -> pd.Index:
+        return self._codes
+
+    def get_evaluation_dates(self, step: int = 20) -> pd.DatetimeIndex:
+        '''
+        return:
+            every step-th date with a full window, ending on the last date
+        '''
+        ends = np.arange(len(self._dates) - 1, self._window - 2, -step)[::-1]
+        return self._dates[ends]
+
+    @staticmethod
+    def _compute_block(param) -> tuple:
+        '''
+        rolling correlation of the codes of block i with those of block j at the evaluation positions
+        '''
+        (i, j), X, Y, tradedX, tradedY, ends, window, minPeriods = param
+        result = np.empty((len(ends), X.shape[1], Y.shape[1]), dtype = np.float32)
+        csum = lambda a: np.concatenate([np.zeros((1, a.shape[1])), np.cumsum(a, axis = 0)])
+        sumX, sumY, sumXX, sumYY = csum(X), csum(Y), csum(X * X), csum(Y * Y)
+        countX, countY = csum(tradedX.astype(np.float64)), csum(tradedY.astype(np.float64))
+        S = np.zeros((X.shape[1], Y.shape[1]))
+        lo = hi = 0
+        for k, end in enumerate(ends):
+            newHi = end + 1
+            newLo = max(newHi - window, 0)
+            if newLo >= hi or (newHi - hi) + (newLo - lo) >= window:
+                S = X[newLo:newHi].T @ Y[newLo:newHi]
+            else:
+                # days entering and leaving the window
+                S += X[hi:newHi].T @ Y[hi:newHi]
+                S -= X[lo:newLo].T @ Y[lo:newLo]
+            lo, hi = newLo, newHi
+            n = hi - lo
+            meanX, meanY = (sumX[hi] - sumX[lo]) / n, (sumY[hi] - sumY[lo]) / n
+            varX, varY = (sumXX[hi] - sumXX[lo]) / n - meanX ** 2, (sumYY[hi] - sumYY[lo]) / n - meanY ** 2
+            with np.errstate(invalid = "ignore", divide = "ignore"):
+                corr = (S / n - np.outer(meanX, meanY)) / np.sqrt(np.outer(varX, varY))
+            enough = np.outer(countX[hi] - countX[lo] >= minPeriods, countY[hi] - countY[lo] >= minPeriods)
+            result[k] = np.where(enough & (np.outer(varX, varY) > 0), np.clip(corr, -1, 1), np.nan)
+        return (i, j), result
+
+    def compute(self, dates: pd.DatetimeIndex = None, nproc: int = 1, outPath: str = None) -> np.ndarray:
+        '''
+        param:
+            dates: evaluation dates, get_evaluation_dates() if None
+            nproc: number of processes, all cores if None
+            outPath: file of a float32 memory map holding the result, in memory if None
+        return:
+            (dates x codes x codes) float32 correlation matrices, NaN for codes without enough data
+        '''
+        dates = self.get_evaluation_dates() if dates is None else pd.DatetimeIndex(dates)
+        ends = self._dates.get_indexer(dates)
+        if (ends < 0).any():
+            raise ValueError("evaluation dates must be dates of the returns")
+        n = len(self._codes)
+        shape = (len(ends), n, n)
+        result = np.empty(shape, dtype = np.float32) if outPath is None else np.lib.format.open_memmap(outPath, mode = "w+", dtype = np.float32, shape = shape)
+        blocks = [slice(k, min(k + self._blockSize, n)) for k in range(0, n, self._blockSize)]
+        params = (((i, j), self._returns[:, blocks[i]], self._returns[:, blocks[j]], self._traded[:, blocks[i]], self._traded[:, blocks[j]],
+                   ends, self._window, self._minPeriods) for i in range(len(blocks)) for j in range(i, len(blocks)))
+        if nproc == 1:
+            computed = map(self._compute_block, params)
+            pool = None
+        else:
+            from multiprocessing import Pool
+            pool = Pool(nproc)
+            computed = pool.imap_unordered(self._compute_block, params)
+        try:
+            for (i, j), block in computed:
+                result[:, blocks[i], blocks[j]] = block
+                if i != j:
+                    result[:, blocks[j], blocks[i]] = block.transpose(0, 2, 1)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        if outPath is not None:
+            result.flush()
+        return result
+
+    @staticmethod
+    def cluster(matrix: np.ndarray, threshold: float = 0.5, method: str = "average") -> np.ndarray:
+        '''
+        hierarchical clustering on the distance 1 - correlation
+        param:
+            matrix: (codes x codes) correlation matrix
+            threshold: maximum distance within a cluster
+            method: linkage method of scipy.cluster.hierarchy
+        return:
+            (codes) cluster labels from 1, -1 for codes without correlations
+        '''
+        from scipy.cluster.hierarchy import fcluster, linkage
+        from scipy.spatial.distance import squareform
+
+        labels = np.full(len(matrix), -1)
+        defined = ~np.isnan(np.diagonal(matrix))
+        if defined.sum() < 2:
+            labels[defined] = 1
+            return labels
+        distance = 1 - np.nan_to_num(matrix[np.ix_(defined, defined)].astype(np.float64), nan = 0.0)
+        np.fill_diagonal(distance, 0)
+        tree = linkage(squareform(np.clip(distance, 0, 2), checks = False), method = method)
+        labels[defined] = fcluster(tree, threshold, criterion = "distance")
+        return labels
+
+    def get_cluster_labels(self, matrices: np.ndarray, dates: pd.DatetimeIndex, threshold: float = 0.5, method: str = "average") -> pd.DataFrame:
+        '''
+        param:
+            matrices, dates: result of compute and its evaluation dates
+        return:
+            (dates x codes) cluster labels, e.g. for Screener.add_indicator after reindexing and forward filling to the days
+        '''
+        return pd.DataFrame([self.cluster(matrix, threshold, method) for matrix in matrices], index = pd.DatetimeIndex(dates), columns = self._codes)
@@ -0,0 +1,203 @@
+import ast
+import re
+import numpy as np
+import pandas as pd
+from .DataAcquisitor import DataAcquisitor
+from .IndicatorSet import IndicatorSet
+from .SignalSweeper import SignalSweeper
+
+
+class Screener(object):
+    '''
+    Declarative screens over the indicator series of a universe
+
+    A screen is an expression over named indicators, e.g.
+        MA5_day > MA20_day & dMA60_week >= 0 & close < 0.98*max_week
+    evaluated on (dates x codes) arrays at once. & (and), | (or) and ~ (not) bind weaker than
+    comparisons, arithmetic, abs, minimum and maximum are supported. A screen and each negated part
+    of it are False where any indicator they refer to is undefined, e.g. ~(MA5_day > MA20_day) before
+    the 20th bar or on dates the code does not trade. Each indicator is computed once and shared by
+    every later screen of the Screener.
+
+    Indicators, period is day, week, month or hour:
+        close, close_<period>:        close of the last visible bar
+        MA<window>_<period>:          moving average of the close
+        dMA<window>_<period>[_<n>]:   finite difference of the moving average over n bars, default as DataAnalyzer
+        max_<period>:                 smoothed MA5 at its last local maximum
+        signal:                       signal of DataAnalyzer
+        <column>_<period>:            column of IndicatorSet, e.g. DIF_day > DEA_day & RSI6_week < 30 & close < LB20_day,
+                                      the columns of an expression are computed in one pass per code and period
+    more can be added to a Screener with register_indicator (per code) or add_indicator (precomputed matrix).
+    '''
+
+    _Period = "(day|week|month|hour)"
+    IndicatorSetPattern = rf"({IndicatorSet.get_pattern()})_{_Period}"
+    DefaultStencils = {"day": 1, "week": 1, "month": 1, "hour": 2}
+    # pattern -> function(sweeper, *groups) returning the indicator on the days of the sweeper
+    Indicators = {
+        rf"close(?:_{_Period})?": lambda sweeper, period: sweeper.get_close(period or "day"),
+        rf"MA(\d+)_{_Period}": lambda sweeper, window, period: sweeper.get_moving_average(period, int(window)),
+        rf"dMA(\d+)_{_Period}(?:_(\d+))?": lambda sweeper, window, period, stencil: sweeper.get_derivative(
+            period, int(window), int(stencil) if stencil else (1 if period == "hour" and int(window) >= 60 else Screener.DefaultStencils[period])),
+        rf"max_{_Period}": lambda sweeper, period: sweeper.get_last_maximum(period),
+        r"signal": lambda sweeper: sweeper.compute_signals().to_numpy(),
+        IndicatorSetPattern: lambda sweeper, column, *groups: sweeper.get_indicator(groups[-1], column),
+    }
+    Functions = {"abs": np.abs, "minimum": np.minimum, "maximum": np.maximum}
+
+    def __init__(self, sweepers: list[SignalSweeper]):
+        '''
+        param:
+            sweepers: SignalSweeper of each code of the universe
+        '''
+        self._sweepers = sweepers
+        self._codes = pd.Index([sweeper.get_code() for sweeper in sweepers])
+        dates = pd.DatetimeIndex([])
+        for sweeper in sweepers:
+            dates = dates.union(sweeper.get_dates())
+        self._dates = dates
+        self._rows = [dates.get_indexer(sweeper.get_dates()) for sweeper in sweepers]
+        self._indicators = {}
+        # registered indicators are kept per Screener, the class table is shared
+        self.Indicators = dict(self.Indicators)
+
+    @classmethod
+    def from_csv(cls, codes: list[str], beg: str, end: str, inDir: str, columns: list[str] = ["Close"]):
+        '''
+        param:
+            beg, end: date range of the data, moving averages need history before the screened dates
+            columns: columns loaded, IndicatorSet.Fields for the indicators of high, low or volume
+        '''
+        return cls([SignalSweeper(DataAcquisitor(code, beg, end, 1, inDir = inDir, columns = columns, compact = True)) for code in codes])
+
+    def register_indicator(self, pattern: str, function):
+        '''
+        param:
+            pattern: regular expression of the indicator names, its groups are passed to function
+            function: function(sweeper, *groups) returning the indicator on the days of the sweeper
+        '''
+        self.Indicators[pattern] = function
+
+    def add_indicator(self, name: str, values: pd.DataFrame):
+        '''
+        param:
+            values: (dates x codes) precomputed indicator, missing entries are NaN
+        '''
+        self._indicators[name] = values.reindex(index = self._dates, columns = self._codes).to_numpy(dtype = np.float64)
+
+    def get_dates(self) -> pd.DatetimeIndex:
+        return self._dates
+
+    def get_codes(self) -> pd.Index:
+        return self._codes
+
+    def get_indicator(self, name: str) -> np.ndarray:
+        '''
+        return:
+            (dates x codes) indicator, NaN where a code does not trade
+        '''
+        if name not in self._indicators:
+            pattern, match = self._match(name)
+            function = self.Indicators[pattern]
+            values = np.full((len(self._dates), len(self._codes)), np.nan)
+            for j, sweeper in enumerate(self._sweepers):
+                values[self._rows[j], j] = function(sweeper, *match.groups())
+            self._indicators[name] = values
+        return self._indicators[name]
+
+    def _match(self, name: str) -> tuple:
+        '''
+        return:
+            first pattern of Indicators matching the name and its match
+        '''
+        for pattern in self.Indicators:
+            match = re.fullmatch(pattern, name)
+            if match is not None:
+                return pattern, match
+        raise ValueError(f"unknown indicator {name}")
+
+    def _prepare_indicators(self, names: list[str]):
+        '''
+        compute the columns of IndicatorSet among the names together, per code and period
+        '''
+        columns = {}
+        for name in dict.fromkeys(names):
+            if name in self._indicators or name in self.Functions:
+                continue
+            pattern, match = self._match(name)
+            if pattern == self.IndicatorSetPattern:
+                columns.setdefault(match.groups()[-1], []).append(match.group(1))
+        for period, periodColumns in columns.items():
+            for sweeper in self._sweepers:
+                sweeper.compute_indicators(period, periodColumns)
+
+    def evaluate(self, expression: str) -> pd.DataFrame:
+        '''
+        return:
+            (dates x codes) boolean matrix of the screen, False where an indicator is undefined
+        '''
+        # the rewritten operators are padded with spaces, which must not lead the expression
+        tree = ast.parse(expression.replace("&", " and ").replace("|", " or ").replace("~", " not ").strip(), mode = "eval")
+        self._prepare_indicators([node.id for node in ast.walk(tree) if isinstance(node, ast.Name)])
+        result = np.logical_and(self._evaluate(tree.body), self._get_defined(tree.body))
+        if np.ndim(result) == 0:
+            result = np.full((len(self._dates), len(self._codes)), result)
+        return pd.DataFrame(np.asarray(result, dtype = bool), index = self._dates, columns = self._codes)
+
+    def _get_defined(self, node):
+        '''
+        return:
+            (dates x codes) mask where every indicator referenced in the node is finite, True without indicators
+        '''
+        defined = True
+        for name in ast.walk(node):
+            if isinstance(name, ast.Name) and name.id not in self.Functions:
+                defined = np.logical_and(defined, np.isfinite(self.get_indicator(name.id)))
+        return defined
+
+    def screen(self, expression: str, date: str = None) -> pd.Index:
+        '''
+        return:
+            codes passing the screen on the date, the last date if None
+        '''
+        matrix = self.evaluate(expression)
+        row = matrix.iloc[-1] if date is None else matrix.loc[pd.Timestamp(date)]
+        return self._codes[row.to_numpy()]
+
+    _Compare = {ast.Gt: np.greater, ast.GtE: np.greater_equal, ast.Lt: np.less, ast.LtE: np.less_equal,
+                ast.Eq: np.equal, ast.NotEq: np.not_equal}
+    _Arithmetic = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.divide, ast.Pow: np.power}
+
+    def _evaluate(self, node):
+        if isinstance(node, ast.BoolOp):
+            combine = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+            result = self._evaluate(node.values[0])
+            for value in node.values[1:]:
+                result = combine(result, self._evaluate(value))
+            return result
+        if isinstance(node, ast.UnaryOp):
+            operand = self._evaluate(node.operand)
+            if isinstance(node.op, ast.Not):
+                # a comparison with an undefined indicator is False, its negation must not be True
+                return np.logical_and(np.logical_not(operand), self._get_defined(node.operand))
+            return -operand if isinstance(node.op, ast.USub) else operand
+        if isinstance(node, ast.Compare):
+            left, result = self._evaluate(node.left), True
+            for op, comparator in zip(node.ops, node.comparators):
+                if type(op) not in self._Compare:
+                    raise ValueError(f"unsupported comparison {type(op).__name__}")
+                right = self._evaluate(comparator)
+                with np.errstate(invalid = "ignore"):
+                    result = np.logical_and(result, self._Compare[type(op)](left, right))
+                left = right
+            return result
+        if isinstance(node, ast.BinOp) and type(node.op) in self._Arithmetic:
+            with np.errstate(invalid = "ignore", divide = "ignore"):
+                return self._Arithmetic[type(node.op)](self._evaluate(node.left), self._evaluate(node.right))
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in self.Functions and not node.keywords:
+            return self.Functions[node.func.id](*[self._evaluate(arg) for arg in node.args])
+        if isinstance(node, ast.Name):
+            return self.get_indicator(node.id)
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return node.value
+        raise ValueError(f"unsupported expression {ast.unparse(node)}")
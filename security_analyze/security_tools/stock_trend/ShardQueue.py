@@ -0,0 +1,179 @@
+import threading
+import time
+from multiprocessing.managers import BaseManager
+
+
+class _QueueServer(BaseManager):
+    pass
+
+
+class _QueueClient(BaseManager):
+    pass
+
+
+class ShardQueue(object):
+    '''
+    Work queue of code shards shared by a coordinator and workers on other hosts
+
+    The coordinator splits the codes into shards, all with the same task, and serves the queue
+    over a socket with a multiprocessing manager. A worker leases a shard, renews the lease while
+    it runs and returns the result or the error. A shard whose lease expires, because its worker
+    died or lost the connection, or whose worker reported an error is dispatched again, until it
+    failed maxAttempts times. The first result of a shard is kept, late duplicates are ignored.
+    '''
+
+    def __init__(self, codes: list[str], task: dict, shardSize: int = 50, leaseSeconds: float = 120.0, maxAttempts: int = 3):
+        '''
+        param:
+            codes: codes of the universe
+            task: parameters of the work, sent to the workers with each shard
+            shardSize: number of codes of a shard
+            leaseSeconds: time after which a shard without renewal is dispatched again
+            maxAttempts: number of dispatches of a shard before it is given up
+        '''
+        codes = list(codes)
+        self._task   = task
+        self._shards = [codes[k : k + shardSize] for k in range(0, len(codes), shardSize)]
+        self._leaseSeconds = leaseSeconds
+        self._maxAttempts  = maxAttempts
+        self._pending  = list(range(len(self._shards)))
+        self._leases   = {}  # shard: (worker, deadline)
+        self._attempts = [0] * len(self._shards)
+        self._results  = {}
+        self._errors   = {}  # shard: last error
+        self._lock = threading.Lock()
+        self._server = None
+
+    def _expire(self):
+        now = time.monotonic()
+        for shard, (worker, deadline) in list(self._leases.items()):
+            if deadline < now:
+                del self._leases[shard]
+                self._errors[shard] = f"lease of {worker} expired"
+                self._release(shard)
+
+    def _release(self, shard: int):
+        if self._attempts[shard] < self._maxAttempts:
+            self._pending.append(shard)
+
+    def get_shard(self, worker: str):
+        '''
+        return:
+            (shard, task, codes) leased to the worker, None if no shard is pending now
+        '''
+        with self._lock:
+            self._expire()
+            if not self._pending:
+                return None
+            shard = self._pending.pop(0)
+            self._attempts[shard] += 1
+            self._leases[shard] = (worker, time.monotonic() + self._leaseSeconds)
+            return shard, self._task, self._shards[shard]
+
+    def renew(self, shard: int, worker: str) -> bool:
+        '''
+        return:
+            whether the worker still holds the lease of the shard
+        '''
+        with self._lock:
+            if self._leases.get(shard, (None,))[0] != worker:
+                return False
+            self._leases[shard] = (worker, time.monotonic() + self._leaseSeconds)
+            return True
+
+    def put_result(self, shard: int, worker: str, result):
+        with self._lock:
+            if shard in self._results:
+                return
+            self._results[shard] = result
+            self._errors.pop(shard, None)
+            if shard in self._pending:
+                self._pending.remove(shard)
+            self._leases.pop(shard, None)
+
+    def put_error(self, shard: int, worker: str, error: str):
+        with self._lock:
+            if shard in self._results or self._leases.get(shard, (None,))[0] != worker:
+                return
+            del self._leases[shard]
+            self._errors[shard] = f"{worker}: {error}"
+            self._release(shard)
+
+    def is_finished(self) -> bool:
+        '''
+        return:
+            whether every shard has a result or has been given up
+        '''
+        with self._lock:
+            self._expire()
+            return not self._pending and not self._leases
+
+    def get_progress(self) -> tuple[int, int, int]:
+        '''
+        return:
+            number of shards done, given up and in total
+        '''
+        with self._lock:
+            failed = sum(1 for shard in self._errors if shard not in self._pending and shard not in self._leases)
+            return len(self._results), failed, len(self._shards)
+
+    def get_results(self) -> list:
+        '''
+        return:
+            results in the order of the shards
+        '''
+        with self._lock:
+            return [self._results[shard] for shard in sorted(self._results)]
+
+    def get_failed(self) -> dict:
+        '''
+        return:
+            {code: last error} of the shards given up
+        '''
+        with self._lock:
+            return {code: error for shard, error in self._errors.items()
+                    if shard not in self._results and shard not in self._pending and shard not in self._leases
+                    for code in self._shards[shard]}
+
+    def serve(self, address: tuple, authkey: bytes):
+        '''
+        serve the queue in a background thread of this process
+        param:
+            address: (host, port) listened on, port 0 for any free port
+            authkey: key shared with the workers, required since the manager unpickles what it receives
+        return:
+            address actually listened on
+        '''
+        if not authkey:
+            raise ValueError("authkey is required to serve the queue")
+        _QueueServer.register("get_queue", callable = lambda: self,
+                              exposed = ["get_shard", "renew", "put_result", "put_error", "is_finished"])
+        self._server = _QueueServer(address = address, authkey = authkey).get_server()
+        threading.Thread(target = self._server.serve_forever, daemon = True).start()
+        return self._server.address
+
+    def stop(self):
+        if self._server is not None:
+            self._server.stop_event.set()
+            self._server = None
+
+    @staticmethod
+    def connect(address: tuple, authkey: bytes, retries: int = 5, wait: float = 2.0):
+        '''
+        param:
+            address: (host, port) of the coordinator
+            authkey: key shared with the coordinator
+            retries: number of further attempts if the coordinator is not reachable
+        return:
+            proxy of the queue of the coordinator
+        '''
+        _QueueClient.register("get_queue")
+        for attempt in range(retries + 1):
+            try:
+                manager = _QueueClient(address = address, authkey = authkey)
+                manager.connect()
+                return manager.get_queue()
+            except ConnectionError:
+                if attempt == retries:
+                    raise
+                time.sleep(wait)
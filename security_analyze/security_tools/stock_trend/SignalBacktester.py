@@ -0,0 +1,165 @@
+import numpy as np
+import pandas as pd
+from .DataAnalyzer import DataAnalyzer
+from .PricePanel import PricePanel
+
+
+class SignalBacktester(object):
+    '''
+    Vectorized long-only backtest of the trend signals over a universe
+
+    Signals are decided at the close of a day and executed at the open ("open") of the next
+    trading day or at the close of the same day ("close"). Entry signals open a position,
+    exit signals close it and every other signal keeps the previous state, so the target
+    positions are the forward-filled event matrix. A trade is skipped, and retried on the next
+    day, if the code does not trade or is at limit-up (buy) or limit-down (sell) at the
+    execution price; a position is held at least minHoldingDays trading days, which enforces
+    T+1 settlement. Held positions are equally weighted, capped at maxWeight, rest in cash.
+    '''
+
+    Entries = [DataAnalyzer.RISING_LONG_NEW, DataAnalyzer.RISING_LONG_MID]
+    Exits   = [DataAnalyzer.SELL, DataAnalyzer.EMPTY]
+
+    def __init__(self, signals: pd.DataFrame, panel: PricePanel, entries: list[int] = Entries, exits: list[int] = Exits,
+                 execution: str = "open", minHoldingDays: int = 1, maxWeight: float = 0.05, cost: float = 0.0015):
+        '''
+        param:
+            signals: (dates x codes) signals of DataAnalyzer, NaN where no signal was computed
+            panel: PricePanel of the universe
+            entries, exits: signals opening and closing a position
+            execution: "open" - next open, "close" - same close
+            minHoldingDays: minimum number of trading days between buying and selling, 1 for T+1
+            maxWeight: maximum weight of a position
+            cost: cost per unit of turnover, e.g. commission and stamp tax
+        '''
+        if execution not in ["open", "close"]:
+            raise ValueError(f"unsupported execution {execution}, expected open or close")
+        self._panel          = panel
+        self._signals        = signals.reindex(index = panel.get_dates(), columns = panel.get_codes())
+        self._entries        = entries
+        self._exits          = exits
+        self._execution      = execution
+        self._minHoldingDays = minHoldingDays
+        self._maxWeight      = maxWeight
+        self._cost           = cost
+        self._positions      = None
+        self._weights        = None
+
+    @staticmethod
+    def read_signal_reports(outDir: str, outPrefix: str) -> pd.DataFrame:
+        '''
+        return:
+            (dates x codes) 购买信号 of the reports {outPrefix}_{YYYYMMDD}.csv saved by save_signal_report
+        '''
+        import glob
+        import os
+        signals = {}
+        for path in sorted(glob.glob(f"{outDir}/{outPrefix}_" + "[0-9]" * 8 + ".csv")):
+            date = pd.Timestamp(os.path.basename(path)[len(outPrefix) + 1 : -4])
+            report = pd.read_csv(path, dtype = {"股票代码": str}, index_col = "股票代码")
+            signals[date] = report["购买信号"]
+        return pd.DataFrame(signals).T.sort_index()
+
+    def _get_targets(self) -> np.ndarray:
+        '''
+        return:
+            (dates x codes) target position decided at each close, the forward-filled event matrix
+        '''
+        signals = self._signals.to_numpy(dtype = np.float64)
+        events = np.full(signals.shape, np.nan)
+        events[np.isin(signals, self._entries)] = 1.0
+        events[np.isin(signals, self._exits)] = 0.0
+        return pd.DataFrame(events).ffill().fillna(0.0).to_numpy(dtype = bool)
+
+    def _get_executable(self) -> tuple[np.ndarray, np.ndarray]:
+        '''
+        return:
+            (dates x codes) whether buying, selling is possible at the execution of the decision of each day
+        '''
+        limitUp, limitDown = self._panel.get_limit_flags("Open" if self._execution == "open" else "Close")
+        traded = ~np.isnan(self._panel.get_prices("Open" if self._execution == "open" else "Close"))
+        canBuy, canSell = traded & ~limitUp, traded & ~limitDown
+        if self._execution == "open":
+            # the decision of day t is executed on day t + 1, never on the last day
+            shift = lambda a: np.vstack([a[1:], np.zeros((1, a.shape[1]), dtype = bool)])
+            canBuy, canSell = shift(canBuy), shift(canSell)
+        return canBuy, canSell
+
+    def run(self) -> pd.DataFrame:
+        '''
+        return:
+            daily 收益率, 净值, 回撤, 换手率 and 持仓数, indexed by date
+        '''
+        targets = self._get_targets()
+        canBuy, canSell = self._get_executable()
+        nDates, nCodes = targets.shape
+        # positions after executing the decision of each day; the recurrence is sequential in time only
+        positions = np.zeros((nDates, nCodes), dtype = bool)
+        held = np.zeros(nCodes, dtype = bool)
+        since = np.zeros(nCodes, dtype = np.int64)
+        for t in range(nDates):
+            buy  = targets[t] & ~held & canBuy[t]
+            sell = ~targets[t] & held & canSell[t] & (t - since >= self._minHoldingDays)
+            held = (held | buy) & ~sell
+            since[buy] = t
+            positions[t] = held
+
+        count = positions.sum(axis = 1, keepdims = True)
+        weights = np.where(positions, np.minimum(1.0 / np.maximum(count, 1), self._maxWeight), 0.0)
+        self._positions, self._weights = positions, weights
+
+        close = self._panel.get_prices("Close")
+        previous = self._panel.get_previous_close()
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            if self._execution == "open":
+                # weights set at the open of day t + 1: old weights overnight, new weights intraday
+                openPrice = self._panel.get_prices("Open")
+                overnight = np.nan_to_num(openPrice / previous - 1.0)
+                intraday  = np.nan_to_num(close / openPrice - 1.0)
+                before = np.vstack([np.zeros((2, nCodes)), weights[:-2]])
+                after  = np.vstack([np.zeros((1, nCodes)), weights[:-1]])
+                returnsBefore = (before * overnight).sum(axis = 1)
+                returns = (1.0 + returnsBefore) * (1.0 + (after * intraday).sum(axis = 1)) - 1.0
+                drift = before * (1.0 + overnight) / (1.0 + returnsBefore)[:, None]
+            else:
+                change = np.nan_to_num(close / previous - 1.0)
+                before = np.vstack([np.zeros((1, nCodes)), weights[:-1]])
+                returns = (before * change).sum(axis = 1)
+                # weights of the previous close, drifted over the day, against the weights set at this close
+                drift = before * (1.0 + change) / (1.0 + returns)[:, None]
+                after = weights
+        turnover = np.abs(after - drift).sum(axis = 1)
+        returns = returns - self._cost * turnover
+
+        nav = np.cumprod(1.0 + returns)
+        result = pd.DataFrame({"收益率": returns, "净值": nav, "回撤": nav / np.maximum.accumulate(nav) - 1.0,
+                               "换手率": turnover, "持仓数": positions.sum(axis = 1)}, index = self._panel.get_dates())
+        return result
+
+    def get_positions(self) -> pd.DataFrame:
+        '''
+        return:
+            (dates x codes) held after executing the decision of each day, after run()
+        '''
+        return pd.DataFrame(self._positions, index = self._panel.get_dates(), columns = self._panel.get_codes())
+
+    def get_weights(self) -> pd.DataFrame:
+        return pd.DataFrame(self._weights, index = self._panel.get_dates(), columns = self._panel.get_codes())
+
+    @staticmethod
+    def summarize(result: pd.DataFrame, periodsPerYear: int = 244) -> pd.Series:
+        '''
+        param:
+            result: DataFrame returned by run()
+            periodsPerYear: trading days per year
+        return:
+            total and annualized return, volatility, Sharpe ratio, maximum drawdown and annual turnover
+        '''
+        returns = result["收益率"]
+        years = len(returns) / periodsPerYear
+        volatility = returns.std() * np.sqrt(periodsPerYear)
+        annual = result["净值"].iloc[-1] ** (1.0 / years) - 1.0 if years > 0 else np.nan
+        return pd.Series({"总收益": result["净值"].iloc[-1] - 1.0, "年化收益": annual, "年化波动": volatility,
+                          "夏普比率": returns.mean() * periodsPerYear / volatility if volatility > 0 else np.nan,
+                          "最大回撤": result["回撤"].min(), "年化换手": result["换手率"].sum() / years if years > 0 else np.nan,
+                          "平均持仓数": result["持仓数"].mean()})
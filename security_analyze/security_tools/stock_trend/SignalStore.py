@@ -0,0 +1,155 @@
+import os
+import sqlite3
+import pandas as pd
+
+
+class SignalStore(object):
+    '''
+    SQLite store of the daily signal reports, one row per (code, date)
+
+    Dates are stored as YYYYMMDD strings. The primary key indexes the history of a code,
+    a second index on the date serves the queries over one day.
+    '''
+
+    Columns = {"股票简称": "name", "行情地址": "url", "购买信号": "signal", "网络预测": "prediction", "备注": "note"}
+
+    def __init__(self, path: str):
+        '''
+        param:
+            path: path to the SQLite database, created if it does not exist
+        '''
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._connection = sqlite3.connect(path)
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS signals (
+                code TEXT NOT NULL, date TEXT NOT NULL, name TEXT, url TEXT,
+                signal INTEGER, prediction REAL, note TEXT NOT NULL DEFAULT '',
+                PRIMARY KEY (code, date));
+            CREATE INDEX IF NOT EXISTS signals_date ON signals (date);
+            """)
+
+    def close(self):
+        self._connection.close()
+
+    def record(self, date: str, report: pd.DataFrame):
+        '''
+        insert or replace the signals of a day, notes already stored for that day are kept if the report has none
+        param:
+            date: YYYYMMDD
+            report: indexed by 股票代码, with 股票简称, 行情地址, 购买信号 and optionally 网络预测 and 备注
+        '''
+        rows = []
+        for code, row in report.iterrows():
+            prediction = row.get("网络预测")
+            note = row.get("备注")
+            rows.append((code, date, row["股票简称"], row["行情地址"], int(row["购买信号"]),
+                         None if pd.isnull(prediction) else float(prediction), "" if pd.isnull(note) else str(note)))
+        with self._connection:
+            self._connection.executemany(
+                """
+                INSERT INTO signals (code, date, name, url, signal, prediction, note) VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (code, date) DO UPDATE SET name = excluded.name, url = excluded.url, signal = excluded.signal,
+                    prediction = excluded.prediction, note = CASE WHEN excluded.note != '' THEN excluded.note ELSE note END
+                """, rows)
+
+    def set_note(self, code: str, date: str, note: str):
+        with self._connection:
+            self._connection.execute("UPDATE signals SET note = ? WHERE code = ? AND date = ?", (note, code, date))
+
+    def import_notes(self, path: str, date: str) -> int:
+        '''
+        take over the 备注 edited in an exported report, a note emptied in the report is cleared
+        return:
+            number of notes imported
+        '''
+        report = pd.read_csv(path, dtype = {"股票代码": str, "备注": str}, usecols = ["股票代码", "备注"]).fillna({"备注": ""})
+        with self._connection:
+            self._connection.executemany("UPDATE signals SET note = ? WHERE code = ? AND date = ?",
+                                         [(note, code, date) for code, note in zip(report["股票代码"], report["备注"])])
+        return len(report)
+
+    def import_report(self, path: str, date: str):
+        '''
+        ingest a report saved as CSV by save_signal_report, e.g. to migrate the dated CSV files
+        '''
+        report = pd.read_csv(path, dtype = {"股票代码": str, "备注": str}).set_index("股票代码")
+        self.record(date, report)
+
+    def get_dates(self) -> list[str]:
+        return [date for (date,) in self._connection.execute("SELECT DISTINCT date FROM signals ORDER BY date")]
+
+    def get_previous_date(self, date: str) -> str:
+        '''
+        return:
+            last stored date before date, None if there is none
+        '''
+        return self._connection.execute("SELECT MAX(date) FROM signals WHERE date < ?", (date,)).fetchone()[0]
+
+    def get_previous_dates(self, date: str, count: int) -> list[str]:
+        '''
+        return:
+            last count stored dates before date, the latest first, fewer if there are not enough
+        '''
+        return [previous for (previous,) in self._connection.execute(
+            "SELECT DISTINCT date FROM signals WHERE date < ? ORDER BY date DESC LIMIT ?", (date, count))]
+
+    def get_history(self, code: str, beg: str = None, end: str = None) -> pd.DataFrame:
+        '''
+        return:
+            signal, prediction and note of the code, indexed by date
+        '''
+        return pd.read_sql_query("SELECT date, signal, prediction, note FROM signals WHERE code = ? AND date BETWEEN ? AND ? ORDER BY date",
+                                 self._connection, params = (code, beg or "", end or "99999999"), index_col = "date")
+
+    def get_signals(self, date: str) -> pd.DataFrame:
+        '''
+        return:
+            stored report of the day, indexed by 股票代码
+        '''
+        df = pd.read_sql_query("SELECT code, name, url, signal, prediction, note FROM signals WHERE date = ?",
+                               self._connection, params = (date,), index_col = "code")
+        return df.rename(columns = {value: key for key, value in self.Columns.items()}).rename_axis("股票代码")
+
+    def get_changed(self, date: str) -> pd.DataFrame:
+        '''
+        return:
+            codes whose signal on date differs from the previous stored date, with both signals
+        '''
+        return pd.read_sql_query(
+            """
+            SELECT t.code AS 股票代码, t.name AS 股票简称, p.signal AS 上期信号, t.signal AS 购买信号
+            FROM signals t JOIN signals p ON p.code = t.code AND p.date = (SELECT MAX(date) FROM signals WHERE date < ?)
+            WHERE t.date = ? AND t.signal != p.signal ORDER BY t.signal DESC, t.code
+            """, self._connection, params = (date, date), index_col = "股票代码")
+
+    def get_notes(self, date: str) -> pd.Series:
+        '''
+        return:
+            note of each code stored on date, indexed by 股票代码
+        '''
+        df = pd.read_sql_query("SELECT code, note FROM signals WHERE date = ?", self._connection, params = (date,), index_col = "code")
+        return df["note"].rename_axis("股票代码")
+
+    def export_csv(self, date: str, path: str) -> pd.DataFrame:
+        '''
+        export the report of a day in the layout of save_signal_report: signals of the two previous
+        stored dates and the notes of the previous date
+        '''
+        report = self.get_signals(date)
+        previous = self.get_previous_date(date)
+        beforePrevious = self.get_previous_date(previous) if previous is not None else None
+        df = report[["股票简称", "行情地址"]].copy()
+        df["购买信号"] = report["购买信号"]
+        if report["网络预测"].notna().any():
+            df["网络预测"] = report["网络预测"]
+        df["上期信号"] = self.get_signals(previous)["购买信号"] if previous is not None else pd.NA
+        df["上上期信号"] = self.get_signals(beforePrevious)["购买信号"] if beforePrevious is not None else pd.NA
+        df["上期备注"] = self.get_notes(previous) if previous is not None else ""
+        df["备注"] = report["备注"]
+        df = df.fillna({"上期备注": "", "备注": ""})
+        df.sort_values(by = ["购买信号", "上期信号", "上上期信号", "股票代码"], axis = 0, ascending = False, inplace = True)
+        df.to_csv(path)
+        return df
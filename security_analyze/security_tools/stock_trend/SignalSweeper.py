@@ -0,0 +1,282 @@
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from .DataAcquisitor import DataAcquisitor
+from .DataAnalyzer import DataAnalyzer
+from .IndicatorSet import IndicatorSet
+
+
+class SignalSweeper(object):
+    '''
+    Signal history of one stock for any choice of MA windows, derivative stencils and thresholds
+
+    The closing prices of each period are kept as cumulative sums, so the moving average of any
+    window at any date is one difference, and the rules of DataAnalyzer._get_signal_hardcoded are
+    evaluated for all days at once. At day t every period sees the bars dated up to the close of t,
+    as DataAnalyzer does on data truncated at t; with DefaultParameters the signals are those of
+    DataAnalyzer.get_signal on every day, except where a moving average lies exactly on a tie of
+    the rounding to cents: the sums here are exact, while np.convolve breaks such ties by round-off.
+    With partial, the week and month seen at day t end with the unfinished bar closing at the close
+    of t, as a fetch on day t returns it and DataAcquisitor.get_as_of(t, partial = True) builds it;
+    the columns of IndicatorSet are still taken at the last complete bar.
+    '''
+
+    Periods = ["day", "week", "month", "hour"]
+    DefaultParameters = {"short": 5, "mid": 20, "long": 60,           # windows of _check_MA_trend and of the regime
+                         "monthWindows": (10, 20, 60),                # month windows classifying the rising trend
+                         "dayStencil": 1,                             # stencil of the day, week and month derivatives
+                         "hourStencil": 2, "hourLongStencil": 1,      # stencils of the short/mid and long hour derivatives
+                         "threshold": 0.0,                            # threshold of the derivatives of the regime
+                         "lucidity": True, "lucidityRatios": (0.98, 0.94), # "terminal lucidity" rule and its ratios to the last maxima
+                         "priceLimit": 9999.0}
+    # prices are summed as integers of this unit, so the cumulative sums are exact
+    PriceScale = 1000
+
+    def __init__(self, dataAcquired: DataAcquisitor, partial: bool = False):
+        '''
+        param:
+            dataAcquired: DataAcquisitor containing the stock data, as DataFrames or compact KLineBars
+            partial: the week and month seen at each day end with the unfinished bar of that day
+        '''
+        self._code = dataAcquired.get_code()
+        kHistories = dict(zip(self.Periods, [dataAcquired.get_day_k(), dataAcquired.get_week_k(),
+                                             dataAcquired.get_month_k(), dataAcquired.get_hour_k()]))
+        dayK = kHistories["day"]
+        self._dates = dayK.index if len(dayK) and dayK.index[0] != pd.Timestamp.min else pd.DatetimeIndex([])
+        self._close = {}
+        self._csum = {}
+        self._positions = {}
+        alignment = dataAcquired.get_alignment()
+        for period, kHistory in kHistories.items():
+            close = kHistory["Close"].to_numpy(dtype = np.float64) if len(self._dates) else np.array([])
+            self._close[period] = close
+            self._csum[period] = np.concatenate([[0.0], np.cumsum(np.rint(close * self.PriceScale))])
+            # last bar of the period visible at the close of each day
+            self._positions[period] = alignment.get_positions("day", period).astype(np.int64) if len(self._dates) else np.array([], dtype = np.int64)
+        # days after the last complete week or month bar see the unfinished bar, whose close is the close of the day
+        self._partial = {}
+        for period in self.Periods:
+            pos = self._positions[period]
+            if partial and period in ["week", "month"] and len(self._dates):
+                ticks = kHistories[period].index.to_numpy(dtype = "datetime64[D]")
+                self._partial[period] = (pos < 0) | (ticks[np.maximum(pos, 0)] != self._dates.to_numpy(dtype = "datetime64[D]"))
+            else:
+                self._partial[period] = np.zeros(len(pos), dtype = bool)
+        # a day is valid if every period has data, otherwise DataAnalyzer sees an empty table
+        self._valid = np.all([self._get_last(period) >= 0 for period in self.Periods], axis = 0) if len(self._dates) else np.array([], dtype = bool)
+        self._kHistories = kHistories
+        self._MA = {}
+        self._derivative = {}
+        self._lastMaximum = {}
+        # (period, column) -> column of IndicatorSet on the bars of the period
+        self._indicators = {}
+
+    def get_code(self) -> str:
+        return self._code
+
+    def get_dates(self) -> pd.DatetimeIndex:
+        return self._dates
+
+    def _get_last(self, period: str) -> np.ndarray:
+        '''
+        return:
+            (days) position of the last bar of the period visible at each day, the unfinished bar one after the complete bars
+        '''
+        return self._positions[period] + self._partial[period]
+
+    def get_close(self, period: str) -> np.ndarray:
+        '''
+        return:
+            (days) close of the last bar of the period visible at each day, NaN before the first bar
+        '''
+        pos = self._positions[period]
+        close = np.where(pos >= 0, self._close[period][np.maximum(pos, 0)] if len(self._close[period]) else np.nan, np.nan)
+        return np.where(self._partial[period], self._close["day"][np.maximum(self._positions["day"], 0)] if len(self._dates) else np.nan, close)
+
+    def get_moving_average(self, period: str, window: int, lag: int = 0) -> np.ndarray:
+        '''
+        param:
+            period: day, week, month or hour
+            window: window of the moving average
+            lag: number of bars before the last visible bar
+        return:
+            (days) moving average rounded as in DataAnalyzer, NaN without enough bars
+        '''
+        key = (period, window, lag)
+        if key not in self._MA:
+            last = self._get_last(period) - lag
+            csum = self._csum[period]
+            # the unfinished bar is not in the cumulative sums, it is added to the complete bars before it
+            partial = self._partial[period] & (lag == 0)
+            dayClose = self._close["day"][np.maximum(self._positions["day"], 0)] if len(self._dates) else np.zeros(0)
+            total = csum[np.maximum(last + 1 - partial, 0)] - csum[np.maximum(last + 1 - window, 0)] + np.where(partial, np.rint(dayClose * self.PriceScale), 0)
+            self._MA[key] = np.where(last >= window - 1, (total / (window * self.PriceScale)).round(decimals = 2), np.nan)
+        return self._MA[key]
+
+    def get_derivative(self, period: str, window: int, stencil: int) -> np.ndarray:
+        '''
+        return:
+            (days) finite difference of the moving average as in DataAnalyzer, 0 without enough bars
+        '''
+        key = (period, window, stencil)
+        if key not in self._derivative:
+            derivative = np.round((self.get_moving_average(period, window) - self.get_moving_average(period, window, stencil)) / stencil, 3)
+            # DataAnalyzer falls back to 0 if the moving average is shorter than stencil + 1
+            enough = self._get_last(period) - stencil >= window - 1
+            self._derivative[key] = np.where(enough, derivative, 0.0)
+        return self._derivative[key]
+
+    def compute_indicators(self, period: str, columns: list[str]):
+        '''
+        compute the indicators giving the columns in one pass over the bars of the period
+        param:
+            columns: columns of IndicatorSet, e.g. ["DIF", "K", "UB20"], the data must have the fields they need
+        '''
+        names = list(dict.fromkeys(IndicatorSet.get_indicator(column) for column in columns if (period, column) not in self._indicators))
+        if names:
+            indicators = IndicatorSet(names)
+            kHistory = self._kHistories[period]
+            computed = indicators.compute(kHistory) if len(self._dates) else {column: np.array([]) for column in indicators.get_columns()}
+            for column, values in computed.items():
+                self._indicators[(period, column)] = values
+
+    def get_indicator(self, period: str, column: str) -> np.ndarray:
+        '''
+        return:
+            (days) column of IndicatorSet at the last bar of the period visible at each day, NaN before the first bar
+        '''
+        self.compute_indicators(period, [column])
+        values = self._indicators[(period, column)]
+        pos = self._positions[period]
+        return np.where(pos >= 0, values[np.maximum(pos, 0)] if len(values) else np.nan, np.nan)
+
+    def get_last_maximum(self, period: str) -> np.ndarray:
+        '''
+        return:
+            (days) smoothed MA5 at its last local maximum, as DataAnalyzer.compute_historical_maximum_closest_to_today
+            on the data truncated at each day, 10000 if there is none
+        '''
+        if period not in self._lastMaximum:
+            window, half = DataAnalyzer.SGWindow, DataAnalyzer.SGWindow // 2
+            csum = self._csum[period]
+            MA5 = ((csum[5:] - csum[:-5]) / (5 * self.PriceScale)).round(decimals = 2)
+            # number of MA5 points visible at each day, days seeing the same bars share the result
+            n, days = np.unique(self._positions[period] + 1 - 4, return_inverse = True)
+            result = np.full(len(n), 10000.0)
+            smoothed = []
+            if len(MA5) >= window:
+                for deriv in [0, 1]:
+                    coeffs, edge = DataAnalyzer._get_savgol_operators(window, deriv)
+                    # points up to n - half - 1 are the same on the whole series and on the first n points
+                    whole = np.concatenate([edge[:half] @ MA5[:window], np.convolve(MA5, coeffs, mode = "valid"),
+                                            edge[window - half:] @ MA5[-window:]])
+                    # the last half + 1 points of the first n points, fitted on their last window
+                    tail = sliding_window_view(MA5, window)[np.clip(n - window, 0, None)] @ edge[window - half - 1:].T
+                    smoothed.append((whole, tail))
+                (MA5Smoothed, MA5Tail), (dMA5, dMA5Tail) = smoothed
+                # last maximum before the end edge
+                isMaximum = (dMA5[:-1] > 0) & (dMA5[1:] < 0)
+                last = np.maximum.accumulate(np.where(isMaximum, np.arange(len(isMaximum)), -1))
+                before = last[np.clip(n - half - 2, 0, len(last) - 1)]
+                before = np.where(n - half - 2 >= 0, before, -1)
+                # last maximum in the end edge
+                isMaximumTail = (dMA5Tail[:, :-1] > 0) & (dMA5Tail[:, 1:] < 0)
+                lastTail = half - 1 - np.argmax(isMaximumTail[:, ::-1], axis = 1)
+                result = np.where(isMaximumTail.any(axis = 1), MA5Tail[np.arange(len(n)), lastTail],
+                                  np.where(before >= 0, MA5Smoothed[np.maximum(before, 0)], 10000.0))
+                result[n < window] = 10000.0
+            result = result[days]
+            partial = np.flatnonzero(self._partial[period] & (self._get_last(period) + 1 - 4 >= window))
+            if len(partial):
+                result[partial] = self._get_last_maximum_partial(period, partial, MA5, smoothed)
+            self._lastMaximum[period] = result
+        return self._lastMaximum[period]
+
+    def _get_last_maximum_partial(self, period: str, days: np.ndarray, MA5: np.ndarray, smoothed: list) -> np.ndarray:
+        '''
+        get_last_maximum at days seeing an unfinished bar, whose MA5 ends the last window instead of the complete bar
+        param:
+            days: days seeing an unfinished bar and at least SGWindow MA5 points
+            MA5, smoothed: MA5 of the complete bars, its smoothed values and derivatives as in get_last_maximum
+        '''
+        window, half = DataAnalyzer.SGWindow, DataAnalyzer.SGWindow // 2
+        n = self._get_last(period)[days] + 1 - 4
+        last = MA5[np.clip(n[:, None] - window + np.arange(window), 0, len(MA5) - 1)]
+        last[:, -1] = self.get_moving_average(period, 5)[days]
+        local = []
+        for deriv, (whole, _) in zip([0, 1], smoothed or [(None, None)] * 2):
+            # the last window fitted on itself, its first half points are interior points of the whole series unless it is the whole series
+            points = last @ DataAnalyzer._get_savgol_operators(window, deriv)[1].T
+            if whole is not None:
+                points[:, :half] = np.where((n > window)[:, None], whole[np.clip(n[:, None] - window + np.arange(half), 0, len(whole) - 1)], points[:, :half])
+            local.append(points)
+        MA5Local, dMA5Local = local
+        isMaximumLocal = (dMA5Local[:, :-1] > 0) & (dMA5Local[:, 1:] < 0)
+        lastLocal = window - 2 - np.argmax(isMaximumLocal[:, ::-1], axis = 1)
+        if smoothed:
+            (MA5Smoothed, _), (dMA5, _) = smoothed
+            isMaximum = (dMA5[:-1] > 0) & (dMA5[1:] < 0)
+            lastBefore = np.maximum.accumulate(np.where(isMaximum, np.arange(len(isMaximum)), -1))
+            before = np.where(n - window - 1 >= 0, lastBefore[np.clip(n - window - 1, 0, len(lastBefore) - 1)], -1)
+            beforeValue = np.where(before >= 0, MA5Smoothed[np.maximum(before, 0)], 10000.0)
+        else:
+            beforeValue = np.full(len(days), 10000.0)
+        return np.where(isMaximumLocal.any(axis = 1), MA5Local[np.arange(len(days)), lastLocal], beforeValue)
+
+    def _check_MA_trend(self, length: str, p: dict) -> np.ndarray:
+        '''
+        vectorized DataAnalyzer._check_MA_trend, NaN where it falls through to the rising trend
+        '''
+        price = self._close["day"][np.maximum(self._positions["day"], 0)]
+        if length == "short":
+            period, stencils = "hour", (p["hourStencil"], p["hourStencil"], p["hourLongStencil"])
+        else:
+            period, stencils = "day", (p["dayStencil"],) * 3
+        MAShort, MAMid, MALong = [self.get_moving_average(period, p[w]) for w in ["short", "mid", "long"]]
+        dShort, dMid, dLong = [self.get_derivative(period, p[w], s) for w, s in zip(["short", "mid", "long"], stencils)]
+        falling = (MAShort < MALong) & (dShort < 0)
+        downturn = (MAShort < MAMid) & (dMid < 0)
+        belowMid = price < MAMid
+        if length == "short":
+            return np.select([falling & (dLong < 0), falling, downturn, belowMid],
+                             [DataAnalyzer.EMPTY, DataAnalyzer.SELL, DataAnalyzer.SELL, DataAnalyzer.SPECULATE], np.nan)
+        short = self._check_MA_trend("short", p)
+        short = np.where(np.isnan(short), DataAnalyzer.RISING_SHORT, short)
+        month = [self.get_moving_average("month", w) for w in p["monthWindows"]]
+        rising = np.select([month[1] >= month[2], month[0] >= month[1]], [DataAnalyzer.RISING_LONG_OLD, DataAnalyzer.RISING_LONG_MID],
+                           DataAnalyzer.RISING_LONG_NEW)
+        # below the mid MA the long check is decided by the short check, which reports a short-term rise
+        return np.select([falling & (dLong < 0), falling, downturn, belowMid & (short <= 0), belowMid],
+                         [DataAnalyzer.EMPTY, DataAnalyzer.SELL, DataAnalyzer.SELL, DataAnalyzer.SPECULATE, DataAnalyzer.RISING_SHORT],
+                         rising)
+
+    def compute_signals(self, parameters: dict = None, beg: str = None, end: str = None) -> pd.Series:
+        '''
+        param:
+            parameters: overrides of DefaultParameters
+            beg, end: date range of the signals
+        return:
+            signal of every day, NaN where a period has no data yet
+        '''
+        p = {**self.DefaultParameters, **(parameters or {})}
+        price = self._close["day"][np.maximum(self._positions["day"], 0)] if len(self._dates) else np.array([])
+        threshold = p["threshold"]
+        dDay   = self.get_derivative("day", p["mid"], p["dayStencil"])
+        dWeek  = self.get_derivative("week", p["mid"], p["dayStencil"])
+        dMonth = self.get_derivative("month", p["mid"], p["dayStencil"])
+        short = self._check_MA_trend("short", p)
+        short = np.where(np.isnan(short), DataAnalyzer.RISING_SHORT, short)
+        longTerm = self._check_MA_trend("long", p)
+        if p["lucidity"]:
+            # potential "terminal lucidity"
+            high, low = p["lucidityRatios"]
+            lucid = price < high * np.minimum(self.get_last_maximum("week"), self.get_last_maximum("month"))
+            longTerm = np.where(lucid, np.where(price >= low * self.get_last_maximum("day"), DataAnalyzer.RISING_SHORT, DataAnalyzer.SPECULATE), longTerm)
+        signals = np.select([price > p["priceLimit"],
+                             (dDay >= threshold) & (dWeek >= threshold) & (dMonth < threshold),
+                             (dWeek >= threshold) & (dMonth >= threshold),
+                             (dDay < threshold) & (dWeek < threshold)],
+                            [int(-p["priceLimit"]), short, longTerm, DataAnalyzer.IGNORE],
+                            DataAnalyzer.SPECULATE).astype(np.float64)
+        signals[~self._valid] = np.nan
+        return pd.Series(signals, index = self._dates, name = self._code).loc[beg : end]
@@ -1,4 +1,6 @@
-__all__ = ["DataAcquisitor", "DataAnalyzer"]
+__all__ = ["DataAcquisitor", "DataAnalyzer", "DownloadManifest", "IndicatorSet", "KLineAlignment", "KLineBars", "KLineValidator", "Network", "NetworkInputDataPreparer", "NetworkTrainingDataPreparer",
+           "PricePanel", "ReturnCorrelation", "Screener", "ShardQueue", "SignalBacktester", "SignalStore", "SignalSweeper"]
 
-from .DataAcquisitor import DataAcquisitor
-from .DataAnalyzer import DataAnalyzer
+# classes are imported on first access, e.g. acquisition workers never load the plotting libraries
+from .._lazy import make_lazy
+make_lazy(__name__)
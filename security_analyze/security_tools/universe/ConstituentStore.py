@@ -0,0 +1,166 @@
+import os
+import numpy as np
+import pandas as pd
+
+
+class ConstituentStore(object):
+    '''
+    Versioned index constituent store with point-in-time lookup
+
+    Membership is stored as intervals [纳入日期, 剔除日期) per index and code. For lookups every index
+    is expanded into a (change dates x codes) boolean membership matrix, so that a point-in-time query
+    is one binary search and set operations between indices/exclusions are bitwise operations.
+    '''
+
+    Columns = ["指数", "股票代码", "股票简称", "纳入日期", "剔除日期"]
+    # exclusion name: predicate over an array of codes, evaluated lazily
+    Exclusions = {"exSTAR": lambda codes: np.char.startswith(codes, "688") | np.char.startswith(codes, "689")}
+    BFRECodes = os.path.join(os.path.dirname(__file__), "../../stock_codes/util/bank_finance_re_codes.csv")
+    __dateFormat = "%Y%m%d"
+
+    def __init__(self, path: str = None):
+        '''
+        param:
+            path: path to the CSV file of the store, an empty store is created if the file does not exist
+        '''
+        self._path = path
+        if path is not None and os.path.exists(path):
+            self._table = pd.read_csv(path, dtype = {"股票代码": str, "纳入日期": str, "剔除日期": str})
+        else:
+            self._table = pd.DataFrame(columns = self.Columns)
+        self._index = None
+
+    def save(self, path: str = None):
+        '''
+        param:
+            path: output path, the input path if None
+        '''
+        path = self._path if path is None else path
+        self._table.sort_values(by = ["指数", "纳入日期", "股票代码"]).to_csv(path, index = False)
+
+    def get_indices(self) -> list[str]:
+        return sorted(self._table["指数"].unique())
+
+    def record_snapshot(self, index: str, date: str, codes, names = None):
+        '''
+        record the full constituent list of an index effective from date
+        param:
+            index: index name, e.g. CSI300
+            date: effective date, e.g. 20250616, must not precede the last recorded change of the index
+            codes: 6-digit codes of all constituents
+            names: names of the constituents, optional
+        '''
+        date  = pd.Timestamp(date).strftime(self.__dateFormat)
+        codes = pd.Index(codes, dtype = str)
+        names = pd.Series([''] * len(codes) if names is None else list(names), index = codes)
+        table = self._table
+        isIndex = (table["指数"] == index).to_numpy()
+        current = isIndex & table["剔除日期"].isna().to_numpy()
+        recorded = pd.concat([table.loc[isIndex, "纳入日期"], table.loc[isIndex, "剔除日期"]]).dropna()
+        if len(recorded) and recorded.max() > date:
+            raise ValueError(f"snapshot of {index} on {date} precedes recorded changes")
+        removed = current & ~table["股票代码"].isin(codes).to_numpy()
+        table.loc[removed, "剔除日期"] = date
+        added = codes.difference(table.loc[current, "股票代码"])
+        new = pd.DataFrame({"指数": index, "股票代码": added, "股票简称": names[added].to_numpy(),
+                            "纳入日期": date, "剔除日期": None})
+        self._table = pd.concat([table, new], ignore_index = True) if len(table) else new
+        self._index = None
+
+    def _build_index(self):
+        table = self._table
+        self._codes = np.unique(np.concatenate([table["股票代码"].to_numpy(dtype = str), self._get_BFRE_codes()]))
+        self._names = pd.Series(table["股票简称"].to_numpy(), index = table["股票代码"].to_numpy(dtype = str))
+        self._names = self._names[~self._names.index.duplicated(keep = "last")]
+        self._index = {}
+        never = np.datetime64("9999-12-31")
+        for index, group in table.groupby("指数"):
+            codeId = np.searchsorted(self._codes, group["股票代码"].to_numpy(dtype = str))
+            beg = pd.to_datetime(group["纳入日期"], format = self.__dateFormat).to_numpy(dtype = "datetime64[D]")
+            end = pd.to_datetime(group["剔除日期"], format = self.__dateFormat).to_numpy(dtype = "datetime64[D]")
+            end = np.where(np.isnat(end), never, end)
+            dates = np.unique(np.concatenate([beg, end[end < never]]))
+            # membership after each change date, by counting entries minus exits up to that date
+            membership = np.zeros((len(dates), len(self._codes)), dtype = np.int16)
+            np.add.at(membership, (np.searchsorted(dates, beg), codeId), 1)
+            exited = end < never
+            np.add.at(membership, (np.searchsorted(dates, end[exited]), codeId[exited]), -1)
+            self._index[index] = (dates, np.cumsum(membership, axis = 0) > 0)
+
+    def _get_BFRE_codes(self) -> np.ndarray:
+        if os.path.exists(self.BFRECodes):
+            return pd.read_csv(self.BFRECodes, dtype = {"股票代码": str})["股票代码"].to_numpy(dtype = str)
+        return np.array([], dtype = str)
+
+    def _get_exclusion(self, name: str) -> np.ndarray:
+        if name == "exBFRE":
+            return np.isin(self._codes, self._get_BFRE_codes())
+        if name in self.Exclusions:
+            return self.Exclusions[name](self._codes)
+        raise ValueError(f"unknown exclusion: {name}")
+
+    def _get_mask(self, index: str, beg: np.datetime64, end: np.datetime64) -> np.ndarray:
+        '''
+        return:
+            mask over all codes of the members of index at any date in [beg, end]
+        '''
+        if index not in self._index:
+            raise KeyError(f"index {index} is not recorded")
+        dates, membership = self._index[index]
+        first = np.searchsorted(dates, beg, side = "right") - 1
+        last  = np.searchsorted(dates, end, side = "right") - 1
+        if last < 0:
+            return np.zeros(len(self._codes), dtype = bool)
+        return membership[max(first, 0) : last + 1].any(axis = 0)
+
+    def get_universe(self, spec: str, date: str, beg: str = None) -> pd.DataFrame:
+        '''
+        point-in-time universe
+        param:
+            spec: indices joined by + (union) or - (difference), followed by exclusions,
+                  e.g. CSIA500_exBFRE, CSI300+CSI500_exBFRE_exSTAR
+            date: as-of date, e.g. 20250616
+            beg: if given, every code that was a member at any date in [beg, date] is included,
+                 which is what a survivorship-free backtest needs
+        return:
+            names of the constituents indexed by 股票代码, sorted by code
+        '''
+        if self._index is None:
+            self._build_index()
+        end = np.datetime64(pd.Timestamp(date).date(), "D")
+        beg = end if beg is None else np.datetime64(pd.Timestamp(beg).date(), "D")
+        tokens = spec.split("_")
+        expression = tokens[0].replace("-", "+-").split("+")
+        mask = np.zeros(len(self._codes), dtype = bool)
+        for term in expression:
+            if term.startswith("-"):
+                mask &= ~self._get_mask(term[1:], beg, end)
+            else:
+                mask |= self._get_mask(term, beg, end)
+        for exclusion in tokens[1:]:
+            mask &= ~self._get_exclusion(exclusion)
+        codes = self._codes[mask]
+        return pd.DataFrame({"股票简称": self._names.reindex(codes).fillna('').to_numpy()},
+                            index = pd.Index(codes, name = "股票代码"))
+
+    def get_changes(self, index: str, beg: str, end: str) -> tuple[pd.Index, pd.Index]:
+        '''
+        return:
+            codes added to and removed from index between beg (exclusive) and end (inclusive)
+        '''
+        before = self.get_universe(index, beg).index
+        after  = self.get_universe(index, end).index
+        return after.difference(before), before.difference(after)
+
+
+if __name__ == "__main__":
+    import sys
+    # usage: python ConstituentStore.py store.csv index date snapshot.csv
+    # record a snapshot table (股票代码, 股票简称) of index effective from date
+    if len(sys.argv) < 5:
+        print("ERROR: require the store, the index name, the effective date and the snapshot table!")
+        sys.exit(1)
+    store = ConstituentStore(sys.argv[1])
+    snapshot = pd.read_csv(sys.argv[4], dtype = {"股票代码": str})
+    store.record_snapshot(sys.argv[2], sys.argv[3], snapshot["股票代码"], snapshot["股票简称"])
+    store.save(sys.argv[1])
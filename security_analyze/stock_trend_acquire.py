@@ -1,38 +1,94 @@
 import pandas as pd
 import time
 from security_tools.stock_trend import DataAcquisitor
+from security_tools.stock_trend import DownloadManifest
+from security_tools.universe import ConstituentStore
 
 
-def acquire_and_save_stock_data(code: str, startDate: str, endDate: str, outDir: str):
+def acquire_and_save_stock_data(code: str, startDate: str, endDate: str, outDir: str, repair: bool = False, unfillable: dict = None) -> tuple[dict, dict]:
 	print(f"正在获取 {code} 从 {startDate} 到 {endDate} 的 k线数据......")
-	# 根据股票代码、开始日期、结束日期获取指定股票代码指定日期区间的k线数据
-	dataAcquisitor = DataAcquisitor(code, startDate, endDate, False, 0, outDir = outDir)
+	# 根据股票代码、开始日期、结束日期获取指定股票代码指定日期区间的k线数据，已有数据只增量更新
+	# repair 时先补齐中间缺失的k线，unfillable 中以前补不到的范围（停牌等）不再请求
+	dataAcquisitor = DataAcquisitor(code, startDate, endDate, 0, outDir = outDir, repair = repair, unfillable = unfillable)
+	report = dataAcquisitor.get_repair_report()
+	if report is not None and report[["requests", "skipped"]].to_numpy().any():
+		print(f"股票代码：{code} 补齐缺失k线：\n{report}")
 	# 保存k线数据到表格里面
 	print(f"股票代码：{code} 的 k线数据已保存到指定目录 {outDir} 下的csv 文件中")
 	dataAcquisitor.save_to_csv()
+	# 各周期最后一根k线，空表为 None
+	lastBars = {}
+	for period, kHistory in zip(DownloadManifest.Periods, [dataAcquisitor.get_day_k(), dataAcquisitor.get_week_k(),
+	                                                       dataAcquisitor.get_month_k(), dataAcquisitor.get_hour_k()]):
+		empty = kHistory.empty or kHistory.index[-1] == pd.Timestamp.min or kHistory.iloc[-1].isna().all()
+		lastBars[period] = None if empty else kHistory.index[-1]
+	return lastBars, dataAcquisitor.get_unfillable()
 
 def acquire_and_save_stock_data_multiprocess(param):
 	try:
-		acquire_and_save_stock_data(*param)
+		lastBars, unfillable = acquire_and_save_stock_data(*param)
 		time.sleep(3)
-		return 0
-	except:
+		return param[0], lastBars, unfillable, None
+	except Exception as e:
 		time.sleep(3)
-		return 1
+		return param[0], None, None, repr(e)
 
-def run_data_acquisitor(nproc: int, codes: list[str], startDate: str, endDate: str, outDir: str):
+def run_data_acquisitor(nproc: int, codes: list[str], startDate: str, endDate: str, outDir: str,
+                        asOfDate: str = None, storePath: str = "stock_codes/constituents.csv", survivorshipFree: bool = False,
+                        manifestPath: str = None, maxAttempts: int = 3, retries: int = 1, repair: bool = False) -> pd.DataFrame:
+    '''
+    codes: list of codes, or a universe specification of ConstituentStore, e.g. "CSIA500_exBFRE"
+    asOfDate: date of the universe, endDate if None
+    survivorshipFree: include every code that was a constituent between startDate and asOfDate
+    manifestPath: path to the DownloadManifest, if given only stale or failed codes are downloaded
+    maxAttempts: codes that failed this many times in a row, over all runs, are no longer retried
+    retries: number of extra rounds over the codes that failed in this run
+    repair: fetch the bars missing in the stored data against the trading calendar before the update,
+            the ranges still missing afterwards are recorded in the manifest and not requested again
+    return:
+        manifest summary of the codes that are still stale, None without manifestPath
+    '''
     import itertools
     from multiprocessing import Pool
     from tqdm.auto import tqdm
 
-    size = len(codes)
+    if isinstance(codes, str):
+        asOfDate = endDate if asOfDate is None else asOfDate
+        codes = ConstituentStore(storePath).get_universe(codes, asOfDate, beg = startDate if survivorshipFree else None).index
+    codes = list(codes)
+    manifest = DownloadManifest(manifestPath) if manifestPath is not None else None
+    pending = codes if manifest is None else manifest.get_pending(codes, endDate, maxAttempts)
+    print(f"待下载 {len(pending)} / {len(codes)} 支股票")
     with Pool(nproc) as pool:
-        result = list(tqdm(pool.imap(acquire_and_save_stock_data_multiprocess,
-                      zip(codes, itertools.repeat(startDate), itertools.repeat(endDate), itertools.repeat(outDir))),
-                      total = size))
+        for attempt in range(retries + 1):
+            if not pending:
+                break
+            failed = []
+            unfillable = [None if manifest is None else manifest.get_unfillable(code) for code in pending]
+            for code, lastBars, unfilled, error in tqdm(pool.imap_unordered(acquire_and_save_stock_data_multiprocess,
+                                                        zip(pending, itertools.repeat(startDate), itertools.repeat(endDate), itertools.repeat(outDir),
+                                                            itertools.repeat(repair), unfillable)),
+                                                        total = len(pending)):
+                if error is not None or lastBars is None or None in lastBars.values():
+                    failed.append(code)
+                if manifest is not None:
+                    manifest.record(code, lastBars, error, unfilled)
+                    manifest.save()
+            pending = failed if manifest is None else manifest.get_pending(failed, endDate, maxAttempts)
         pool.close()
 
+    if manifest is None:
+        return None
+    summary = manifest.get_summary(codes, endDate)
+    if summary.empty:
+        print("全部股票已同步")
+    else:
+        print(f"{len(summary)} 支股票仍未同步：")
+        print(summary)
+    return summary
+
 if __name__ == "__main__":
+    import os
     import sys
     if len(sys.argv) >= 2 and sys.argv[1].isdigit():
         nproc = int(sys.argv[1])
@@ -45,11 +101,20 @@ if __name__ == "__main__":
     endDate   = pd.to_datetime("today").strftime("%Y%m%d")
     # 输出路径
     outDir    = "stock_price_data"
+    # 下载记录，重跑时只下载未完成或失败的股票
+    manifestPath = f"{outDir}/manifest.json"
+
+    # 股票代码，优先使用成分股历史库中截至结束日期的成分股
+    storePath = "stock_codes/constituents.csv"
+    if os.path.exists(storePath):
+        codes = "CSIA500_exBFRE"
+    else:
+        df = pd.read_csv("stock_codes/CSIA500_component_codes_exBFRE.csv", dtype = {0: str})
+        header = df.columns[0]
+        codes = df[header]
 
-    # 股票代码
-    df = pd.read_csv("stock_codes/CSIA500_component_codes_exBFRE.csv", dtype = {0: str})
-    header = df.columns[0]
-    codes = df[header]
+    # 补齐已有数据中缺失的k线，补不到的范围记录在下载记录中，需要时手动开启
+    repair    = False
 
     print("下载中证A500成分股......")
-    run_data_acquisitor(nproc, codes, startDate, endDate, outDir)
+    run_data_acquisitor(nproc, codes, startDate, endDate, outDir, storePath = storePath, manifestPath = manifestPath, repair = repair)
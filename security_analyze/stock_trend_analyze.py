@@ -1,62 +1,180 @@
 import os
 import numpy as np
 import pandas as pd
-import pandas_market_calendars as pm_calendar
 from security_tools.stock_trend import DataAcquisitor
 from security_tools.stock_trend import DataAnalyzer
+from security_tools.stock_trend import Network
+from security_tools.stock_trend import PricePanel
+from security_tools.stock_trend import ReturnCorrelation
+from security_tools.stock_trend import SignalStore
+from security_tools.universe import ConstituentStore
 
-def analyze_stock_data(code: str, startDate: str, endDate: str, inDir: str, priceLimit: np.float64):
-	dataAcquisitor = DataAcquisitor(code, startDate, endDate, 1, inDir = inDir)
+def analyze_stock_data(code: str, startDate: str, endDate: str, inDir: str, priceLimit: np.float64, networkWeights: str = None, tail: int = None):
+	# tail: 每个周期只读取最后 tail 根k线，None 为全部
+	# 信号只用到收盘价，不用网络时只读取收盘价列并压缩存储
+	if networkWeights is None:
+		dataAcquisitor = DataAcquisitor(code, startDate, endDate, 1, inDir = inDir, columns = ["Close"], compact = True, tail = tail)
+	else:
+		dataAcquisitor = DataAcquisitor(code, startDate, endDate, 1, inDir = inDir, tail = tail)
 	dataAnalyzer = DataAnalyzer(dataAcquisitor)
 	signal = dataAnalyzer.get_signal(priceLimit)
 	url   = dataAnalyzer.get_data_acquired().get_quotation_url()
-	return signal, url
+	# only prepare the network input here, the prediction runs in one batch over all stocks
+	networkInput = dataAnalyzer.get_network_input(Network.load(networkWeights)) if networkWeights is not None else None
+	return signal, url, networkInput
 
 def analyze_stock_data_multiprocess(param):
 	return analyze_stock_data(*param)
 
-def run_data_analyzer(nproc: int, codes: list[str], names: list[str], startDate: str, endDate: str, inDir: str, outDir: str, outPrefix: str, priceLimit: np.float64):
+def compute_cluster_labels(codes: list[str], endDate: str, inDir: str, window: int = 60, threshold: float = 0.5) -> pd.Series:
+    '''
+    window: number of days of the return correlation
+    threshold: maximum distance 1 - correlation within a cluster
+    return:
+        cluster label of each code on endDate, -1 for codes without enough data
+    '''
+    # 2 calendar days per trading day leave room for holidays
+    beg = (pd.to_datetime(endDate) - pd.Timedelta(days = 2 * window)).strftime("%Y%m%d")
+    correlation = ReturnCorrelation.from_panel(PricePanel.from_csv(list(codes), beg, endDate, inDir), window = window, minPeriods = 2 * window // 3)
+    dates = correlation.get_dates()[-1:]
+    labels = correlation.get_cluster_labels(correlation.compute(dates), dates, threshold).iloc[-1]
+    return labels.reindex(pd.Index(codes)).fillna(-1).astype(int)
+
+def get_previous_end_dates(startDate: str, endDate: str, outDir: str, outPrefix: str, count: int = 2,
+                           signalStore: SignalStore = None) -> list[str]:
+    '''
+    signalStore: if given, the dates of the previous reports recorded in it, the calendar only if there are fewer than count
+    return:
+        end dates of the previous count periods, each the trading day before the last one,
+        or a later non-trading day for which a report was saved
+    '''
+    endDates = signalStore.get_previous_dates(endDate, count) if signalStore is not None else []
+    if len(endDates) == count:
+        return endDates
+
+    import pandas_market_calendars as pm_calendar
+
+    marketCalendar = pm_calendar.get_calendar('XSHG').schedule(start_date = startDate, end_date = endDate)
+    endDateOld = endDates[-1] if endDates else endDate
+    for i in range(count - len(endDates)):
+        endDateOld = pd.to_datetime(endDateOld) - pd.Timedelta(days = 1)
+        while not endDateOld in marketCalendar.index:
+            if signalStore is None and os.path.exists(f"{outDir}/{outPrefix}_{endDateOld.strftime('%Y%m%d')}.csv"):
+                break
+            endDateOld = endDateOld - pd.Timedelta(days=1)
+        endDateOld = endDateOld.strftime("%Y%m%d")
+        endDates.append(endDateOld)
+    return endDates
+
+def get_previous_signals(signalStore: SignalStore, codes: list[str], endDates: list[str]) -> np.ndarray:
+    '''
+    return:
+        (codes x endDates) signals recorded in the store, NaN where a code has none on a date or signalStore is None
+    '''
+    signals = np.full((len(codes), len(endDates)), np.nan)
+    if signalStore is not None:
+        for i, endDate in enumerate(endDates):
+            signals[:, i] = signalStore.get_signals(endDate)["购买信号"].reindex(pd.Index(codes)).to_numpy(dtype = np.float64)
+    return signals
+
+def run_data_analyzer(nproc: int, codes: list[str], names: list[str], startDate: str, endDate: str, inDir: str, outDir: str, outPrefix: str, priceLimit: np.float64,
+                      asOfDate: str = None, storePath: str = "stock_codes/constituents.csv", networkWeights: str = None,
+                      signalStorePath: str = None, tail: int = None, correlationWindow: int = None, clusterThreshold: float = 0.5):
+    '''
+    codes: list of codes, or a universe specification of ConstituentStore, e.g. "CSIA500_exBFRE",
+           in which case names are taken from the store as well
+    asOfDate: date of the universe, endDate if None
+    networkWeights: path to the weights of a pre-trained Network, adds the predicted price change to the report
+    signalStorePath: path to the SignalStore recording the reports, notes and the T-1/T-2 signals are taken from it
+    tail: number of bars read per period and code, all if None; the moving averages need 60 bars and
+          the last maxima of the smoothed MA5 are only searched in the bars read
+    correlationWindow: if given, the report has the cluster of each code by the return correlation over this many days
+    clusterThreshold: maximum distance 1 - correlation within a cluster
+    '''
     from multiprocessing import Pool
     import itertools
     from tqdm.auto import tqdm
 
+    if isinstance(codes, str):
+        universe = ConstituentStore(storePath).get_universe(codes, endDate if asOfDate is None else asOfDate)
+        codes = universe.index
+        names = universe["股票简称"]
     size = len(codes)
+    signalStore = SignalStore(signalStorePath) if signalStorePath is not None else None
     with Pool(nproc) as pool:
         print("分析T+0期信号")
-        signals, urls = zip(*tqdm(pool.imap(analyze_stock_data_multiprocess,
-        				zip(codes, itertools.repeat(startDate), itertools.repeat(endDate), itertools.repeat(inDir), itertools.repeat(priceLimit))),
+        signals, urls, networkInputs = zip(*tqdm(pool.imap(analyze_stock_data_multiprocess,
+        				zip(codes, itertools.repeat(startDate), itertools.repeat(endDate), itertools.repeat(inDir), itertools.repeat(priceLimit),
+        				    itertools.repeat(networkWeights), itertools.repeat(tail))),
         				total = size))
         signals = np.array([*signals])
-        marketCalendar = pm_calendar.get_calendar('XSHG').schedule(start_date = startDate, end_date = endDate)
-        signalsOld = np.zeros((signals.shape[0], 2), dtype = int)
-        endDateOld = endDate
-        for i in range(signalsOld.shape[1]):
-            endDateOld = pd.to_datetime(endDateOld) - pd.Timedelta(days = 1)
-            while not endDateOld in marketCalendar.index:
-        	    if os.path.exists(f"{outDir}/{outPrefix}_{endDateOld.strftime('%Y%m%d')}.csv"):
-        		    break
-        	    endDateOld = endDateOld - pd.Timedelta(days=1)
-            endDateOld = endDateOld.strftime("%Y%m%d")
-            if i == 0: endDateOld0 = endDateOld
+        endDatesOld = get_previous_end_dates(startDate, endDate, outDir, outPrefix, 2, signalStore)
+        endDateOld0 = endDatesOld[0]
+        # 信号历史库中已有的T-1、T-2期信号直接取用，只分析其余股票
+        signalsOld = get_previous_signals(signalStore, codes, endDatesOld)
+        for i, endDateOld in enumerate(endDatesOld):
+            missing = np.flatnonzero(np.isnan(signalsOld[:, i]))
+            if not len(missing):
+                continue
             print("分析T-" + str(i+1) + "期信号")
-            signalsOld[:,i], _ = zip(*tqdm(pool.imap(analyze_stock_data_multiprocess,
-        	                     zip(codes, itertools.repeat(startDate), itertools.repeat(endDateOld), itertools.repeat(inDir), itertools.repeat(priceLimit))),
-        	                     total = size))
+            signalsOld[missing, i], _, _ = zip(*tqdm(pool.imap(analyze_stock_data_multiprocess,
+        	                     zip(np.asarray(codes)[missing], itertools.repeat(startDate), itertools.repeat(endDateOld), itertools.repeat(inDir), itertools.repeat(priceLimit),
+        	                         itertools.repeat(None), itertools.repeat(tail))),
+        	                     total = len(missing)))
+        signalsOld = signalsOld.astype(int)
 
+    networkPredictions = None
+    if networkWeights is not None:
+        print("网络预测......")
+        networkPredictions = Network.load(networkWeights).predict_many(networkInputs).round(4)
+    clusterLabels = None
+    if correlationWindow is not None:
+        print("相关聚类......")
+        clusterLabels = compute_cluster_labels(codes, endDate, inDir, correlationWindow, clusterThreshold)
+    save_signal_report(codes, names, urls, signals, signalsOld, outDir, outPrefix, endDate, endDateOld0, networkPredictions, signalStore,
+                       clusterLabels)
+    if signalStore is not None:
+        signalStore.close()
+
+def save_signal_report(codes: list[str], names: list[str], urls: list[str], signals: np.ndarray, signalsOld: np.ndarray,
+                       outDir: str, outPrefix: str, endDate: str, endDateOld: str, networkPredictions: np.ndarray = None,
+                       signalStore: SignalStore = None, clusterLabels: pd.Series = None) -> pd.DataFrame:
+    '''
+    signalsOld: (codes x 2) signals of the previous two periods
+    endDateOld: date of the previous report, whose notes are carried over
+    signalStore: if given, the report is recorded in it and the notes are carried over from it, endDateOld is not used
+    clusterLabels: cluster of each code by return correlation, see compute_cluster_labels
+    '''
     print(f"保存购买信号......")
-    df = pd.DataFrame({"股票简称":names.values, "行情地址": urls,
+    df = pd.DataFrame({"股票简称":np.asarray(names), "行情地址": urls,
                        "购买信号": signals, "上期信号": signalsOld[:, 0], "上上期信号": signalsOld[:, 1],
                        "上期备注": ['' for i in range(len(codes))], "备注": ['' for i in range(len(codes))]},
                        index = pd.Index(codes, name = "股票代码"))
+    if networkPredictions is not None:
+        df.insert(3, "网络预测", networkPredictions)
+    if clusterLabels is not None:
+        df.insert(df.columns.get_loc("上上期信号") + 1, "相关聚类", clusterLabels.reindex(df.index).fillna(-1).astype(int))
     df.sort_values(by = ["购买信号","上期信号", "上上期信号", "股票代码"], axis = 0, ascending = False, inplace = True) # by = [col2, col1] means sort col1 first, then col2
+    if signalStore is not None:
+        if not os.path.exists(outDir):
+            os.makedirs(outDir)
+        previous = signalStore.get_previous_date(endDate)
+        # notes edited in the previous export are taken over first
+        if previous is not None and os.path.exists(f"{outDir}/{outPrefix}_{previous}.csv"):
+            signalStore.import_notes(f"{outDir}/{outPrefix}_{previous}.csv", previous)
+        df["上期备注"] = signalStore.get_notes(previous).reindex(df.index).fillna("") if previous is not None else ""
+        signalStore.record(endDate, df)
+        df.to_csv(f"{outDir}/{outPrefix}_{endDate}.csv")
+        return df
     try: 
-        dfOld = pd.read_csv(f"{outDir}/{outPrefix}_{endDateOld0}.csv", dtype = {"股票代码": str, "备注": str})
+        dfOld = pd.read_csv(f"{outDir}/{outPrefix}_{endDateOld}.csv", dtype = {"股票代码": str, "备注": str})
         dfOld.set_index("股票代码", inplace=True)
         df["上期备注"] = dfOld["备注"]
     except:
         print("You must be too lazy to analyze stock price data every business day :(")
     finally:
         df.to_csv(f"{outDir}/{outPrefix}_{endDate}.csv")
+    return df
 
 if __name__ == "__main__":
     import sys
@@ -75,6 +193,12 @@ if __name__ == "__main__":
     signalsDir = "long_short_signals"
     # 价格限制
     priceLimit = 9999.0
+    # 预训练网络权重路径，None 则不使用网络辅助信号
+    networkWeights = None
+    # 每个周期只读取最后的k线数目，None 为全部
+    tail      = 250
+    # 收益率相关聚类的天数，None 则不聚类
+    correlationWindow = 60
 
     '''
     # example candlestick plot
@@ -87,12 +211,21 @@ if __name__ == "__main__":
 
     # 保存路径
     signalsPrefix = "signalsCSIA500"
-    # 股票代码
-    df = pd.read_csv('stock_codes/CSIA500_component_codes_exBFRE.csv', dtype = {0: str})
-    headerCode = df.columns[0]
-    headerName = df.columns[1]
-    codes = df[headerCode]
-    names = df[headerName]
+    # 股票代码，优先使用成分股历史库中截至结束日期的成分股
+    storePath = "stock_codes/constituents.csv"
+    if os.path.exists(storePath):
+        codes = "CSIA500_exBFRE"
+        names = None
+    else:
+        df = pd.read_csv('stock_codes/CSIA500_component_codes_exBFRE.csv', dtype = {0: str})
+        headerCode = df.columns[0]
+        headerName = df.columns[1]
+        codes = df[headerCode]
+        names = df[headerName]
+
+    # 信号历史库
+    signalStorePath = f"{signalsDir}/signals.sqlite"
 
     print(f"正在分析中证A500成分股的k线数据......")
-    run_data_analyzer(nproc, codes, names, startDate, endDate, inDir, signalsDir, signalsPrefix, priceLimit)
+    run_data_analyzer(nproc, codes, names, startDate, endDate, inDir, signalsDir, signalsPrefix, priceLimit, storePath = storePath, networkWeights = networkWeights,
+                      signalStorePath = signalStorePath, tail = tail, correlationWindow = correlationWindow)
@@ -0,0 +1,83 @@
+import os
+import numpy as np
+import pandas as pd
+from security_tools.stock_trend import DataAcquisitor
+from security_tools.stock_trend import DataAnalyzer
+from security_tools.stock_trend import PricePanel
+from security_tools.stock_trend import SignalBacktester
+
+def compute_signal_history(code: str, startDate: str, backtestStartDate: str, endDate: str, inDir: str, priceLimit: np.float64):
+	# 逐日截断数据重新计算信号，按对齐索引的位置截断
+	# 周k线和月k线末尾加上由日k线合成的当期未完成k线，与当日在线获取的数据一致，即与每日运行 stock_trend_analyze 的结果一致
+	dataAcquisitor = DataAcquisitor(code, startDate, endDate, 1, inDir = inDir)
+	dates = dataAcquisitor.get_day_k().loc[backtestStartDate : endDate].index
+	positions = dataAcquisitor.get_day_k().index.get_indexer(dates)
+	signals = [DataAnalyzer(dataAcquisitor.get_as_of(position, partial = True)).get_signal(priceLimit) for position in positions]
+	return code, pd.Series(signals, index = dates, dtype = float)
+
+def compute_signal_history_multiprocess(param):
+	return compute_signal_history(*param)
+
+def run_signal_history(nproc: int, codes: list[str], startDate: str, backtestStartDate: str, endDate: str, inDir: str,
+                       priceLimit: np.float64 = 9999.0) -> pd.DataFrame:
+    '''
+    startDate: start date of the data the signals are computed on
+    backtestStartDate: first date of the signal history
+    return:
+        (dates x codes) signals
+    '''
+    import itertools
+    from multiprocessing import Pool
+    from tqdm.auto import tqdm
+
+    with Pool(nproc) as pool:
+        history = dict(tqdm(pool.imap_unordered(compute_signal_history_multiprocess,
+                       zip(codes, itertools.repeat(startDate), itertools.repeat(backtestStartDate), itertools.repeat(endDate),
+                           itertools.repeat(inDir), itertools.repeat(priceLimit))),
+                       total = len(codes)))
+    return pd.DataFrame(history).reindex(columns = codes)
+
+def run_backtest(signals: pd.DataFrame, startDate: str, endDate: str, inDir: str, outDir: str = None, **kwargs) -> pd.Series:
+    '''
+    signals: (dates x codes) signals, e.g. of run_signal_history or SignalBacktester.read_signal_reports
+    kwargs: options of SignalBacktester
+    return:
+        summary of the backtest, the daily result is saved to outDir if given
+    '''
+    panel = PricePanel.from_csv(list(signals.columns), startDate, endDate, inDir)
+    backtester = SignalBacktester(signals, panel, **kwargs)
+    result = backtester.run()
+    if outDir is not None:
+        if not os.path.exists(outDir):
+            os.makedirs(outDir)
+        result.to_csv(f"{outDir}/backtest_{startDate}_{endDate}.csv")
+    return SignalBacktester.summarize(result)
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) >= 2 and sys.argv[1].isdigit():
+        nproc = int(sys.argv[1])
+    else:
+        nproc = None
+
+    # 数据开始日期
+    startDate = "20130101"
+    # 回测开始日期
+    backtestStartDate = "20190101"
+    # 结束日期
+    endDate   = pd.to_datetime("today").strftime("%Y%m%d")
+    # 输入路径
+    inDir     = "stock_price_data"
+    # 保存路径
+    outDir    = "backtest"
+
+    df = pd.read_csv("stock_codes/CSIA500_component_codes_exBFRE.csv", dtype = {0: str})
+    codes = list(df[df.columns[0]])
+
+    print("计算历史信号......")
+    signals = run_signal_history(nproc, codes, startDate, backtestStartDate, endDate, inDir)
+    if not os.path.exists(outDir):
+        os.makedirs(outDir)
+    signals.to_csv(f"{outDir}/signals_{backtestStartDate}_{endDate}.csv")
+    print("回测......")
+    print(run_backtest(signals, backtestStartDate, endDate, inDir, outDir))
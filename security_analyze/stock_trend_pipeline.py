@@ -0,0 +1,172 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+from security_tools.stock_trend import DataAcquisitor
+from security_tools.stock_trend import DataAnalyzer
+from security_tools.stock_trend import SignalStore
+from security_tools.universe import ConstituentStore
+from stock_trend_analyze import get_previous_end_dates
+from stock_trend_analyze import get_previous_signals
+from stock_trend_analyze import save_signal_report
+
+
+def acquire_stock_data(code: str, startDate: str, endDate: str, dataDir: str):
+	# 根据股票代码、开始日期、结束日期获取指定股票代码指定日期区间的k线数据，数据留在内存中交给分析
+	try:
+		dataAcquisitor = DataAcquisitor(code, startDate, endDate, 0, outDir = dataDir)
+		error = None
+	except Exception as e:
+		dataAcquisitor = None
+		error = repr(e)
+	time.sleep(3)
+	return code, dataAcquisitor, error
+
+def acquire_stock_data_multiprocess(param):
+	return acquire_stock_data(*param)
+
+def analyze_acquired_data(dataAcquisitor: DataAcquisitor, startDate: str, endDates: list[str], priceLimit: np.float64) -> tuple[list[int], str]:
+	'''
+	endDates: end dates of T+0, T-1 and T-2
+	return:
+		signals of T+0, T-1 and T-2, computed on the data in memory, and the quotation URL
+	'''
+	signals = [DataAnalyzer(dataAcquisitor.truncate(startDate, end)).get_signal(priceLimit) for end in endDates]
+	return signals, dataAcquisitor.get_quotation_url()
+
+def run_pipeline(nproc: int, codes: list[str], names: list[str], startDate: str, analysisStartDate: str, endDate: str,
+                 dataDir: str, outDir: str, outPrefix: str, priceLimit: np.float64, queueSize: int = 16,
+                 asOfDate: str = None, storePath: str = "stock_codes/constituents.csv", signalStorePath: str = None):
+	'''
+	acquire and analyze in one run: the K-line data of each code is handed to the analyzer in memory
+	through a bounded queue as soon as it is fetched, while saving to CSV runs in a background thread
+
+	startDate: start date of the acquired data
+	analysisStartDate: start date of the analyzed data
+	queueSize: maximum number of codes being fetched or waiting for analysis, further codes are dispatched as they are analyzed
+	signalStorePath: path to the SignalStore recording the report, notes and the T-1/T-2 signals are taken from it
+	'''
+	import itertools
+	import queue
+	import threading
+	from concurrent.futures import ThreadPoolExecutor
+	from multiprocessing import Pool
+	from tqdm.auto import tqdm
+
+	if isinstance(codes, str):
+		universe = ConstituentStore(storePath).get_universe(codes, endDate if asOfDate is None else asOfDate)
+		codes = universe.index
+		names = universe["股票简称"]
+	names = pd.Series(np.asarray(names), index = pd.Index(codes))
+	if not os.path.exists(outDir):
+		os.makedirs(outDir)
+	# 与 run_data_analyzer 相同的T-1、T-2期结束日期，信号历史库中已有的信号直接取用
+	signalStore = SignalStore(signalStorePath) if signalStorePath is not None else None
+	endDatesOld = get_previous_end_dates(analysisStartDate, endDate, outDir, outPrefix, 2, signalStore)
+	signalsStored = pd.DataFrame(get_previous_signals(signalStore, codes, endDatesOld), index = pd.Index(codes), columns = endDatesOld)
+
+	fetched = queue.Queue()
+	finished = object()
+	# codes dispatched but not yet analyzed, the pool takes the next code only when the analyzer has released one
+	slots = threading.BoundedSemaphore(queueSize)
+	def throttle(params):
+		for param in params:
+			slots.acquire()
+			yield param
+	def produce(pool):
+		try:
+			for result in pool.imap_unordered(acquire_stock_data_multiprocess,
+			                                  throttle(zip(codes, itertools.repeat(startDate), itertools.repeat(endDate), itertools.repeat(dataDir)))):
+				fetched.put(result)
+		finally:
+			fetched.put(finished)
+
+	results = {}
+	failed = []
+	# 分析结果逐行写入临时文件，报告保存后删除
+	streamPath = f"{outDir}/{outPrefix}_{endDate}_stream.csv.tmp"
+	with Pool(nproc) as pool, ThreadPoolExecutor(max_workers = 1) as saver, open(streamPath, "w", encoding = "utf-8-sig") as stream:
+		producer = threading.Thread(target = produce, args = (pool,), daemon = True)
+		producer.start()
+		stream.write("股票代码,股票简称,行情地址,购买信号,上期信号,上上期信号\n")
+		saving = []
+		progress = tqdm(total = len(codes))
+		while True:
+			item = fetched.get()
+			if item is finished:
+				break
+			code, dataAcquisitor, error = item
+			progress.update()
+			if dataAcquisitor is None:
+				failed.append((code, error))
+				slots.release()
+				continue
+			# persistence is off the critical path
+			saving.append(saver.submit(dataAcquisitor.save_to_csv))
+			stored = signalsStored.loc[code]
+			signals, url = analyze_acquired_data(dataAcquisitor, analysisStartDate, [endDate] + stored.index[stored.isna()].tolist(), priceLimit)
+			computed = iter(signals[1:])
+			signals = signals[:1] + [next(computed) if np.isnan(signal) else int(signal) for signal in stored]
+			results[code] = (signals, url)
+			slots.release()
+			stream.write(f"{code},{names[code]},{url},{signals[0]},{signals[1]},{signals[2]}\n")
+			stream.flush()
+			if signals[0] >= DataAnalyzer.RISING_SHORT:
+				progress.write(f"{code} {names[code]}: {signals[0]}")
+		progress.close()
+		producer.join()
+		for future in saving:
+			if future.exception() is not None:
+				failed.append(("save", repr(future.exception())))
+
+	for code, error in failed:
+		print(f"股票代码：{code} 失败：{error}")
+	analyzed = [code for code in codes if code in results]
+	signals = np.array([results[code][0] for code in analyzed], dtype = int).reshape(-1, 3)
+	urls = [results[code][1] for code in analyzed]
+	try:
+		df = save_signal_report(analyzed, names[analyzed], urls, signals[:, 0], signals[:, 1:],
+		                        outDir, outPrefix, endDate, endDatesOld[0], signalStore = signalStore)
+	finally:
+		if signalStore is not None:
+			signalStore.close()
+	os.remove(streamPath)
+	return df
+
+if __name__ == "__main__":
+	import sys
+	if len(sys.argv) >= 2 and sys.argv[1].isdigit():
+		nproc = int(sys.argv[1])
+	else:
+		nproc = None
+
+	# 下载开始日期
+	startDate = "20130101"
+	# 分析开始日期
+	analysisStartDate = "20190101"
+	# 结束日期
+	endDate   = pd.to_datetime("today").strftime("%Y%m%d")
+	# 数据路径
+	dataDir   = "stock_price_data"
+	# 保存路径
+	signalsDir = "long_short_signals"
+	signalsPrefix = "signalsCSIA500"
+	# 价格限制
+	priceLimit = 9999.0
+
+	# 股票代码，优先使用成分股历史库中截至结束日期的成分股
+	storePath = "stock_codes/constituents.csv"
+	if os.path.exists(storePath):
+		codes = "CSIA500_exBFRE"
+		names = None
+	else:
+		df = pd.read_csv("stock_codes/CSIA500_component_codes_exBFRE.csv", dtype = {0: str})
+		codes = df[df.columns[0]]
+		names = df[df.columns[1]]
+
+	# 信号历史库
+	signalStorePath = f"{signalsDir}/signals.sqlite"
+
+	print("下载并分析中证A500成分股......")
+	run_pipeline(nproc, codes, names, startDate, analysisStartDate, endDate, dataDir, signalsDir, signalsPrefix, priceLimit,
+	             storePath = storePath, signalStorePath = signalStorePath)
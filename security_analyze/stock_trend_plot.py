@@ -0,0 +1,56 @@
+import pandas as pd
+from security_tools.stock_trend import DataAcquisitor
+from security_tools.stock_trend import DataAnalyzer
+
+def init_worker():
+	# headless backend, must be selected before pyplot is imported by the renderer
+	import matplotlib
+	matplotlib.use("Agg")
+
+def plot_stock_data(code: str, startDate: str, endDate: str, inDir: str, outDir: str, periods: list[str], downsample: str):
+	from security_tools.stock_trend.ChartRenderer import ChartRenderer
+	dataAcquisitor = DataAcquisitor(code, startDate, endDate, 1, inDir = inDir)
+	dataAnalyzer = DataAnalyzer(dataAcquisitor)
+	return ChartRenderer(outDir, downsample = downsample).render(dataAnalyzer, periods)
+
+def plot_stock_data_multiprocess(param):
+	return plot_stock_data(*param)
+
+def run_chart_renderer(nproc: int, codes: list[str], startDate: str, endDate: str, inDir: str, outDir: str,
+                       periods: list[str] = ["day", "week", "month", "hour"], downsample: str = "tail"):
+    import itertools
+    from multiprocessing import Pool
+    from tqdm.auto import tqdm
+
+    size = len(codes)
+    with Pool(nproc, initializer = init_worker) as pool:
+        paths = list(tqdm(pool.imap_unordered(plot_stock_data_multiprocess,
+                     zip(codes, itertools.repeat(startDate), itertools.repeat(endDate), itertools.repeat(inDir),
+                         itertools.repeat(outDir), itertools.repeat(periods), itertools.repeat(downsample))),
+                     total = size))
+    return [path for p in paths for path in p]
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) >= 2 and sys.argv[1].isdigit():
+        nproc = int(sys.argv[1])
+    else:
+        nproc = None
+
+    # 开始日期
+    startDate = "20130101"
+    # 结束日期
+    endDate   = pd.to_datetime("today").strftime("%Y%m%d")
+    # 输入路径
+    inDir     = "stock_price_data"
+    # 信号路径
+    signalsFile = f"long_short_signals/signalsCSIA500_{endDate}.csv"
+    # 保存路径
+    outDir    = f"charts/{endDate}"
+
+    # 只绘制有买入信号的股票
+    df = pd.read_csv(signalsFile, dtype = {"股票代码": str})
+    codes = df.loc[df["购买信号"] >= DataAnalyzer.RISING_SHORT, "股票代码"]
+
+    print(f"正在绘制{len(codes)}支有买入信号的股票的k线图......")
+    run_chart_renderer(nproc, codes, startDate, endDate, inDir, outDir)
@@ -0,0 +1,290 @@
+import os
+import socket
+import threading
+import time
+import numpy as np
+import pandas as pd
+from security_tools.stock_trend import DownloadManifest
+from security_tools.stock_trend import ShardQueue
+from security_tools.stock_trend import SignalStore
+from security_tools.universe import ConstituentStore
+from stock_trend_acquire import acquire_and_save_stock_data_multiprocess
+from stock_trend_analyze import analyze_stock_data, get_previous_end_dates, get_previous_signals, save_signal_report
+from stock_trend_pipeline import acquire_stock_data, analyze_acquired_data
+
+
+def analyze_stock_data_periods(code: str, startDate: str, endDates: list[str], inDir: str, priceLimit: np.float64, tail: int = None):
+	# 依次分析各结束日期的信号，出错时只记录错误
+	try:
+		signals = []
+		for endDate in endDates:
+			signal, url, _ = analyze_stock_data(code, startDate, endDate, inDir, priceLimit, None, tail)
+			signals.append(signal)
+		return code, signals, url, None
+	except Exception as e:
+		return code, None, None, repr(e)
+
+def analyze_stock_data_periods_multiprocess(param):
+	return analyze_stock_data_periods(*param)
+
+def fetch_and_analyze_stock_data(code: str, startDate: str, analysisStartDate: str, endDates: list[str], dataDir: str, priceLimit: np.float64):
+	# 在线获取截至 T+0 期的k线数据后直接在内存中分析 T+0、T-1、T-2 期，再保存到本机
+	code, dataAcquisitor, error = acquire_stock_data(code, startDate, endDates[0], dataDir)
+	if dataAcquisitor is None:
+		return code, None, None, error
+	try:
+		signals, url = analyze_acquired_data(dataAcquisitor, analysisStartDate, endDates, priceLimit)
+		dataAcquisitor.save_to_csv()
+		return code, signals, url, None
+	except Exception as e:
+		return code, None, None, repr(e)
+
+def fetch_and_analyze_stock_data_multiprocess(param):
+	return fetch_and_analyze_stock_data(*param)
+
+def run_shard(pool, task: dict, codes: list[str]) -> dict:
+	'''
+	return:
+		compact result of the shard:
+		acquire: {"lastBars": {code: last bar of each period}, "unfillable": {code: ranges not filled by repair}, "errors": {code: error}}
+		analyze, pipeline: {"codes": analyzed codes, "signals": (codes x endDates) int8 signals of the end dates of the task,
+		                    "urls": quotation URLs, "errors": {code: error}}
+	'''
+	kind = task["kind"]
+	if kind == "acquire":
+		results = pool.map(acquire_and_save_stock_data_multiprocess,
+		                   [(code, task["startDate"], task["endDate"], task["dataDir"], task["repair"], task["unfillable"].get(code)) for code in codes])
+		return {"lastBars": {code: lastBars for code, lastBars, unfillable, error in results},
+		        "unfillable": {code: unfillable for code, lastBars, unfillable, error in results if unfillable},
+		        "errors": {code: error for code, lastBars, unfillable, error in results if error is not None}}
+	if kind == "analyze":
+		results = pool.map(analyze_stock_data_periods_multiprocess,
+		                   [(code, task["startDate"], task["endDates"], task["dataDir"], task["priceLimit"], task["tail"]) for code in codes])
+	elif kind == "pipeline":
+		results = pool.map(fetch_and_analyze_stock_data_multiprocess,
+		                   [(code, task["startDate"], task["analysisStartDate"], task["endDates"], task["dataDir"], task["priceLimit"]) for code in codes])
+	else:
+		raise ValueError(f"unknown task {kind}")
+	analyzed = [(code, signals, url) for code, signals, url, error in results if error is None]
+	return {"codes": [code for code, _, _ in analyzed],
+	        "signals": np.array([signals for _, signals, _ in analyzed], dtype = np.int8).reshape(-1, len(task["endDates"])),
+	        "urls": [url for _, _, url in analyzed],
+	        "errors": {code: error for code, _, _, error in results if error is not None}}
+
+def run_worker(address: tuple, authkey: bytes, nproc: int = None, poll: float = 5.0, renewSeconds: float = 30.0, name: str = None):
+	'''
+	pull shards from the coordinator until all are done, the shards are processed with a local pool
+
+	address: (host, port) of the coordinator
+	poll: seconds between requests while no shard is pending
+	renewSeconds: interval of the lease renewals, below the leaseSeconds of the coordinator
+	'''
+	from multiprocessing import Pool
+
+	worker = f"{socket.gethostname()}-{os.getpid()}" if name is None else name
+	shardQueue = ShardQueue.connect(address, authkey)
+	with Pool(nproc) as pool:
+		while True:
+			try:
+				if shardQueue.is_finished():
+					break
+				leased = shardQueue.get_shard(worker)
+			except (ConnectionError, EOFError):
+				# 协调端已退出
+				break
+			if leased is None:
+				time.sleep(poll)
+				continue
+			shard, task, codes = leased
+			print(f"{worker} 处理分片 {shard}：{len(codes)} 支股票")
+			# 处理期间后台续租，续租失败说明分片已重新分配
+			stop = threading.Event()
+			def renew():
+				try:
+					while not stop.wait(renewSeconds) and shardQueue.renew(shard, worker):
+						pass
+				except (ConnectionError, EOFError):
+					pass
+			renewer = threading.Thread(target = renew, daemon = True)
+			renewer.start()
+			try:
+				result = run_shard(pool, task, codes)
+				error = None
+			except Exception as e:
+				error = repr(e)
+			finally:
+				stop.set()
+				renewer.join()
+			try:
+				if error is None:
+					shardQueue.put_result(shard, worker, result)
+				else:
+					shardQueue.put_error(shard, worker, error)
+			except (ConnectionError, EOFError):
+				break
+		pool.close()
+
+def run_coordinator(kind: str, codes: list[str], names: list[str], startDate: str, endDate: str, dataDir: str,
+                    outDir: str = None, outPrefix: str = None, priceLimit: np.float64 = 9999.0, analysisStartDate: str = None, tail: int = None,
+                    repair: bool = False, manifestPath: str = None, asOfDate: str = None, storePath: str = "stock_codes/constituents.csv",
+                    signalStorePath: str = None, address: tuple = ("localhost", 50000), authkey: bytes = None,
+                    shardSize: int = 50, leaseSeconds: float = 120.0, maxAttempts: int = 3, localWorkers: int = 0, nproc: int = None):
+	'''
+	split the universe into shards served to the workers and merge their results as the single-host runs do
+
+	kind: "acquire" as run_data_acquisitor, "analyze" as run_data_analyzer on the data in dataDir of each worker,
+	      "pipeline" as run_pipeline, each worker fetching the data itself
+	dataDir: data directory on the workers, shared storage or synchronized for "analyze"
+	analysisStartDate: start date of the analyzed data of "pipeline"
+	manifestPath: DownloadManifest of "acquire", only stale or failed codes are dispatched
+	address: (host, port) served, port 0 for any free port, only this host can connect unless another host is given, e.g. "" for every interface
+	authkey: key shared with the workers, required
+	shardSize: number of codes of a shard
+	leaseSeconds: time after which the shard of a silent worker is dispatched again
+	maxAttempts: number of dispatches of a shard before its codes are reported failed
+	localWorkers: number of workers started on this host, each with a pool of nproc processes
+	return:
+		report of "analyze" and "pipeline", manifest summary of "acquire" with manifestPath
+	'''
+	from multiprocessing import Process
+	from tqdm.auto import tqdm
+
+	if isinstance(codes, str):
+		universe = ConstituentStore(storePath).get_universe(codes, endDate if asOfDate is None else asOfDate)
+		codes = universe.index
+		names = universe["股票简称"]
+	codes = list(codes)
+	manifest = None
+	signalStore = SignalStore(signalStorePath) if signalStorePath is not None and kind != "acquire" else None
+	if kind != "acquire":
+		# T-1、T-2期信号历史库中已有全部股票的信号时不再分发
+		endDatesOld = get_previous_end_dates(startDate if kind == "analyze" else analysisStartDate, endDate, outDir, outPrefix, 2, signalStore)
+		signalsStored = get_previous_signals(signalStore, codes, endDatesOld)
+		endDates = [endDate] + [endDateOld for i, endDateOld in enumerate(endDatesOld) if np.isnan(signalsStored[:, i]).any()]
+	if kind == "acquire":
+		manifest = DownloadManifest(manifestPath) if manifestPath is not None else None
+		pending = codes if manifest is None else manifest.get_pending(codes, endDate)
+		# repair 以前补不到的范围随任务下发
+		unfillable = {} if manifest is None or not repair else {code: manifest.get_unfillable(code) for code in pending if manifest.get_unfillable(code)}
+		task = {"kind": kind, "startDate": startDate, "endDate": endDate, "dataDir": dataDir, "repair": repair, "unfillable": unfillable}
+	elif kind == "analyze":
+		task = {"kind": kind, "startDate": startDate, "endDates": endDates, "dataDir": dataDir, "priceLimit": priceLimit, "tail": tail}
+		pending = codes
+	elif kind == "pipeline":
+		task = {"kind": kind, "startDate": startDate, "analysisStartDate": analysisStartDate, "endDates": endDates,
+		        "dataDir": dataDir, "priceLimit": priceLimit}
+		pending = codes
+	else:
+		raise ValueError(f"unknown task {kind}")
+
+	shardQueue = ShardQueue(pending, task, shardSize, leaseSeconds, maxAttempts)
+	host, port = shardQueue.serve(address, authkey)
+	print(f"分发 {len(pending)} 支股票，监听 {host}:{port}")
+	workers = [Process(target = run_worker, args = (("localhost" if host in ("", "0.0.0.0") else host, port), authkey, nproc, 1.0, leaseSeconds / 4)) for i in range(localWorkers)]
+	for worker in workers:
+		worker.start()
+	progress = tqdm(total = shardQueue.get_progress()[2])
+	while not shardQueue.is_finished():
+		time.sleep(1)
+		done, failed, _ = shardQueue.get_progress()
+		progress.update(done + failed - progress.n)
+	progress.close()
+	for worker in workers:
+		worker.join()
+	shardQueue.stop()
+
+	results = shardQueue.get_results()
+	# 多次分发仍失败的分片中的股票，以及工作端报告失败的股票
+	givenUp = shardQueue.get_failed()
+	failed = dict(givenUp)
+	for result in results:
+		failed.update(result["errors"])
+	for code, error in failed.items():
+		print(f"股票代码：{code} 失败：{error}")
+
+	if kind == "acquire":
+		if manifest is None:
+			return None
+		for result in results:
+			for code, lastBars in result["lastBars"].items():
+				manifest.record(code, lastBars, result["errors"].get(code), result["unfillable"].get(code))
+		for code, error in givenUp.items():
+			manifest.record(code, None, error)
+		manifest.save()
+		return manifest.get_summary(codes, endDate)
+
+	# 按原股票顺序合并各分片结果
+	if not os.path.exists(outDir):
+		os.makedirs(outDir)
+	names = pd.Series(np.asarray(names), index = pd.Index(codes))
+	merged = {code: (signals, url) for result in results for code, signals, url in zip(result["codes"], result["signals"], result["urls"])}
+	analyzed = [code for code in codes if code in merged]
+	# 分析结果按结束日期放入 T+0、T-1、T-2 列，其余取自信号历史库
+	signals = np.column_stack([np.full(len(codes), np.nan), signalsStored])[pd.Index(codes).get_indexer(analyzed)]
+	for column, date in enumerate([endDate] + endDatesOld):
+		if date in endDates:
+			computed = np.array([merged[code][0][endDates.index(date)] for code in analyzed])
+			signals[:, column] = np.where(np.isnan(signals[:, column]), computed, signals[:, column])
+	signals = signals.astype(int)
+	urls = [merged[code][1] for code in analyzed]
+	try:
+		return save_signal_report(analyzed, names[analyzed], urls, signals[:, 0], signals[:, 1:], outDir, outPrefix, endDate, endDatesOld[0],
+		                          signalStore = signalStore)
+	finally:
+		if signalStore is not None:
+			signalStore.close()
+
+if __name__ == "__main__":
+	import sys
+	# 用法：
+	#   协调端  python stock_trend_shard.py coordinator analyze|pipeline|acquire [本机工作进程数] [监听地址]
+	#   工作端  python stock_trend_shard.py worker 协调端地址:端口 [进程数]
+	# 监听地址默认为 localhost，其他主机上的工作端需要协调端监听其网卡地址
+	role = sys.argv[1] if len(sys.argv) >= 2 else "coordinator"
+	# 协调端与工作端共享的密钥，必须设置
+	if not os.environ.get("SHARD_AUTHKEY"):
+		sys.exit("请设置环境变量 SHARD_AUTHKEY 为协调端与工作端共享的密钥")
+	authkey = os.environ["SHARD_AUTHKEY"].encode()
+	port = 50000
+
+	if role == "worker":
+		host, port = sys.argv[2].rsplit(":", 1) if len(sys.argv) >= 3 else ("localhost", port)
+		nproc = int(sys.argv[3]) if len(sys.argv) >= 4 else None
+		run_worker((host, int(port)), authkey, nproc)
+		sys.exit(0)
+
+	kind = sys.argv[2] if len(sys.argv) >= 3 else "analyze"
+	localWorkers = int(sys.argv[3]) if len(sys.argv) >= 4 else 0
+	host = sys.argv[4] if len(sys.argv) >= 5 else "localhost"
+
+	# 下载开始日期
+	startDate = "20130101"
+	# 分析开始日期
+	analysisStartDate = "20190101"
+	# 结束日期
+	endDate   = pd.to_datetime("today").strftime("%Y%m%d")
+	# 数据路径（各工作端）
+	dataDir   = "stock_price_data"
+	# 保存路径
+	signalsDir = "long_short_signals"
+	signalsPrefix = "signalsCSIA500"
+	# 价格限制
+	priceLimit = 9999.0
+	# 每个周期只读取最后的k线数目，None 为全部
+	tail      = 250
+
+	# 股票代码，优先使用成分股历史库中截至结束日期的成分股
+	storePath = "stock_codes/constituents.csv"
+	if os.path.exists(storePath):
+		codes = "CSIA500_exBFRE"
+		names = None
+	else:
+		df = pd.read_csv("stock_codes/CSIA500_component_codes_exBFRE.csv", dtype = {0: str})
+		codes = df[df.columns[0]]
+		names = df[df.columns[1]]
+
+	print(f"分片{'下载' if kind == 'acquire' else '分析'}中证A500成分股......")
+	run_coordinator(kind, codes, names, analysisStartDate if kind == "analyze" else startDate, endDate, dataDir, signalsDir, signalsPrefix, priceLimit,
+	                analysisStartDate = analysisStartDate, tail = tail, repair = False, manifestPath = f"{dataDir}/manifest.json",
+	                storePath = storePath, signalStorePath = f"{signalsDir}/signals.sqlite", address = (host, port), authkey = authkey,
+	                localWorkers = localWorkers)
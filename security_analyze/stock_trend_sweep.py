@@ -0,0 +1,87 @@
+import os
+import pandas as pd
+from security_tools.stock_trend import DataAcquisitor
+from security_tools.stock_trend import PricePanel
+from security_tools.stock_trend import SignalBacktester
+from security_tools.stock_trend import SignalSweeper
+
+# 每个进程只加载一次全部股票的数据
+_sweepers = None
+_panel    = None
+
+def init_worker(codes: list[str], startDate: str, backtestStartDate: str, endDate: str, inDir: str):
+	global _sweepers, _panel
+	# 周、月末尾为当日未完成的k线，与回测及每日运行的信号一致
+	_sweepers = [SignalSweeper(DataAcquisitor(code, startDate, endDate, 1, inDir = inDir, columns = ["Close"], compact = True), partial = True) for code in codes]
+	_panel = PricePanel.from_csv(codes, backtestStartDate, endDate, inDir)
+
+def evaluate_parameters(parameters: dict, backtestStartDate: str, endDate: str, backtestOptions: dict):
+	signals = pd.DataFrame({sweeper.get_code(): sweeper.compute_signals(parameters, backtestStartDate, endDate) for sweeper in _sweepers})
+	result = SignalBacktester(signals, _panel, **backtestOptions).run()
+	return {**parameters, **SignalBacktester.summarize(result)}
+
+def evaluate_parameters_multiprocess(param):
+	return evaluate_parameters(*param)
+
+def expand_grid(grid: dict) -> list[dict]:
+	'''
+	grid: {parameter: list of values}, e.g. {"short": [5, 10], "mid": [20, 30]}
+	return:
+		list of the combinations of the values
+	'''
+	import itertools
+	return [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+
+def run_parameter_sweep(nproc: int, codes: list[str], grid: dict, startDate: str, backtestStartDate: str, endDate: str,
+                        inDir: str, outDir: str = None, backtestOptions: dict = {}) -> pd.DataFrame:
+    '''
+    evaluate the hard-coded signal over a grid of parameters of SignalSweeper, the grid points are distributed
+    over the processes, each of which loads the closing prices of the universe once
+    startDate: start date of the data the signals are computed on
+    backtestStartDate: first date of the backtest
+    backtestOptions: options of SignalBacktester
+    return:
+        one row per grid point: parameters and summary of the backtest, by descending Sharpe ratio
+    '''
+    import itertools
+    from multiprocessing import Pool
+    from tqdm.auto import tqdm
+
+    points = expand_grid(grid)
+    with Pool(nproc, initializer = init_worker, initargs = (codes, startDate, backtestStartDate, endDate, inDir)) as pool:
+        rows = list(tqdm(pool.imap_unordered(evaluate_parameters_multiprocess,
+                    zip(points, itertools.repeat(backtestStartDate), itertools.repeat(endDate), itertools.repeat(backtestOptions))),
+                    total = len(points)))
+    table = pd.DataFrame(rows).sort_values(by = "夏普比率", ascending = False, ignore_index = True)
+    if outDir is not None:
+        if not os.path.exists(outDir):
+            os.makedirs(outDir)
+        table.to_csv(f"{outDir}/sweep_{backtestStartDate}_{endDate}.csv", index = False)
+    return table
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) >= 2 and sys.argv[1].isdigit():
+        nproc = int(sys.argv[1])
+    else:
+        nproc = None
+
+    # 数据开始日期
+    startDate = "20130101"
+    # 回测开始日期
+    backtestStartDate = "20190101"
+    # 结束日期
+    endDate   = pd.to_datetime("today").strftime("%Y%m%d")
+    # 输入路径
+    inDir     = "stock_price_data"
+    # 保存路径
+    outDir    = "backtest"
+    # 参数网格
+    grid = {"short": [5, 10], "mid": [20, 30], "long": [60, 120],
+            "dayStencil": [1, 2, 3], "hourStencil": [1, 2, 4], "threshold": [0.0, 0.01]}
+
+    df = pd.read_csv("stock_codes/CSIA500_component_codes_exBFRE.csv", dtype = {0: str})
+    codes = list(df[df.columns[0]])
+
+    print(f"扫描{len(expand_grid(grid))}组参数......")
+    print(run_parameter_sweep(nproc, codes, grid, startDate, backtestStartDate, endDate, inDir, outDir))
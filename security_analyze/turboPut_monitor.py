@@ -0,0 +1,29 @@
+from security_tools.option import TurboPutOption, TurboPutBook
+
+
+def monitor_turbo_puts(options: list, kurse: dict, sigma: dict, horizont: float):
+	# 按标的最新价格重估全部涡轮认沽证
+	book = TurboPutBook.from_options(options)
+	book.aktualisieren(kurse)
+	print(book.info())
+	# 跌幅预警及接近障碍价的涡轮
+	print(book.warnen_vorm_rueckgang())
+	print(book.nahe_barrier(5.))
+	# 期限内敲出概率：解析解及蒙特卡洛模拟
+	print(book.knockout_wahrscheinlichkeit(sigma, horizont))
+	print(book.knockout_wahrscheinlichkeit_simuliert(sigma, horizont, seed = 0))
+	return book
+
+if __name__ == "__main__":
+	# 持有的涡轮认沽证：标的、障碍价、标的价格、兑换比率
+	options = [TurboPutOption("NVDA", 130.0, 120.0),
+	           TurboPutOption("NVDA", 140.0, 120.0),
+	           TurboPutOption("TSLA", 260.0, 240.0, 100)]
+	# 标的最新价格
+	kurse   = {"NVDA": 125.0}
+	# 标的年化波动率
+	sigma   = {"NVDA": 0.5, "TSLA": 0.6}
+	# 期限（年）
+	horizont = 20 / 252
+
+	monitor_turbo_puts(options, kurse, sigma, horizont)